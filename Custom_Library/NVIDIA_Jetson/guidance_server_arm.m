@@ -189,9 +189,11 @@ classdef guidance_server_arm < matlab.System ...
                 
                 % Add the INCLUDE files for the PhaseSpace camera
                 addIncludeFiles(buildInfo,'TCP_Server_arm.h',includeDir);
+                addIncludeFiles(buildInfo,'guidance_frame.h',includeDir);
                 
                 % Add the SOURCE files for the PhaseSpace camera
                 addSourceFiles(buildInfo,'TCP_Server_arm.cpp',srcDir);
+                addSourceFiles(buildInfo,'guidance_frame.cpp',srcDir);
                 
                 %addLinkFlags(buildInfo,{'-lSource'});
                 %addLinkObjects(buildInfo,'sourcelib.a',srcDir);
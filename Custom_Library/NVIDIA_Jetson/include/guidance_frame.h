@@ -0,0 +1,28 @@
+#include <stddef.h>
+#include <stdint.h>
+
+// Binary guidance frames, matching guidance_frames.py on the Jetson.
+// Layout (little-endian):
+//   magic "SPOT" (4 bytes), version (uint8), message type (uint8), number of values (uint16),
+//   sequence number (uint32), timestamp (float64), values (float64 x number of values), CRC-32 (uint32)
+#define GUIDANCE_FRAME_VERSION 1
+#define GUIDANCE_INPUT_MESSAGE 1
+#define GUIDANCE_OUTPUT_MESSAGE 2
+#define GUIDANCE_FRAME_HEADER_SIZE 20
+#define GUIDANCE_FRAME_MAX_VALUES 32
+#define GUIDANCE_FRAME_SIZE(number_of_values) (GUIDANCE_FRAME_HEADER_SIZE + 8*(number_of_values) + 4)
+
+struct GuidanceFrame
+{
+    uint8_t message_type;
+    uint16_t number_of_values;
+    uint32_t sequence_number;
+    double timestamp;
+    double values[GUIDANCE_FRAME_MAX_VALUES];
+};
+
+uint32_t guidance_frame_crc32(const uint8_t* data, size_t length);
+size_t encode_guidance_frame(uint8_t message_type, uint32_t sequence_number, double timestamp,
+                             const double* values, uint16_t number_of_values,
+                             uint8_t* buffer, size_t buffer_length);
+int decode_guidance_frame(const uint8_t* buffer, size_t length, GuidanceFrame* frame);
@@ -1,5 +1,6 @@
 #define PORT 12345
 #define BUFFERLEN 4096
+#define BINARY_FRAMES 0 // 1: exchange binary frames (guidance_frame.h) with the Jetson instead of text. USE_BINARY_FRAMES must match in use_deep_guidance_arm.py
 
 #include <fcntl.h>
 #include <netdb.h>
@@ -14,6 +15,7 @@
 #include <strings.h>
 #include <arpa/inet.h>
 #include <sstream>
+#include "guidance_frame.h"
 
 
 //your variables that your code uses goes here
@@ -21,6 +23,7 @@ int server_socket_fd(-1), client_socket_fd(-1), port_number(PORT), num_chars(0),
 char buffer[4096];
 char message[BUFFERLEN];
 double guidance_data[3];
+uint32_t sequence_number(0), last_applied_sequence_number(0);
 socklen_t client_len;
 struct sockaddr_in server_address, client_address;
 struct timeval tv = {0, 5000};
@@ -71,6 +74,60 @@ void run_guidance(const double input_1, const double input_2,
                                   &client_len);
         setsockopt(client_socket_fd, SOL_SOCKET, SO_RCVTIMEO, (const char*)&tv, sizeof tv);
     }
+#if BINARY_FRAMES
+    else {
+       const double inputs[19] = {input_1, input_2, input_3, input_4, input_5, input_6, input_7,
+                                  input_8, input_9, input_10, input_11, input_12, input_13,
+                                  input_14, input_15, input_16, input_17, input_18, input_19};
+       uint8_t frameOut[GUIDANCE_FRAME_SIZE(19)];
+       size_t frameOutLength = encode_guidance_frame(GUIDANCE_INPUT_MESSAGE, ++sequence_number, input_1, inputs, 19, frameOut, sizeof(frameOut));
+
+       check = write(client_socket_fd, frameOut, frameOutLength);
+       if (check <= 0)
+       {
+           close(client_socket_fd);
+           client_socket_fd = -1;
+           return;
+       }
+
+       // The buffer can hold several frames, e.g., a late answer to an earlier message followed by the answer to this one.
+       // The newest valid guidance frame is applied. Frames no newer than the last one applied are ignored.
+       // If no new valid guidance frame arrives in time, the outputs are not written, so the last command applied is held
+       int received = recv(client_socket_fd, &message, BUFFERLEN, 0);
+       GuidanceFrame frameIn, newestFrameIn;
+       bool newFrameIn = false;
+       int position = 0;
+       while (received > 0 && position < received)
+       {
+           int frameLength = decode_guidance_frame((const uint8_t*)message + position, received - position, &frameIn);
+           if (frameLength == 0)
+               break; // the rest of the buffer is an incomplete frame
+           if (frameLength < 0)
+           {
+               position++; // not a valid frame, so look for one starting at the next byte
+               continue;
+           }
+           position += frameLength;
+           if (frameIn.message_type == GUIDANCE_OUTPUT_MESSAGE && frameIn.number_of_values == 7 &&
+               frameIn.sequence_number > last_applied_sequence_number && frameIn.sequence_number <= sequence_number)
+           {
+               newestFrameIn = frameIn;
+               newFrameIn = true;
+               last_applied_sequence_number = frameIn.sequence_number;
+           }
+       }
+       if (newFrameIn)
+       {
+           *output_1 = newestFrameIn.values[0];
+           *output_2 = newestFrameIn.values[1];
+           *output_3 = newestFrameIn.values[2];
+           *output_4 = newestFrameIn.values[3];
+           *output_5 = newestFrameIn.values[4];
+           *output_6 = newestFrameIn.values[5];
+           *output_7 = newestFrameIn.values[6];
+       }
+    }
+#else
     else {
        std::string stringMessageOut = "";
        
@@ -129,6 +186,7 @@ void run_guidance(const double input_1, const double input_2,
        //*output_2 = guidance_data[1];
        //*output_3 = guidance_data[2];
     }
+#endif
 }
 
 void terminate()
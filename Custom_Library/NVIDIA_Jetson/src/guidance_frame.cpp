@@ -0,0 +1,110 @@
+#include <string.h>
+#include "guidance_frame.h"
+
+// Reference encoder/decoder for the binary guidance frames (guidance_frames.py).
+// Multi-byte fields are written byte-by-byte so that the frames are little-endian
+// regardless of the machine. Doubles are assumed to be IEEE 754, as on the Pi and Jetson.
+
+static void put_uint16(uint8_t* buffer, uint16_t value)
+{
+    buffer[0] = value & 0xFF;
+    buffer[1] = (value >> 8) & 0xFF;
+}
+
+static void put_uint32(uint8_t* buffer, uint32_t value)
+{
+    for (int i = 0; i < 4; i++)
+        buffer[i] = (value >> (8*i)) & 0xFF;
+}
+
+static void put_double(uint8_t* buffer, double value)
+{
+    uint64_t bits;
+    memcpy(&bits, &value, sizeof(bits));
+    for (int i = 0; i < 8; i++)
+        buffer[i] = (bits >> (8*i)) & 0xFF;
+}
+
+static uint16_t get_uint16(const uint8_t* buffer)
+{
+    return (uint16_t)(buffer[0] | (buffer[1] << 8));
+}
+
+static uint32_t get_uint32(const uint8_t* buffer)
+{
+    uint32_t value = 0;
+    for (int i = 0; i < 4; i++)
+        value |= (uint32_t)buffer[i] << (8*i);
+    return value;
+}
+
+static double get_double(const uint8_t* buffer)
+{
+    uint64_t bits = 0;
+    for (int i = 0; i < 8; i++)
+        bits |= (uint64_t)buffer[i] << (8*i);
+    double value;
+    memcpy(&value, &bits, sizeof(value));
+    return value;
+}
+
+// CRC-32 (IEEE 802.3), the same as Python's zlib.crc32
+uint32_t guidance_frame_crc32(const uint8_t* data, size_t length)
+{
+    uint32_t crc = 0xFFFFFFFF;
+    for (size_t i = 0; i < length; i++)
+    {
+        crc ^= data[i];
+        for (int bit = 0; bit < 8; bit++)
+            crc = (crc >> 1) ^ (0xEDB88320 & (0 - (crc & 1)));
+    }
+    return ~crc;
+}
+
+// Writes a frame into buffer. Returns its size, or 0 if it doesn't fit.
+size_t encode_guidance_frame(uint8_t message_type, uint32_t sequence_number, double timestamp,
+                             const double* values, uint16_t number_of_values,
+                             uint8_t* buffer, size_t buffer_length)
+{
+    size_t frame_size = GUIDANCE_FRAME_SIZE(number_of_values);
+    if (frame_size > buffer_length)
+        return 0;
+
+    memcpy(buffer, "SPOT", 4);
+    buffer[4] = GUIDANCE_FRAME_VERSION;
+    buffer[5] = message_type;
+    put_uint16(buffer + 6, number_of_values);
+    put_uint32(buffer + 8, sequence_number);
+    put_double(buffer + 12, timestamp);
+    for (int i = 0; i < number_of_values; i++)
+        put_double(buffer + GUIDANCE_FRAME_HEADER_SIZE + 8*i, values[i]);
+    put_uint32(buffer + frame_size - 4, guidance_frame_crc32(buffer, frame_size - 4));
+    return frame_size;
+}
+
+// Reads the frame at the start of buffer into frame.
+// Returns its size, 0 if buffer doesn't hold all of it yet, or -1 if it is not a valid frame.
+int decode_guidance_frame(const uint8_t* buffer, size_t length, GuidanceFrame* frame)
+{
+    if (length < GUIDANCE_FRAME_HEADER_SIZE)
+        return 0;
+    if (memcmp(buffer, "SPOT", 4) != 0 || buffer[4] != GUIDANCE_FRAME_VERSION)
+        return -1;
+
+    uint16_t number_of_values = get_uint16(buffer + 6);
+    if (number_of_values > GUIDANCE_FRAME_MAX_VALUES)
+        return -1;
+    size_t frame_size = GUIDANCE_FRAME_SIZE(number_of_values);
+    if (length < frame_size)
+        return 0;
+    if (get_uint32(buffer + frame_size - 4) != guidance_frame_crc32(buffer, frame_size - 4))
+        return -1;
+
+    frame->message_type = buffer[5];
+    frame->number_of_values = number_of_values;
+    frame->sequence_number = get_uint32(buffer + 8);
+    frame->timestamp = get_double(buffer + 12);
+    for (int i = 0; i < number_of_values; i++)
+        frame->values[i] = get_double(buffer + GUIDANCE_FRAME_HEADER_SIZE + 8*i);
+    return (int)frame_size;
+}
@@ -25,11 +25,12 @@ import code # for debugging
 
 from settings import Settings
 from build_neural_networks import BuildActorNetwork
+from telemetry import ActorTelemetry
 environment_file = __import__('environment_' + Settings.ENVIRONMENT) # importing the environment
 
 class Agent:
 
-    def __init__(self, sess, n_agent, agent_to_env, env_to_agent, replay_buffer, writer, filename, learner_policy_parameters, agent_to_learner, learner_to_agent):
+    def __init__(self, sess, n_agent, agent_to_env, env_to_agent, replay_buffer, writer, filename, learner_policy_parameters, agent_to_evaluator, evaluator_to_agent, renderer = None):
 
         print("Initializing agent " + str(n_agent) + "...")
 
@@ -41,8 +42,9 @@ class Agent:
         self.learner_policy_parameters = learner_policy_parameters
         self.agent_to_env = agent_to_env
         self.env_to_agent = env_to_agent
-        self.agent_to_learner = agent_to_learner
-        self.learner_to_agent = learner_to_agent
+        self.agent_to_evaluator = agent_to_evaluator
+        self.evaluator_to_agent = evaluator_to_agent
+        self.renderer = renderer # renders videos in the background (episode_renderer.py), or None to render them here
         
         # Build this Agent's actor network
         self.build_actor()
@@ -54,6 +56,12 @@ class Agent:
         self.create_summary_functions()
         self.writer = writer
 
+        # Measures where this agent's time goes
+        self.telemetry = ActorTelemetry(self.n_agent)
+
+        # The most recently logged episode, for the resume manifest. Set once the agent starts running.
+        self.last_episode_number = None
+
         # If we want to record video, launch one hidden display
         if Settings.RECORD_VIDEO and self.n_agent == 1:
             self.display = Display(visible = False, size = (1400,900))
@@ -147,6 +155,10 @@ class Agent:
         # run that has crashed, the starting episode number will not be 1.
         episode_number = starting_episode_number[self.n_agent - 1]
 
+        # The most recently logged episode, which is recorded in the resume manifest.
+        # Resuming starts from it again, just like when the tensorboard file is scanned.
+        self.last_episode_number = episode_number
+
         # Resetting the noise scale
         noise_scale = 0.
 
@@ -165,6 +177,9 @@ class Agent:
 
             # Clearing the N-step memory for this episode
             self.n_step_memory.clear()
+
+            # Start timing this episode
+            self.telemetry.start_episode()
             
             # Reset the action_log, if applicable
             if Settings.AUGMENT_STATE_WITH_ACTION_LENGTH > 0:
@@ -175,6 +190,11 @@ class Agent:
             # Only agent_1 is used for test time
             test_time = (self.n_agent == 1) and (episode_number % Settings.CHECK_GREEDY_PERFORMANCE_EVERY_NUM_EPISODES == 0 or episode_number == 1)
 
+            # When the greedy policy is evaluated on the initial condition suite (suite_evaluator.py),
+            # agent 1 only runs the greedy episodes that are rendered and otherwise collects data like the others
+            if Settings.SUITE_EVALUATION and Settings.ENVIRONMENT == 'manipulator' and not (Settings.RECORD_VIDEO and (episode_number % (Settings.CHECK_GREEDY_PERFORMANCE_EVERY_NUM_EPISODES*Settings.VIDEO_RECORD_FREQUENCY) == 0 or episode_number == 1)):
+                test_time = False
+
             # Resetting the environment for this episode by sending a True
             self.agent_to_env.put((True, test_time)) # Reset into a dynamics environment
             total_state = self.env_to_agent.get()
@@ -228,7 +248,9 @@ class Agent:
                 ##############################
                 ##### Running the Policy #####
                 ##############################
+                inference_start_time = time.perf_counter()
                 action = self.sess.run(self.policy.action_scaled, feed_dict = {self.state_placeholder: np.expand_dims(observation,0)})[0] # Expanding the observation to be a 1x3 instead of a 3
+                self.telemetry.inference_time += time.perf_counter() - inference_start_time
 
                 # Calculating random action to be added to the noise chosen from the policy to force exploration.
                 if Settings.UNIFORM_OR_GAUSSIAN_NOISE:
@@ -252,7 +274,9 @@ class Agent:
                 self.agent_to_env.put((action,))
 
                 # Receive results from stepped environment
+                environment_wait_start_time = time.perf_counter()
                 next_total_state, reward, done = self.env_to_agent.get() # The * means the variable will be unpacked only if it exists
+                self.telemetry.environment_wait_time += time.perf_counter() - environment_wait_start_time
 
                 # Add reward we just received to running total for this episode
                 episode_reward += reward
@@ -293,7 +317,9 @@ class Agent:
                     # If the prioritized replay buffer is currently dumping data,
                     # wait until that is done before adding more data to the buffer                    
                     if not test_time:
+                        replay_buffer_wait_start_time = time.perf_counter()
                         replay_buffer_dump_flag.wait() # blocks until replay_buffer_dump_flag is True
+                        self.telemetry.replay_buffer_wait_time += time.perf_counter() - replay_buffer_wait_start_time
                         self.replay_buffer.add((observation_0, action_0, n_step_reward, next_observation, done, discount_factor))
 
                     # If this episode is being rendered, log the state for rendering later
@@ -327,7 +353,9 @@ class Agent:
 
                         # dump data into large replay buffer
                         if not test_time:
+                            replay_buffer_wait_start_time = time.perf_counter()
                             replay_buffer_dump_flag.wait()
+                            self.telemetry.replay_buffer_wait_time += time.perf_counter() - replay_buffer_wait_start_time
                             self.replay_buffer.add((observation_0, action_0, n_step_reward, next_observation, done, discount_factor))
 
                         # If this episode is being rendered, log the state for rendering later
@@ -372,18 +400,22 @@ class Agent:
                 os.makedirs(os.path.dirname(Settings.MODEL_SAVE_DIRECTORY + self.filename + '/trajectories/'), exist_ok=True)
                 np.savetxt(Settings.MODEL_SAVE_DIRECTORY + self.filename + '/trajectories/' + str(episode_number) + '.txt',np.asarray(raw_total_state_log))
 
-                # Ask the learner to tell us the value distributions of the state-action pairs encountered in this episode
-                self.agent_to_learner.put((np.asarray(observation_log), np.asarray(action_log), np.asarray(next_observation_log), np.asarray(instantaneous_reward_log), np.asarray(done_log), np.asarray(discount_factor_log)))
+                # Ask the evaluator to tell us the value distributions of the state-action pairs encountered in this episode
+                self.agent_to_evaluator.put((np.asarray(observation_log), np.asarray(action_log), np.asarray(next_observation_log), np.asarray(instantaneous_reward_log), np.asarray(done_log), np.asarray(discount_factor_log)))
 
                 # Wait for the results
                 try:
-                    critic_distributions, target_critic_distributions, projected_target_distribution, loss_log = self.learner_to_agent.get(timeout = 3)
+                    critic_distributions, target_critic_distributions, projected_target_distribution, loss_log = self.evaluator_to_agent.get(timeout = 3)
 
                     bins = np.linspace(Settings.MIN_V, Settings.MAX_V, Settings.NUMBER_OF_BINS)
 
                     # Render the episode
                     time_log = np.linspace(0, (len(raw_total_state_log)-1)*Settings.TIMESTEP, len(raw_total_state_log))
-                    environment_file.render(np.asarray(raw_total_state_log), np.asarray(action_log), np.asarray(instantaneous_reward_log), np.asarray(cumulative_reward_log), critic_distributions, target_critic_distributions, projected_target_distribution, bins, np.asarray(loss_log), episode_number, self.filename, Settings.MODEL_SAVE_DIRECTORY, time_log)
+                    if self.renderer is not None:
+                        # Queued for the renderer, so this agent carries on right away
+                        self.renderer.render(np.asarray(raw_total_state_log), np.asarray(action_log), np.asarray(instantaneous_reward_log), np.asarray(cumulative_reward_log), critic_distributions, target_critic_distributions, projected_target_distribution, bins, np.asarray(loss_log), episode_number, self.filename, Settings.MODEL_SAVE_DIRECTORY, time_log)
+                    else:
+                        environment_file.render(np.asarray(raw_total_state_log), np.asarray(action_log), np.asarray(instantaneous_reward_log), np.asarray(cumulative_reward_log), critic_distributions, target_critic_distributions, projected_target_distribution, bins, np.asarray(loss_log), episode_number, self.filename, Settings.MODEL_SAVE_DIRECTORY, time_log)
 
                 except queue.Empty:
                     print("Skipping this animation!")
@@ -402,11 +434,15 @@ class Agent:
             ######## Log training data to tensorboard #########
             ###################################################
             # Logging the number of timesteps, the episode reward, and the final angular momentum (if captured).
-            # Ask the environment if we docked, what the target initial angular rate was, and the final combined angular momentum (assuming we docked)
+            # Ask the environment if we docked, what the target initial angular rate was, and the final combined angular momentum (assuming we docked).
+            # It also tells us how long it spent stepping and idling this episode.
             self.agent_to_env.put((False,))
             #code.interact(local=dict(globals(), **locals())) # Ctrl+D or Ctrl+Z to continue execution
-            docked, target_angular_velocity, combined_properties = self.env_to_agent.get()
+            docked, target_angular_velocity, combined_properties, environment_timing = self.env_to_agent.get()
             combined_total_angular_momentum, combined_angular_velocity = combined_properties
+
+            # Record where the time went this episode
+            self.telemetry.record_episode(timestep_number, environment_timing)
             
             # If we docked, additionally log the combined angular momentum
             if docked:
@@ -428,6 +464,12 @@ class Agent:
             if Settings.ENVIRONMENT != 'fixedICs':
                 self.writer.add_summary(summary, episode_number)
 
+                # Periodically log the throughput telemetry too
+                if episode_number % Settings.LOG_ACTOR_TELEMETRY_EVERY_NUM_EPISODES == 0:
+                    self.writer.add_summary(self.telemetry.summary(), episode_number)
+
+            self.last_episode_number = episode_number
+
             # Increment the episode counter
             episode_number += 1
 
@@ -20,6 +20,8 @@ except:
 assert Settings.ENVIRONMENT == 'manipulator'
 
 environment_file = __import__('environment_' + Settings.ENVIRONMENT) # importing the environment
+from experiment_scoring import score_experiment
+from experiment_logger import load_experiment_log
 
 def make_C_bI(angle):        
     C_bI = np.array([[ np.cos(angle), np.sin(angle)],
@@ -36,7 +38,7 @@ display.start()
 ### Load in the experimental data ###
 #####################################
 log_filename = glob.glob('*46-55.txt')[0]
-data = np.load(log_filename)
+data = load_experiment_log(log_filename) # memory-mapped, not copied
 print("Data file %s is loaded" %log_filename)
 os.makedirs(log_filename.split('.')[0], exist_ok=True)
 
@@ -79,61 +81,12 @@ print("Saved arm angular acceleration commands figure")
 environment = environment_file.Environment()
 environment.reset(False)
 
-# Process the data. Need to make the raw total state log
-# [relative_x, relative_y, relative_vx, relative_vy, 
-#relative_angle, relative_angular_velocity, chaser_x, chaser_y, chaser_theta, 
-#target_x, target_y, target_theta, chaser_vx, chaser_vy, chaser_omega, 
-#target_vx, target_vy, target_omega] *# Relative pose expressed in the chaser's body frame; everythign else in Inertial frame #*
-
+# Score every row of the log at once (experiment_scoring.py), as the environment would have
 print("Rendering animation...", end='')
-raw_total_state_log = []
-cumulative_reward_log = []
-action_log = []
-cumulative_rewards = 0
-SPOTNet_previous_relative_x = 0.0
-are_we_done = False
-timestep_where_docking_occurred = -1
-for i in range(len(data)):
-    Pi_time, deep_guidance_Ax, deep_guidance_Ay, deep_guidance_alpha_base, \
-                                 deep_guidance_alpha_shoulder, deep_guidance_alpha_elbow, deep_guidance_alpha_wrist, \
-                                 Pi_red_x, Pi_red_y, Pi_red_theta, \
-                                 Pi_red_Vx, Pi_red_Vy, Pi_red_omega,        \
-                                 Pi_black_x, Pi_black_y, Pi_black_theta,    \
-                                 Pi_black_Vx, Pi_black_Vy, Pi_black_omega,  \
-                                 shoulder_theta, elbow_theta, wrist_theta, \
-                                 shoulder_omega, elbow_omega, wrist_omega, docked = data[i,:]
-
-    # Raw total state log
-    # [self.chaser_position, self.chaser_velocity, self.arm_angles, self.arm_angular_rates, self.target_position, self.target_velocity, self.end_effector_position, self.end_effector_velocity, self.relative_position_body, self.relative_angle, self.end_effector_position_body, self.end_effector_velocity_body]     
-    raw_total_state_log.append([Pi_red_x, Pi_red_y, Pi_red_theta, Pi_red_Vx, Pi_red_Vy, Pi_red_omega, shoulder_theta, elbow_theta, wrist_theta, shoulder_omega, elbow_omega, wrist_omega, Pi_black_x, Pi_black_y, Pi_black_theta, Pi_black_Vx, Pi_black_Vy, Pi_black_omega, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0])
-       
-    # Check the reward function based off this state
-    environment.chaser_position   = np.array([Pi_red_x, Pi_red_y, Pi_red_theta])
-    environment.chaser_velocity   = np.array([Pi_red_Vx, Pi_red_Vy, Pi_red_omega])
-    environment.target_position   = np.array([Pi_black_x, Pi_black_y, Pi_black_theta])
-    environment.target_velocity   = np.array([Pi_black_Vx, Pi_black_Vy, Pi_black_omega])
-    environment.arm_angles        = np.array([shoulder_theta, elbow_theta, wrist_theta])
-    environment.arm_angular_rates = np.array([shoulder_omega, elbow_omega, wrist_omega])
-    
-    # Get environment to check for collisions
-    environment.update_end_effector_and_docking_locations()
-    environment.update_end_effector_location_body_frame()
-    environment.update_relative_pose_body_frame()
-    environment.check_collisions()
-    rewards_this_timestep = environment.reward_function(0)
-
-    # Only add rewards if we aren't done
-    if not are_we_done:
-        cumulative_rewards += rewards_this_timestep
-        if environment.is_done(): # If we are done, this was the last reward that we added
-            are_we_done = True
-            timestep_where_docking_occurred = i
-    cumulative_reward_log.append(cumulative_rewards)
-    
-    action_log.append([deep_guidance_Ax, deep_guidance_Ay, deep_guidance_alpha_base, deep_guidance_alpha_shoulder, deep_guidance_alpha_elbow, deep_guidance_alpha_wrist])
+scores = score_experiment(environment, data)
 
 # Render the episode
-environment_file.render(np.asarray(raw_total_state_log), np.asarray(action_log), 0, np.asarray(cumulative_reward_log), 0, 0, 0, 0, 0, 1, log_filename.split('.')[0], '', time_log, timestep_where_docking_occurred)
+environment_file.render(scores['total_states'], scores['actions'], 0, scores['cumulative_rewards'], 0, 0, 0, 0, 0, 1, log_filename.split('.')[0], '', time_log, scores['done_index'])
 print("Done!")
 # Close the display
 del environment
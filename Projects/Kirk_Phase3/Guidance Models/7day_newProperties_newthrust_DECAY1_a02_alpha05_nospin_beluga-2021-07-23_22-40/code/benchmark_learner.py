@@ -0,0 +1,96 @@
+"""
+This script measures how many training iterations per second the Learner can
+perform on this machine, with and without XLA compilation (Settings.XLA_JIT_LEARNER),
+at a few mini-batch sizes.
+
+The Learner is run exactly as it is in main.py, except that the replay buffer
+hands out random data and nothing is saved or logged.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+import time
+import threading
+import numpy as np
+import tensorflow as tf
+
+from learner import Learner
+from settings import Settings
+
+BATCH_SIZES        = [256, 1024, 4096]
+XLA_OPTIONS        = [False, True]
+WARMUP_DURATION    = 10 # [s] allows XLA to finish compiling before timing begins
+BENCHMARK_DURATION = 30 # [s]
+
+
+class RandomReplayBuffer:
+    # Stands in for the ReplayBuffer by returning random mini-batches of the correct shape
+    def __init__(self):
+        self.batch_size = Settings.MINI_BATCH_SIZE
+
+    def how_filled(self):
+        return Settings.REPLAY_BUFFER_SIZE
+
+    def sample(self):
+        states_batch      = np.random.uniform(low = -1, high = 1, size = [self.batch_size, Settings.OBSERVATION_SIZE])
+        actions_batch     = np.random.uniform(low = Settings.LOWER_ACTION_BOUND, high = Settings.UPPER_ACTION_BOUND, size = [self.batch_size, Settings.ACTION_SIZE])
+        rewards_batch     = np.random.uniform(low = Settings.MIN_V, high = Settings.MAX_V, size = self.batch_size)/10
+        next_states_batch = np.random.uniform(low = -1, high = 1, size = [self.batch_size, Settings.OBSERVATION_SIZE])
+        dones_batch       = np.random.uniform(size = self.batch_size) < 0.01
+        gammas_batch      = np.tile(Settings.DISCOUNT_FACTOR**Settings.N_STEP_RETURN, [self.batch_size, 1])
+        return states_batch, actions_batch, rewards_batch, next_states_batch, dones_batch, gammas_batch
+
+    def save(self):
+        pass
+
+
+class NoSaver:
+    # Stands in for the Saver so that nothing is written to disk
+    def save(self, *args):
+        pass
+
+
+class NoWriter:
+    # Stands in for the tf.summary.FileWriter so that nothing is written to disk
+    def add_summary(self, *args):
+        pass
+
+
+def benchmark(batch_size, use_xla, config = None, warmup_duration = WARMUP_DURATION, benchmark_duration = BENCHMARK_DURATION):
+    # Returns the training iterations per second of a freshly-built Learner
+    # (config is an optional tf.ConfigProto, e.g., to try different thread pools)
+    Settings.MINI_BATCH_SIZE = batch_size
+    Settings.XLA_JIT_LEARNER = use_xla
+    Settings.SAVE_CHECKPOINT_EVERY_NUM_ITERATIONS = np.inf
+
+    tf.reset_default_graph()
+    with tf.Session(config = config) as sess:
+        learner = Learner(sess, NoSaver(), RandomReplayBuffer(), NoWriter())
+        sess.run(tf.global_variables_initializer())
+
+        stop_run_flag = threading.Event()
+        replay_buffer_dump_flag = threading.Event()
+        replay_buffer_dump_flag.set()
+        learner_thread = threading.Thread(target = learner.run, args = (stop_run_flag, replay_buffer_dump_flag, 1))
+        learner_thread.start()
+
+        time.sleep(warmup_duration)
+        starting_iteration = learner.total_training_iterations
+        start_time = time.time()
+        time.sleep(benchmark_duration)
+        iterations_per_second = (learner.total_training_iterations - starting_iteration)/(time.time() - start_time)
+
+        stop_run_flag.set()
+        learner_thread.join()
+
+    return iterations_per_second
+
+
+if __name__ == '__main__':
+    results = {}
+    for batch_size in BATCH_SIZES:
+        for use_xla in XLA_OPTIONS:
+            results[(batch_size, use_xla)] = benchmark(batch_size, use_xla)
+
+    print("\n Batch size | Without XLA [it/s] | With XLA [it/s] | Speedup")
+    for batch_size in BATCH_SIZES:
+        print(" %10i | %18.1f | %15.1f | %6.2fx" %(batch_size, results[(batch_size, False)], results[(batch_size, True)], results[(batch_size, True)]/results[(batch_size, False)]))
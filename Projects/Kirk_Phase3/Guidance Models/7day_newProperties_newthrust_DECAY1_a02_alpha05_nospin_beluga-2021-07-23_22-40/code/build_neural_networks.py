@@ -92,6 +92,15 @@ class BuildActorNetwork:
                 actor_training_function = self.optimizer.apply_gradients(zip(self.actor_gradients_scaled, self.parameters))
                  
                 return actor_training_function
+    
+    def generate_gradient_application_function(self):
+        # Develop the operation that applies externally-calculated gradients to the actor.
+        # Used to apply the gradients averaged across all learner processes (Settings.NUMBER_OF_LEARNERS > 1)
+        with tf.variable_scope(self.scope):
+            with tf.variable_scope('Training'):
+                self.gradient_placeholders = [tf.placeholder(dtype = tf.float32, shape = parameter.shape) for parameter in self.parameters]
+                
+                return self.optimizer.apply_gradients(zip(self.gradient_placeholders, self.parameters))
                   
             
 class BuildQNetwork:
@@ -194,7 +203,11 @@ class BuildQNetwork:
                 self.optimizer = tf.train.AdamOptimizer(Settings.CRITIC_LEARNING_RATE)               
                 
                 # Project the target distribution onto the bounds of the original network
-                projected_target_distribution = l2_project(target_bins, target_q_distribution, self.bins)  
+                if Settings.CATEGORICAL_PROJECTION:
+                    # Linear in the number of bins, but requires evenly-spaced bins
+                    projected_target_distribution = categorical_project(target_bins, target_q_distribution, self.bins)
+                else:
+                    projected_target_distribution = l2_project(target_bins, target_q_distribution, self.bins)  
                 
                 # Calculate the cross entropy loss between the projected distribution and the main q_network!
                 self.loss = tf.nn.softmax_cross_entropy_with_logits_v2(logits = self.q_distribution_logits, labels = tf.stop_gradient(projected_target_distribution))
@@ -219,11 +232,23 @@ class BuildQNetwork:
                     
                 # Add up the final loss function
                 self.total_loss = self.mean_loss + self.l2_reg_loss
+                
+                # The gradients themselves, for when they are averaged across learner processes before being applied
+                self.gradients = tf.gradients(self.total_loss, self.parameters)
                  
                 # Set the optimizer to minimize the total loss, and do so by modifying the critic parameter.
                 critic_training_function = self.optimizer.minimize(self.total_loss, var_list=self.parameters)
                   
                 return critic_training_function, projected_target_distribution
+    
+    def generate_gradient_application_function(self):
+        # Develop the operation that applies externally-calculated gradients to the critic.
+        # Used to apply the gradients averaged across all learner processes (Settings.NUMBER_OF_LEARNERS > 1)
+        with tf.variable_scope(self.scope):
+            with tf.variable_scope('Training'):
+                self.gradient_placeholders = [tf.placeholder(dtype = tf.float32, shape = parameter.shape) for parameter in self.parameters]
+                
+                return self.optimizer.apply_gradients(zip(self.gradient_placeholders, self.parameters))
 
 
 # Projection function used by the critic training function
@@ -277,4 +302,58 @@ def l2_project(z_p, p, z_q):
     # Shape  B x Kq x Kp.
     delta_hat = (d_sign * delta_qp * d_pos) - ((1. - d_sign) * delta_qp * d_neg)
     p = p[:, None, :]  # B x 1 x Kp.
-    return tf.reduce_sum(tf.clip_by_value(1. - delta_hat, 0., 1.) * p, 2)
\ No newline at end of file
+    return tf.reduce_sum(tf.clip_by_value(1. - delta_hat, 0., 1.) * p, 2)
+
+
+# Alternate projection function used by the critic training function
+'''
+## categorical_projection ##
+# The floor/ceil formulation from the C51 paper (http://arxiv.org/abs/1707.06887)
+# Produces the same result as l2_project when the bins are evenly spaced (as ours
+# always are) but never builds the [batch_size, Kq, Kp] intermediate tensors.
+'''
+
+def categorical_project(z_p, p, z_q):
+    """Projects distribution (z_p, p) onto the evenly-spaced support z_q.
+    Each probability p[i] is split between the two bins of z_q that surround
+    z_p[i], in proportion to how close z_p[i] is to each of them. The splits
+    are then accumulated with a scatter-add.
+    Args:
+      z_p: Tensor holding support of distribution p, shape `[batch_size, Kp]`.
+      p: Tensor holding probability values p(z_p[i]), shape `[batch_size, Kp]`.
+      z_q: Tensor holding evenly-spaced support to project onto, shape `[Kq]`.
+    Returns:
+      Projection of (z_p, p) onto support z_q, shape `[batch_size, Kq]`.
+    """
+    # Extract vmin, vmax and the bin spacing from z_q
+    vmin, vmax = z_q[0], z_q[-1]
+    number_of_bins = tf.shape(z_q)[0]
+    batch_size = tf.shape(p)[0]
+    delta_z = (vmax - vmin)/tf.cast(number_of_bins - 1, p.dtype)
+
+    # Clip z_p to be in new support range (vmin, vmax) and find its
+    # fractional bin number. Clipping again guards against round-off at vmax.
+    z_p = tf.clip_by_value(z_p, vmin, vmax) # B x Kp
+    new_bin = tf.clip_by_value((z_p - vmin)/delta_z, 0., tf.cast(number_of_bins - 1, p.dtype)) # B x Kp
+
+    # The adjacent bins on either side of the projection
+    adjacent_bin_lower = tf.floor(new_bin) # B x Kp
+    adjacent_bin_upper = tf.ceil(new_bin)  # B x Kp
+
+    # Distributing the probability between the two adjacent bins. If the
+    # projection lies directly on a bin, the lower and upper bins are
+    # identical and the full probability goes into that bin.
+    are_bins_identical = tf.cast(tf.equal(adjacent_bin_lower, adjacent_bin_upper), p.dtype) # B x Kp
+    lower_probabilities = p * (adjacent_bin_upper - new_bin + are_bins_identical) # B x Kp
+    upper_probabilities = p * (new_bin - adjacent_bin_lower)                      # B x Kp
+
+    # Offsetting the bin indices of each sample so the whole batch can be
+    # accumulated in one flat scatter-add of length batch_size*Kq
+    offsets = tf.expand_dims(tf.range(batch_size) * number_of_bins, axis = 1) # B x 1
+    lower_indices = tf.reshape(tf.cast(adjacent_bin_lower, tf.int32) + offsets, [-1]) # B*Kp
+    upper_indices = tf.reshape(tf.cast(adjacent_bin_upper, tf.int32) + offsets, [-1]) # B*Kp
+
+    projected_distribution = tf.unsorted_segment_sum(tf.reshape(lower_probabilities, [-1]), lower_indices, batch_size * number_of_bins) + \
+                             tf.unsorted_segment_sum(tf.reshape(upper_probabilities, [-1]), upper_indices, batch_size * number_of_bins) # B*Kq
+
+    return tf.reshape(projected_distribution, [batch_size, number_of_bins]) # B x Kq
@@ -0,0 +1,207 @@
+"""
+This script briefly benchmarks the current machine and recommends how to lay out
+a run on it, so that settings.py doesn't need to be tuned by hand each time we
+move between clusters.
+
+It measures:
+    1) Environment steps per second with 1, 2, 4, ... environment workers
+       (environment_worker.py) stepping random actions at the same time.
+    2) The latency of running the policy on one state, as each agent does every timestep.
+    3) Learner training iterations per second (benchmark_learner.py) with the
+       Tensorflow thread pools that are left over once the environments have their cores.
+
+From these it recommends:
+    NUMBER_OF_ACTORS    -> the fewest actors that get within ACTOR_THROUGHPUT_TOLERANCE
+                           of the best total environment throughput (each actor has
+                           its own environment worker), leaving at least one core
+                           for the learner
+    TF_INTRA_OP_THREADS -> the remaining cores
+    TF_INTER_OP_THREADS -> whichever of INTER_OP_OPTIONS trains fastest
+    LEARNER_CPUS        -> the remaining cores
+    ENVIRONMENT_CPUS    -> one core per environment worker
+
+The measurements and recommendations are written to calibration.json. If
+WRITE_SETTINGS is True, the recommendations are also written into settings.py.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+import os
+import json
+import time
+import threading
+import numpy as np
+import tensorflow as tf
+
+from build_neural_networks import BuildActorNetwork
+from environment_worker import EnvironmentWorker
+from benchmark_learner import benchmark
+from settings_overrides import write_settings
+from settings import Settings
+
+WRITE_SETTINGS             = False # True -> write the recommendations into settings.py
+ENVIRONMENT_WARMUP         = 3 # [s] before counting environment steps
+ENVIRONMENT_DURATION       = 10 # [s] of counting environment steps, for each number of workers
+INFERENCE_REPETITIONS      = 2000 # timed policy evaluations
+LEARNER_WARMUP             = 5 # [s] before counting training iterations
+LEARNER_DURATION           = 15 # [s] of counting training iterations, for each thread pool option
+INTER_OP_OPTIONS           = [0, 1, 2] # TF_INTER_OP_THREADS values tried (0 lets Tensorflow choose)
+ACTOR_THROUGHPUT_TOLERANCE = 0.9 # fraction of the best estimated actor throughput that is good enough
+
+
+def make_config(intra_op_threads, inter_op_threads):
+    # A Tensorflow configuration with the given thread pools
+    config = tf.ConfigProto()
+    config.intra_op_parallelism_threads = intra_op_threads
+    config.inter_op_parallelism_threads = inter_op_threads
+    return config
+
+
+def benchmark_environments(number_of_workers):
+    # Returns the total environment steps per second with this many workers stepping at once.
+    # Each worker is driven by its own thread, just like the agents drive theirs.
+    workers = [EnvironmentWorker(Settings.ENVIRONMENT, n + 1) for n in range(number_of_workers)]
+    queues = [worker.generate_queue()[0] for worker in workers]
+    for worker in workers:
+        worker.start()
+
+    # Wait until every environment has been built and reset
+    for each_queue in queues:
+        each_queue.put((True, False))
+        each_queue.get()
+
+    steps = [0]*number_of_workers
+    stop_flag = threading.Event()
+
+    def step_environment(n):
+        # Step random actions until told to stop, resetting whenever an episode ends
+        while not stop_flag.is_set():
+            queues[n].put((np.random.uniform(low = Settings.LOWER_ACTION_BOUND, high = Settings.UPPER_ACTION_BOUND),))
+            _, _, done = queues[n].get()
+            steps[n] += 1
+            if done:
+                queues[n].put((True, False))
+                queues[n].get()
+
+    threads = [threading.Thread(target = step_environment, args = (n,)) for n in range(number_of_workers)]
+    for each_thread in threads:
+        each_thread.start()
+
+    time.sleep(ENVIRONMENT_WARMUP)
+    starting_steps = sum(steps)
+    start_time = time.time()
+    time.sleep(ENVIRONMENT_DURATION)
+    steps_per_second = (sum(steps) - starting_steps)/(time.time() - start_time)
+
+    stop_flag.set()
+    for each_thread in threads:
+        each_thread.join()
+
+    # Closing the connections ends the workers
+    for worker in workers:
+        worker.agent_connection.close()
+        worker.process.wait()
+
+    return steps_per_second
+
+
+def benchmark_inference(config):
+    # Returns the median time [s] to run the policy on a single state
+    tf.reset_default_graph()
+    state_placeholder = tf.placeholder(dtype = tf.float32, shape = [None, Settings.OBSERVATION_SIZE], name = "state_placeholder")
+    policy = BuildActorNetwork(state_placeholder, scope = 'calibration_actor')
+
+    with tf.Session(config = config) as sess:
+        sess.run(tf.global_variables_initializer())
+        state = np.random.uniform(low = -1, high = 1, size = [1, Settings.OBSERVATION_SIZE])
+
+        # Warm up, then time each evaluation
+        for _ in range(100):
+            sess.run(policy.action_scaled, feed_dict = {state_placeholder: state})
+        timings = np.zeros(INFERENCE_REPETITIONS)
+        for i in range(INFERENCE_REPETITIONS):
+            start_time = time.perf_counter()
+            sess.run(policy.action_scaled, feed_dict = {state_placeholder: state})
+            timings[i] = time.perf_counter() - start_time
+
+    return np.median(timings)
+
+
+#%%
+##############################
+##### Running the checks #####
+##############################
+cpus = sorted(os.sched_getaffinity(0))
+number_of_cpus = len(cpus)
+print("Calibrating on %i CPU cores" %number_of_cpus)
+
+# 1) Environment throughput with 1, 2, 4, ... workers
+worker_options = sorted(set([2**n for n in range(int(np.log2(number_of_cpus)) + 1)] + [number_of_cpus]))
+environment_steps_per_second = {}
+for number_of_workers in worker_options:
+    environment_steps_per_second[number_of_workers] = benchmark_environments(number_of_workers)
+    print("%3i environment workers: %8.1f steps/s" %(number_of_workers, environment_steps_per_second[number_of_workers]))
+
+# 2) Policy latency, both with Tensorflow's default thread pools and single-threaded
+inference_latency = benchmark_inference(make_config(0, 0))
+single_threaded_inference_latency = benchmark_inference(make_config(1, 1))
+print("Policy latency: %.3f ms (single-threaded: %.3f ms)" %(inference_latency*1000, single_threaded_inference_latency*1000))
+
+# Each actor alternates between running the policy and waiting for its environment to step,
+# so n actors complete n/(time per environment step + policy latency) steps per second
+actor_steps_per_second = {n: n/(n/environment_steps_per_second[n] + inference_latency) for n in worker_options}
+
+# The fewest actors within tolerance of the best, leaving a core for the learner when possible
+actor_options = [n for n in worker_options if n < number_of_cpus] or [1]
+best_actor_steps_per_second = max(actor_steps_per_second[n] for n in actor_options)
+number_of_actors = min(n for n in actor_options if actor_steps_per_second[n] >= ACTOR_THROUGHPUT_TOLERANCE*best_actor_steps_per_second)
+learner_threads = max(1, number_of_cpus - number_of_actors)
+
+# 3) Learner throughput with the cores that are left over
+learner_iterations_per_second = {}
+for inter_op_threads in INTER_OP_OPTIONS:
+    learner_iterations_per_second[inter_op_threads] = benchmark(Settings.MINI_BATCH_SIZE, Settings.XLA_JIT_LEARNER, make_config(learner_threads, inter_op_threads), LEARNER_WARMUP, LEARNER_DURATION)
+    print("Learner with %i intra-op and %i inter-op threads: %.1f iterations/s" %(learner_threads, inter_op_threads, learner_iterations_per_second[inter_op_threads]))
+inter_op_threads = max(INTER_OP_OPTIONS, key = lambda option: learner_iterations_per_second[option])
+
+# Give the learner (and the agents, which run in main.py) the first cores and each environment worker its own core
+if number_of_cpus > number_of_actors:
+    learner_cpus     = cpus[:learner_threads]
+    environment_cpus = cpus[learner_threads:learner_threads + number_of_actors]
+else:
+    # Not enough cores to separate them
+    learner_cpus     = None
+    environment_cpus = None
+
+recommendations = {'NUMBER_OF_ACTORS':    number_of_actors,
+                   'TF_INTRA_OP_THREADS': learner_threads,
+                   'TF_INTER_OP_THREADS': inter_op_threads,
+                   'LEARNER_CPUS':        learner_cpus,
+                   'ENVIRONMENT_CPUS':    environment_cpus}
+
+
+#%%
+#################################
+##### Reporting the results #####
+#################################
+print("\n Actors | Environment steps/s | Estimated actor steps/s")
+for n in worker_options:
+    print(" %6i | %19.1f | %23.1f%s" %(n, environment_steps_per_second[n], actor_steps_per_second[n], ' <-' if n == number_of_actors else ''))
+
+print("\nRecommended settings for this machine (expect about %.0f environment steps/s and %.1f training iterations/s):" %(actor_steps_per_second[number_of_actors], learner_iterations_per_second[inter_op_threads]))
+for name, value in recommendations.items():
+    print("    %-19s = %r" %(name, value))
+
+with open('calibration.json', 'w') as calibration_file:
+    json.dump({'time':                                 time.strftime('%Y-%m-%d %H:%M:%S'),
+               'cpus':                                 cpus,
+               'environment_steps_per_second':         environment_steps_per_second,
+               'actor_steps_per_second':               actor_steps_per_second,
+               'inference_latency_ms':                 inference_latency*1000,
+               'single_threaded_inference_latency_ms': single_threaded_inference_latency*1000,
+               'learner_iterations_per_second':        learner_iterations_per_second,
+               'recommendations':                      recommendations}, calibration_file, indent = 4, default = float)
+print("Results saved to calibration.json")
+
+if WRITE_SETTINGS:
+    write_settings('settings.py', recommendations)
+    print("Recommendations written to settings.py")
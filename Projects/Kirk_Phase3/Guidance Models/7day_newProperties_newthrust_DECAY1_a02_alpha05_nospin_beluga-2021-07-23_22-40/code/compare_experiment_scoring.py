@@ -0,0 +1,108 @@
+"""
+This script checks that experiment_scoring.py (used by analyze_experiment.py) scores
+an experiment log the same as the Environment, and times the two.
+
+The Environment is run over every row of every experiment log under
+SAVED_DATA_DIRECTORY the way analyze_experiment.py used to: the row is copied into
+the Environment, the collisions are checked, reward_function(0) gives the row's
+reward, and the rewards stop accumulating at the first row where is_done() is True.
+score_experiment() must give the same:
+    - reward at every row, and cumulative reward
+    - row where is_done() is first True, and row where it first docked
+    - collision flags at every row
+    - docking and mid-way circle flags at every row. The Environment only raises its
+      mid_way flag until the mid-way reward is given, so the mid-way circle is only
+      compared up to that row, and the row the mid-way reward is given is compared too.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+import glob
+import time
+import numpy as np
+
+from environment_manipulator import Environment
+from experiment_logger import load_experiment_log
+from experiment_scoring import score_experiment, CHASER_POSITION, CHASER_VELOCITY, TARGET_POSITION, TARGET_VELOCITY, ARM_ANGLES, ARM_RATES
+
+SAVED_DATA_DIRECTORY = '../../../Saved Data/' # searched for deep_guidance_data_*.txt, including sub-folders
+TOLERANCE            = 1e-9
+COLLISION_FLAGS      = ['end_effector_collision', 'forbidden_area_collision', 'chaser_target_collision', 'elbow_target_collision', 'chaser_on_table', 'docked']
+
+def environment_scoring(data):
+    # Scores the log one row at a time with the Environment, as analyze_experiment.py used to
+    environment = Environment()
+    environment.reset(False)
+
+    rewards = np.zeros(len(data))
+    cumulative_rewards = np.zeros(len(data))
+    flags = {name: np.zeros(len(data), dtype = bool) for name in COLLISION_FLAGS + ['mid_way']}
+    cumulative_reward = 0
+    done_index = -1
+    for i in range(len(data)):
+        environment.chaser_position   = np.array(data[i, CHASER_POSITION])
+        environment.chaser_velocity   = np.array(data[i, CHASER_VELOCITY])
+        environment.target_position   = np.array(data[i, TARGET_POSITION])
+        environment.target_velocity   = np.array(data[i, TARGET_VELOCITY])
+        environment.arm_angles        = np.array(data[i, ARM_ANGLES])
+        environment.arm_angular_rates = np.array(data[i, ARM_RATES])
+
+        environment.update_end_effector_and_docking_locations()
+        environment.update_end_effector_location_body_frame()
+        environment.update_relative_pose_body_frame()
+        environment.check_collisions()
+        for name in flags:
+            flags[name][i] = getattr(environment, name)
+        rewards[i] = environment.reward_function(0)
+
+        # Only add rewards if we aren't done
+        if done_index < 0:
+            cumulative_reward += rewards[i]
+            if environment.is_done():
+                done_index = i
+        cumulative_rewards[i] = cumulative_reward
+
+    return {'rewards':            rewards,
+            'cumulative_rewards': cumulative_rewards,
+            'done_index':         done_index,
+            'docking_index':      int(np.argmax(flags['docked'])) if np.any(flags['docked']) else -1,
+            'collisions':         flags}
+
+def compare(name, data):
+    # Scores the log both ways and prints the differences and the time each took
+    start_time = time.perf_counter()
+    slow = environment_scoring(data)
+    environment_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    fast = score_experiment(Environment(), data)
+    fast_time = time.perf_counter() - start_time
+
+    reward_error = np.max(np.abs(fast['rewards'] - slow['rewards']))
+    cumulative_reward_error = np.max(np.abs(fast['cumulative_rewards'] - slow['cumulative_rewards']))
+
+    # The Environment's mid_way flag is only raised until the mid-way reward is given
+    mid_way_reward_index = {'Environment': int(np.argmax(slow['collisions']['mid_way'])) if np.any(slow['collisions']['mid_way']) else -1,
+                            'fast':        int(np.argmax(fast['collisions']['mid_way'])) if np.any(fast['collisions']['mid_way']) else -1}
+    compared_rows = {flag: len(data) for flag in COLLISION_FLAGS}
+    compared_rows['mid_way'] = mid_way_reward_index['Environment'] + 1 if mid_way_reward_index['Environment'] >= 0 else len(data)
+    flag_disagreements = {flag: int(np.sum(fast['collisions'][flag][:rows] != slow['collisions'][flag][:rows])) for flag, rows in compared_rows.items()}
+
+    passed = reward_error < TOLERANCE and cumulative_reward_error < TOLERANCE and \
+             fast['done_index'] == slow['done_index'] and fast['docking_index'] == slow['docking_index'] and \
+             mid_way_reward_index['fast'] == mid_way_reward_index['Environment'] and not any(flag_disagreements.values())
+    print("%s: %i rows, reward error %.2e, cumulative reward error %.2e, done at row %i/%i, docked at row %i/%i, mid-way reward at row %i/%i (Environment/fast), %s, Environment %.2f s, fast %.4f s: %s"
+          %(name, len(data), reward_error, cumulative_reward_error, slow['done_index'], fast['done_index'], slow['docking_index'], fast['docking_index'],
+            mid_way_reward_index['Environment'], mid_way_reward_index['fast'],
+            ', '.join('%i %s differ' %(count, flag) for flag, count in flag_disagreements.items() if count) or 'all flags agree',
+            environment_time, fast_time, "PASS" if passed else "FAIL"))
+    return passed
+
+all_passed = True
+
+for log_filename in sorted(glob.glob(SAVED_DATA_DIRECTORY + '**/deep_guidance_data_*.txt', recursive = True)):
+    data = np.asarray(load_experiment_log(log_filename))
+    if len(data) == 0:
+        continue
+    all_passed &= compare(log_filename[len(SAVED_DATA_DIRECTORY):], data)
+
+print("All checks passed" if all_passed else "Some checks FAILED")
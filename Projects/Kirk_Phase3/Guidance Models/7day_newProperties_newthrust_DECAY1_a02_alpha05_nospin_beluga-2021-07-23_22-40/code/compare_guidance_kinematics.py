@@ -0,0 +1,98 @@
+"""
+This script checks that guidance_kinematics.py (used when USE_FAST_KINEMATICS = True
+in use_deep_guidance_arm.py) produces the same policy input, docking error and
+docking check as the Environment, and times the two.
+
+Every timestep of every experiment log under SAVED_DATA_DIRECTORY is checked, as
+well as NUMBER_OF_RANDOM_STATES random states spread over the whole state space.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+import glob
+import time
+import numpy as np
+
+import guidance_kinematics
+from environment_manipulator import Environment
+from experiment_logger import load_experiment_log
+from settings import Settings
+
+SAVED_DATA_DIRECTORY      = '../../../Saved Data/' # searched for deep_guidance_data_*.txt, including sub-folders
+NUMBER_OF_RANDOM_STATES   = 10000
+SUCCESSFUL_DOCKING_RADIUS = 0.04 # [m] as in use_deep_guidance_arm.py
+TOLERANCE                 = 1e-9
+
+np.random.seed(Settings.RANDOM_SEED)
+
+environment = Environment()
+environment.reset(False)
+environment.SUCCESSFUL_DOCKING_RADIUS = SUCCESSFUL_DOCKING_RADIUS
+geometry = guidance_kinematics.arm_geometry(environment)
+
+def environment_kinematics(received_values):
+    # The policy input, docking error and docking check, as use_deep_guidance_arm.py calculated them with the Environment
+    environment.chaser_position   = np.array(received_values[1:4])
+    environment.chaser_velocity   = np.array(received_values[4:7])
+    environment.target_position   = np.array(received_values[7:10])
+    environment.target_velocity   = np.array(received_values[10:13])
+    environment.arm_angles        = np.array(received_values[13:16])
+    environment.arm_angular_rates = np.array(received_values[16:19])
+    environment.update_end_effector_and_docking_locations()
+    environment.update_end_effector_location_body_frame()
+    environment.update_relative_pose_body_frame()
+    environment.check_collisions()
+
+    docking_error_inertial = environment.end_effector_position - environment.docking_port_position
+    docking_error_target_body = np.matmul(environment.make_C_bI(received_values[9]), docking_error_inertial)
+    observation = guidance_kinematics.normalize_total_state(environment.make_total_state(), Settings.STATE_MEAN, Settings.STATE_HALF_RANGE, Settings.IRRELEVANT_STATES, Settings.NORMALIZE_STATE)
+    return observation, docking_error_target_body, environment.docked
+
+def fast_kinematics(received_values):
+    # The same, with guidance_kinematics.py
+    observation = guidance_kinematics.make_observation(received_values, geometry, Settings.STATE_MEAN, Settings.STATE_HALF_RANGE, Settings.IRRELEVANT_STATES, Settings.NORMALIZE_STATE)
+    return observation, guidance_kinematics.docking_error(received_values, geometry), guidance_kinematics.is_docked(received_values, geometry, SUCCESSFUL_DOCKING_RADIUS)
+
+def compare(name, all_received_values):
+    # Runs every set of received values through both and prints the largest differences and the time per message
+    environment_results = []
+    start_time = time.perf_counter()
+    for received_values in all_received_values:
+        environment_results.append(environment_kinematics(received_values))
+    environment_time = (time.perf_counter() - start_time)/len(all_received_values)
+
+    fast_results = []
+    start_time = time.perf_counter()
+    for received_values in all_received_values:
+        fast_results.append(fast_kinematics(received_values))
+    fast_time = (time.perf_counter() - start_time)/len(all_received_values)
+
+    observation_error = max(np.max(np.abs(fast[0] - slow[0])) for fast, slow in zip(fast_results, environment_results))
+    docking_error_error = max(np.max(np.abs(fast[1] - slow[1])) for fast, slow in zip(fast_results, environment_results))
+
+    # Docking checks that disagree, other than the ones right on the edge of the docking circle
+    docking_check_disagreements = [slow[1] for fast, slow in zip(fast_results, environment_results) if fast[2] != slow[2]]
+    docking_check_edge_cases = sum(abs(np.linalg.norm(error) - SUCCESSFUL_DOCKING_RADIUS) < 0.002*SUCCESSFUL_DOCKING_RADIUS for error in docking_check_disagreements)
+
+    passed = observation_error < TOLERANCE and docking_error_error < TOLERANCE and len(docking_check_disagreements) == docking_check_edge_cases
+    print("%s: %i messages, observation error %.2e, docking error error %.2e, %i docking checks differ (%i on the edge of the circle), Environment %.1f us, fast %.1f us per message: %s"
+          %(name, len(all_received_values), observation_error, docking_error_error, len(docking_check_disagreements), docking_check_edge_cases, environment_time*1e6, fast_time*1e6, "PASS" if passed else "FAIL"))
+    return passed
+
+all_passed = True
+
+# Every logged experiment. The log holds the received values after the target offsets were applied, as the guidance used them.
+for log_filename in sorted(glob.glob(SAVED_DATA_DIRECTORY + '**/deep_guidance_data_*.txt', recursive = True)):
+    data = np.asarray(load_experiment_log(log_filename))
+    if len(data) == 0:
+        continue
+    all_received_values = [tuple(received_values) for received_values in np.concatenate([data[:, :1], data[:, 7:25]], axis = 1)]
+    all_passed &= compare(log_filename[len(SAVED_DATA_DIRECTORY):], all_received_values)
+
+# Random states over the whole state space
+random_received_values = np.zeros([NUMBER_OF_RANDOM_STATES, 19])
+random_received_values[:, 1:7]   = np.random.uniform(Settings.LOWER_STATE_BOUND[:6], Settings.UPPER_STATE_BOUND[:6], size = [NUMBER_OF_RANDOM_STATES, 6])
+random_received_values[:, 7:13]  = np.random.uniform(Settings.LOWER_STATE_BOUND[12:18], Settings.UPPER_STATE_BOUND[12:18], size = [NUMBER_OF_RANDOM_STATES, 6])
+random_received_values[:, 13:19] = np.random.uniform(Settings.LOWER_STATE_BOUND[6:12], Settings.UPPER_STATE_BOUND[6:12], size = [NUMBER_OF_RANDOM_STATES, 6])
+all_passed &= compare('Random states', [tuple(received_values) for received_values in random_received_values])
+
+print("All checks passed" if all_passed else "Some checks FAILED")
@@ -0,0 +1,62 @@
+"""
+This script checks that categorical_project (used when Settings.CATEGORICAL_PROJECTION = True)
+produces the same projected distributions as l2_project, and times the two.
+
+Random Bellman-shifted bins and target distributions are generated, including
+terminal samples (all bins at 0) and samples pushed past MIN_V and MAX_V.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+import time
+import numpy as np
+import tensorflow as tf
+
+from build_neural_networks import l2_project, categorical_project
+from settings import Settings
+
+BATCH_SIZES = [1, Settings.MINI_BATCH_SIZE, 4096]
+NUMBER_OF_TIMING_RUNS = 50
+TOLERANCE = 1e-5
+
+np.random.seed(Settings.RANDOM_SEED)
+
+# The same bins as the learner
+bins = np.linspace(Settings.MIN_V, Settings.MAX_V, Settings.NUMBER_OF_BINS, dtype = np.float32)
+
+target_bins_placeholder = tf.placeholder(dtype = tf.float32, shape = [None, Settings.NUMBER_OF_BINS])
+target_q_distribution_placeholder = tf.placeholder(dtype = tf.float32, shape = [None, Settings.NUMBER_OF_BINS])
+z_q = tf.constant(bins)
+
+l2_projection = l2_project(target_bins_placeholder, target_q_distribution_placeholder, z_q)
+categorical_projection = categorical_project(target_bins_placeholder, target_q_distribution_placeholder, z_q)
+
+with tf.Session() as sess:
+    for batch_size in BATCH_SIZES:
+        # Random target distributions that sum to 1
+        target_q_distribution = np.random.uniform(size = [batch_size, Settings.NUMBER_OF_BINS]).astype(np.float32)
+        target_q_distribution /= np.sum(target_q_distribution, axis = 1, keepdims = True)
+
+        # Bellman-shifted bins, r + gamma*bins, with some terminal samples and some large rewards
+        rewards = np.random.uniform(low = 2*Settings.MIN_V, high = 2*Settings.MAX_V, size = [batch_size, 1])
+        gammas = np.random.uniform(low = 0.5, high = 1.0, size = [batch_size, 1])
+        target_bins = np.repeat(np.expand_dims(bins, axis = 0), batch_size, axis = 0)
+        target_bins[np.random.uniform(size = batch_size) < 0.1, :] = 0.0
+        target_bins = (rewards + target_bins*gammas).astype(np.float32)
+
+        feed_dict = {target_bins_placeholder: target_bins, target_q_distribution_placeholder: target_q_distribution}
+
+        l2_result, categorical_result = sess.run([l2_projection, categorical_projection], feed_dict = feed_dict)
+        max_error = np.max(np.abs(l2_result - categorical_result))
+
+        # Timing each projection
+        start_time = time.time()
+        for i in range(NUMBER_OF_TIMING_RUNS):
+            sess.run(l2_projection, feed_dict = feed_dict)
+        l2_time = (time.time() - start_time)/NUMBER_OF_TIMING_RUNS
+
+        start_time = time.time()
+        for i in range(NUMBER_OF_TIMING_RUNS):
+            sess.run(categorical_projection, feed_dict = feed_dict)
+        categorical_time = (time.time() - start_time)/NUMBER_OF_TIMING_RUNS
+
+        print("Batch size %5i: max difference %.2e (%s); l2_project %.3f ms; categorical_project %.3f ms" %(batch_size, max_error, 'PASS' if max_error < TOLERANCE else 'FAIL', l2_time*1000, categorical_time*1000))
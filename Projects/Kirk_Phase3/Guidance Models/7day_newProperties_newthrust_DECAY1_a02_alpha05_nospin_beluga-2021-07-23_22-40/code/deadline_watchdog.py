@@ -0,0 +1,113 @@
+"""
+Makes sure the Pi gets a command while it is still waiting for one after each
+message, even when the guidance can't calculate one in time.
+
+After sending each message, the Pi waits only a few milliseconds for a command
+(PI_RECEIVE_WINDOW in use_deep_guidance_arm.py). If use_deep_guidance_arm.py
+stalls (a garbage collection pause, the Jetson throttling itself when it's hot, a
+slow socket) the Pi keeps acting on its old command, and reads the late one on
+its next cycle, by which time it is out of date. Nothing recorded that it happened.
+
+Here, the time each message from the Pi arrives is noted, and if the guidance
+for it hasn't been sent deadline seconds later, the watchdog's own thread sends a
+safe command for it instead:
+    - 'decay': the last command sent, multiplied by decay
+    - 'zero':  zero accelerations
+The deadline is set so the safe command still arrives while the Pi is waiting,
+allowing for the time jetsonRepeater.py takes to pass the message and command
+through (REPEATER_TRANSIT_TIME), which has to be measured on the Jetson first.
+Each message only ever gets one command: once the safe command is sent, the
+guidance's late command for the same message is dropped (send_command returns
+whether it was sent), so the Pi never receives both. While the guidance is
+stalled, every message the Pi sends gets its own safe command, so a decaying
+command keeps decaying. Every message that missed its deadline is counted and
+saved with the experiment's latency statistics.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import time
+import threading
+import numpy as np
+
+SAFE_COMMANDS = ['decay', 'zero']
+IDLE_TIMEOUT  = 0.5 # [s] how often the watchdog checks if it should stop when no message is waiting
+
+class DeadlineWatchdog:
+
+    def __init__(self, deadline, send_command, stop_run_flag, safe_command = 'decay', decay = 0.5):
+        assert safe_command in SAFE_COMMANDS
+        self.deadline = deadline # [s] from a message arriving to the command for it being sent
+        self.send_command = send_command # send_command(command, sequence_number, Pi_time) sends a command to the Pi, and returns whether it was sent (not if one was already sent for that message)
+        self.stop_run_flag = stop_run_flag
+        self.safe_command = safe_command
+        self.decay = decay
+
+        self.condition = threading.Condition()
+        self.last_command = None # [6 accelerations, have_we_docked]
+        self.newest_message = None # (received_time, sequence_number, Pi_time) of the newest message received
+        self.waiting_message = None # (sequence_number, Pi_time) of the message waiting for a command
+        self.deadline_time = None # perf_counter() time its command must be sent by, or None if no message is waiting
+
+        self.number_of_misses = 0 # messages that weren't answered by their deadline, and got a safe command instead
+        self.missed_Pi_times = [] # Pi_time of each of them
+
+    def message_received(self, received_time, sequence_number, Pi_time):
+        # Starts the deadline, unless an earlier message is still waiting for its command
+        with self.condition:
+            self.newest_message = (received_time, sequence_number, Pi_time)
+            if self.deadline_time is None:
+                self.start_deadline()
+
+    def command_sent(self, command, sequence_number):
+        # The guidance sent a command for the message with this sequence_number
+        with self.condition:
+            self.last_command = np.array(command, dtype = np.float64)
+            if self.deadline_time is not None and self.waiting_message[0] <= sequence_number:
+                self.message_answered(sequence_number)
+
+    def message_answered(self, sequence_number):
+        # The message with this sequence_number, and any before it, have had a command. A newer message may have arrived in the meantime.
+        if self.newest_message[1] > sequence_number:
+            self.start_deadline()
+        else:
+            self.deadline_time = None
+
+    def start_deadline(self):
+        # The newest message is now the one waiting for a command
+        received_time, sequence_number, Pi_time = self.newest_message
+        self.deadline_time = received_time + self.deadline
+        self.waiting_message = (sequence_number, Pi_time)
+        self.condition.notify()
+
+    def make_safe_command(self):
+        if self.last_command is None:
+            return np.zeros(7)
+        safe_command = np.copy(self.last_command)
+        safe_command[:6] = safe_command[:6]*self.decay if self.safe_command == 'decay' else 0.
+        return safe_command
+
+    def run(self):
+        with self.condition:
+            while not self.stop_run_flag.is_set():
+                if self.deadline_time is None:
+                    self.condition.wait(IDLE_TIMEOUT)
+                    continue
+                time_remaining = self.deadline_time - time.perf_counter()
+                if time_remaining > 0:
+                    self.condition.wait(time_remaining)
+                    continue
+
+                # Missed the deadline, so send the safe command for this message (unless the guidance got there just before us)
+                sequence_number, Pi_time = self.waiting_message
+                safe_command = self.make_safe_command()
+                if self.send_command(safe_command, sequence_number, Pi_time):
+                    self.last_command = safe_command
+                    self.number_of_misses += 1
+                    self.missed_Pi_times.append(float(Pi_time))
+                self.message_answered(sequence_number)
+
+        print("Deadline watchdog gently stopped")
+
+    def statistics(self):
+        return {'deadline_ms': self.deadline*1000, 'deadline_misses': self.number_of_misses, 'missed_Pi_times': self.missed_Pi_times}
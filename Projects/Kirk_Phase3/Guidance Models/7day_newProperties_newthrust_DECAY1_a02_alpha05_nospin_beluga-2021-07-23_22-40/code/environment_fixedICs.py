@@ -81,19 +81,21 @@ import os
 import signal
 import multiprocessing
 import queue
+import time
 from scipy.integrate import odeint # Numerical integrator
 import glob
 import shutil
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import matplotlib.gridspec as gridspec
+# matplotlib is only imported in render(), so that environment worker processes
+# (environment_worker.py) do not need to load it
+
 from shapely.geometry import Point, Polygon # for collision detection
 
+from environment_manipulator_spec import EnvironmentSpec
+from experiment_logger import load_experiment_log
+
 DATA_FILE_TIME = '26-55' # a unique identifier of the data file we wish to use for initial conditions. Usually two time entries will do
 
-class Environment:
+class Environment(EnvironmentSpec):
 
     def __init__(self):
         ##################################
@@ -107,80 +109,24 @@ class Environment:
         
         """
         self.ON_CEDAR                 = False # False for Graham, Béluga, Niagara, and RCDC
-        self.TOTAL_STATE_SIZE         = 29 # [chaser_x, chaser_y, chaser_theta, chaser_x_dot, chaser_y_dot, chaser_theta_dot, shoulder_theta, elbow_theta, wrist_theta, shoulder_theta_dot, elbow_theta_dot, wrist_theta_dot, target_x, target_y, target_theta, target_x_dot, target_y_dot, target_theta_dot, ee_x, ee_y, ee_x_dot, ee_y_dot, relative_x_b, relative_y_b, relative_theta, ee_x_b, ee_y_b, ee_x_dot_b, ee_y_dot_b]
-        self.ACTIONS_IN_INERTIAL      = True
-        ### Note: TOTAL_STATE contains all relevant information describing the problem, and all the information needed to animate the motion
-        #         TOTAL_STATE is returned from the environment to the agent.
-        #         A subset of the TOTAL_STATE, called the 'observation', is passed to the policy network to calculate acitons. This takes place in the agent
-        #         The TOTAL_STATE is passed to the animator below to animate the motion.
-        #         The chaser and target state are contained in the environment. They are packaged up before being returned to the agent.
-        #         The total state information returned must be as commented beside self.TOTAL_STATE_SIZE.
-        #self.IRRELEVANT_STATES                = [15,16,18,19,20,21] # [target_velocity & end-effector states] indices of states who are irrelevant to the policy network
-        #self.IRRELEVANT_STATES                = [0,1,12,13,14,15,16,18,19,20,21,25,26,27,28] # [relative position and chaser info] indices of states who are irrelevant to the policy network
-        self.IRRELEVANT_STATES                = [12,13,14,15,16,18,19,20,21,25,26,27,28] # [relative position and chaser info + chaser x&y for table falling] indices of states who are irrelevant to the policy network
-        #self.IRRELEVANT_STATES                = [0,1, 6, 7, 9,10,12,13,14,15,16,18,19,20,21] # [ee_b_wristangle_relative_pos_body_accels] indices of states who are irrelevant to the policy network
-        self.OBSERVATION_SIZE                 = self.TOTAL_STATE_SIZE - len(self.IRRELEVANT_STATES) # the size of the observation input to the policy
-        self.ACTION_SIZE                      = 6 # [x_dot_dot, y_dot_dot, theta_dot_dot, shoulder_theta_dot_dot, elbow_theta_dot_dot, wrist_theta_dot_dot] in the inertial frame for x, y, theta; in the joint frame for the others.
-        self.MAX_X_POSITION                   = 3.5 # [m]
-        self.MAX_Y_POSITION                   = 2.4 # [m]
-        self.MAX_VELOCITY                     = 0.1 # [m/s]
-        self.MAX_BODY_ANGULAR_VELOCITY        = 15*np.pi/180 # [rad/s] for body
-        self.MAX_ARM_ANGULAR_VELOCITY         = 30*np.pi/180 # [rad/s] for joints
-        self.MAX_LINEAR_ACCELERATION          = 0.02#0.015 # [m/s^2]
-        self.MAX_ANGULAR_ACCELERATION         = 0.05#0.04 # [rad/s^2]
-        self.MAX_ARM_ANGULAR_ACCELERATION     = 0.1 # [rad/s^2]
+        # The properties that the learning algorithm needs (state and action sizes and bounds, the value
+        # distribution range, the timestep, etc.) are defined in EnvironmentSpec (environment_manipulator_spec.py),
+        # which this class inherits. They can be read there without building an Environment.
         self.MAX_THRUST                       = 0.5 # [N] Experimental limitation
         self.MAX_BODY_TORQUE                  = 0.064 # [Nm] # Experimental limitation
         self.MAX_JOINT1n2_TORQUE              = 0.02 # [Nm] # Limited by the simulator NOT EXPERIMENT
         self.MAX_JOINT3_TORQUE                = 0.0002 # [Nm] Limited by the simulator NOT EXPERIMENT
-        self.LOWER_ACTION_BOUND               = np.array([-self.MAX_LINEAR_ACCELERATION, -self.MAX_LINEAR_ACCELERATION, -self.MAX_ANGULAR_ACCELERATION, -self.MAX_ARM_ANGULAR_ACCELERATION, -self.MAX_ARM_ANGULAR_ACCELERATION, -self.MAX_ARM_ANGULAR_ACCELERATION]) # [m/s^2, m/s^2, rad/s^2, rad/s^2, rad/s^2, rad/s^2]
-        self.UPPER_ACTION_BOUND               = np.array([ self.MAX_LINEAR_ACCELERATION,  self.MAX_LINEAR_ACCELERATION,  self.MAX_ANGULAR_ACCELERATION,  self.MAX_ARM_ANGULAR_ACCELERATION,  self.MAX_ARM_ANGULAR_ACCELERATION,  self.MAX_ARM_ANGULAR_ACCELERATION]) # [m/s^2, m/s^2, rad/s^2, rad/s^2, rad/s^2, rad/s^2]
                 
-        self.LOWER_STATE_BOUND                = np.array([ 0.0, 0.0, 0.0, -self.MAX_VELOCITY, -self.MAX_VELOCITY, -self.MAX_BODY_ANGULAR_VELOCITY,  # Chaser 
-                                                          -np.pi/2, -np.pi/2, -np.pi/2, # Shoulder_theta, Elbow_theta, Wrist_theta
-                                                          -self.MAX_ARM_ANGULAR_VELOCITY, -self.MAX_ARM_ANGULAR_VELOCITY, -self.MAX_ARM_ANGULAR_VELOCITY, # Shoulder_theta_dot, Elbow_theta_dot, Wrist_theta_dot
-                                                          0.0, 0.0, 0.0, -self.MAX_VELOCITY, -self.MAX_VELOCITY, -self.MAX_BODY_ANGULAR_VELOCITY, # Target
-                                                          0.0, 0.0, -3*self.MAX_VELOCITY, -3*self.MAX_VELOCITY, # End-effector
-                                                          -self.MAX_X_POSITION, -self.MAX_Y_POSITION, 0, #relative_x_i, relative_y_i, relative_theta,
-                                                          -0.688, -0.8, -0.2, -0.2]) #ee_x_b, ee_y_b, ee_x_dot_b, ee_y_dot_b
-                                                          # [m, m, rad, m/s, m/s, rad/s, rad, rad, rad, rad/s, rad/s, rad/s, m, m, rad, m/s, m/s, rad/s, m, m, m/s, m/s, m, m, rad, m, m, m/s, m/s] // lower bound for each element of TOTAL_STATE
-        self.UPPER_STATE_BOUND                = np.array([ self.MAX_X_POSITION, self.MAX_Y_POSITION, 2*np.pi, self.MAX_VELOCITY, self.MAX_VELOCITY, self.MAX_BODY_ANGULAR_VELOCITY,  # Chaser 
-                                                          np.pi/2, np.pi/2, np.pi/2, # Shoulder_theta, Elbow_theta, Wrist_theta
-                                                          self.MAX_ARM_ANGULAR_VELOCITY, self.MAX_ARM_ANGULAR_VELOCITY, self.MAX_ARM_ANGULAR_VELOCITY, # Shoulder_theta_dot, Elbow_theta_dot, Wrist_theta_dot
-                                                          self.MAX_X_POSITION, self.MAX_Y_POSITION, 2*np.pi, self.MAX_VELOCITY, self.MAX_VELOCITY, self.MAX_BODY_ANGULAR_VELOCITY, # Target
-                                                          self.MAX_X_POSITION, self.MAX_Y_POSITION, 3*self.MAX_VELOCITY, 3*self.MAX_VELOCITY, # End-effector
-                                                          self.MAX_X_POSITION, self.MAX_Y_POSITION, 2*np.pi, #relative_x_i, relative_y_i, relative_theta,
-                                                          0.688, 0.8, 0.2, 0.2]) #ee_x_b, ee_y_b, ee_x_dot_b, ee_y_dot_b
-                                                          # [m, m, rad, m/s, m/s, rad/s, rad, rad, rad, rad/s, rad/s, rad/s, m, m, rad, m/s, m/s, rad/s, m, m, m/s, m/s, m, m, rad, m, m, m/s, m/s] // Upper bound for each element of TOTAL_STATE
         
         #####################################
         ### Load in the experimental data ###
         #####################################
-        log_filename = glob.glob('*' + DATA_FILE_TIME + '*.txt')[0]
-        data = np.load(log_filename)
+        # The initial conditions come from the experiment log in this folder matching DATA_FILE_TIME.
+        # If there isn't one, the log must be given with each reset (e.g., by resimulate_experiments.py).
+        log_filenames = glob.glob('*' + DATA_FILE_TIME + '*.txt')
+        if len(log_filenames) > 0:
+            self.load_initial_conditions(log_filenames[0])
         
-        ##################################
-        ### Extract initial conditions ###
-        ##################################
-        Pi_time, deep_guidance_Ax, deep_guidance_Ay, deep_guidance_alpha_base, \
-                                 deep_guidance_alpha_shoulder, deep_guidance_alpha_elbow, deep_guidance_alpha_wrist, \
-                                 Pi_red_x, Pi_red_y, Pi_red_theta, \
-                                 Pi_red_Vx, Pi_red_Vy, Pi_red_omega,        \
-                                 Pi_black_x, Pi_black_y, Pi_black_theta,    \
-                                 Pi_black_Vx, Pi_black_Vy, Pi_black_omega,  \
-                                 shoulder_theta, elbow_theta, wrist_theta, \
-                                 shoulder_omega, elbow_omega, wrist_omega, docked = data[0,:]
-                                 
-                                 
-        #self.INITIAL_CHASER_POSITION          = np.array([self.MAX_X_POSITION/2, self.MAX_Y_POSITION/2, 0.0]) # [m, m, rad]
-        self.INITIAL_CHASER_POSITION          = np.array([Pi_red_x, Pi_red_y, Pi_red_theta]) # [m, m, rad]
-        self.INITIAL_CHASER_VELOCITY          = np.array([Pi_red_Vx, Pi_red_Vy, Pi_red_omega]) # [m/s, m/s, rad/s]
-        self.INITIAL_ARM_ANGLES               = np.array([shoulder_theta, elbow_theta, wrist_theta]) # [rad, rad, rad]
-        self.INITIAL_ARM_RATES                = np.array([shoulder_omega, elbow_omega, wrist_omega]) # [rad/s, rad/s, rad/s]
-        #self.INITIAL_TARGET_POSITION          = np.array([self.MAX_X_POSITION/2, self.MAX_Y_POSITION/2, 0.0]) # [m, m, rad]
-        self.INITIAL_TARGET_POSITION          = np.array([Pi_black_x, Pi_black_y, Pi_black_theta]) # [m, m, rad]
-        self.INITIAL_TARGET_VELOCITY          = np.array([Pi_black_Vx, Pi_black_Vy, Pi_black_omega]) # [m/s, m/s, rad/s]
-        self.NORMALIZE_STATE                  = True # Normalize state on each timestep to avoid vanishing gradients
         self.RANDOMIZE_INITIAL_CONDITIONS     = False # whether or not to randomize the initial conditions
         self.RANDOMIZE_DOMAIN                 = False # whether or not to randomize the physical parameters (length, mass, size)
         #self.RANDOMIZATION_POSITION           = 0.5 # [m] half-range uniform randomization position """Replaced with individual randomizations in X and Y"""
@@ -193,17 +139,10 @@ class Environment:
         self.RANDOMIZATION_ARM_RATES          = 0.0 # [rad/s] half-range uniform randomization arm rates
         self.RANDOMIZATION_TARGET_VELOCITY    = 0.0 # [m/s] half-range uniform randomization target velocity
         self.RANDOMIZATION_TARGET_OMEGA       = 0#10*np.pi/180 # [rad/s] half-range uniform randomization target omega
-        self.MIN_V                            = -100.
-        self.MAX_V                            =  125.
-        self.N_STEP_RETURN                    =   5
-        self.DISCOUNT_FACTOR                  = 0.95**(1/self.N_STEP_RETURN)
-        self.TIMESTEP                         = 0.2 # [s]
         self.CALIBRATE_TIMESTEP               = False # Forces a predetermined action and prints more information to the screen. Useful in calculating gains and torque limits
         self.CLIP_DURING_CALIBRATION          = True # Whether or not to clip the control forces during calibration
         self.PREDETERMINED_ACTION             = np.array([0.01,-0.015,0.03,-0.07,0.01,0.1])
         self.DYNAMICS_DELAY                   = 0 # [timesteps of delay] how many timesteps between when an action is commanded and when it is realized
-        self.AUGMENT_STATE_WITH_ACTION_LENGTH = 0 # [timesteps] how many timesteps of previous actions should be included in the state. This helps with making good decisions among delayed dynamics.
-        self.MAX_NUMBER_OF_TIMESTEPS          = 300# per episode
         self.ADDITIONAL_VALUE_INFO            = False # whether or not to include additional reward and value distribution information on the animations
         self.SKIP_FAILED_ANIMATIONS           = True # Error the program or skip when animations fail?        
         #self.KI                               = [17.0,17.0,0.295,0.02,0.0036,0.00008] # Integral gains for the integral-acceleration controller of the body and arm (x, y, theta, theta1, theta2, theta3)
@@ -269,24 +208,55 @@ class Environment:
         
         # Some calculations that don't need to be changed
         self.TABLE_BOUNDARY    = Polygon(np.array([[0,0], [self.MAX_X_POSITION, 0], [self.MAX_X_POSITION, self.MAX_Y_POSITION], [0, self.MAX_Y_POSITION], [0,0]]))
-        self.VELOCITY_LIMIT    = np.array([self.MAX_VELOCITY, self.MAX_VELOCITY, self.MAX_BODY_ANGULAR_VELOCITY, self.MAX_ARM_ANGULAR_VELOCITY, self.MAX_ARM_ANGULAR_VELOCITY, self.MAX_ARM_ANGULAR_VELOCITY]) # [m/s, m/s, rad/s] maximum allowable velocity/angular velocity; enforced by the controller
         self.ANGLE_LIMIT       = np.pi/2 # Used as a hard limit in the dynamics in order to protect the arm from hitting the chaser
-        self.LOWER_STATE_BOUND = np.concatenate([self.LOWER_STATE_BOUND, np.tile(self.LOWER_ACTION_BOUND, self.AUGMENT_STATE_WITH_ACTION_LENGTH)]) # lower bound for each element of TOTAL_STATE
-        self.UPPER_STATE_BOUND = np.concatenate([self.UPPER_STATE_BOUND, np.tile(self.UPPER_ACTION_BOUND, self.AUGMENT_STATE_WITH_ACTION_LENGTH)]) # upper bound for each element of TOTAL_STATE        
-        self.OBSERVATION_SIZE  = self.TOTAL_STATE_SIZE - len(self.IRRELEVANT_STATES) # the size of the observation input to the policy
         
         # Enabling the extra printing
         self.extra_printing = True
 
 
+    def load_initial_conditions(self, log_filename):
+        # Uses the first entry of an experiment log (deep_guidance_data_*.txt, saved by
+        # use_deep_guidance_arm.py) as the initial conditions
+        #####################################
+        ### Load in the experimental data ###
+        #####################################
+        data = load_experiment_log(log_filename)
+        
+        ##################################
+        ### Extract initial conditions ###
+        ##################################
+        Pi_time, deep_guidance_Ax, deep_guidance_Ay, deep_guidance_alpha_base, \
+                                 deep_guidance_alpha_shoulder, deep_guidance_alpha_elbow, deep_guidance_alpha_wrist, \
+                                 Pi_red_x, Pi_red_y, Pi_red_theta, \
+                                 Pi_red_Vx, Pi_red_Vy, Pi_red_omega,        \
+                                 Pi_black_x, Pi_black_y, Pi_black_theta,    \
+                                 Pi_black_Vx, Pi_black_Vy, Pi_black_omega,  \
+                                 shoulder_theta, elbow_theta, wrist_theta, \
+                                 shoulder_omega, elbow_omega, wrist_omega, docked = data[0,:]
+                                 
+                                 
+        #self.INITIAL_CHASER_POSITION          = np.array([self.MAX_X_POSITION/2, self.MAX_Y_POSITION/2, 0.0]) # [m, m, rad]
+        self.INITIAL_CHASER_POSITION          = np.array([Pi_red_x, Pi_red_y, Pi_red_theta]) # [m, m, rad]
+        self.INITIAL_CHASER_VELOCITY          = np.array([Pi_red_Vx, Pi_red_Vy, Pi_red_omega]) # [m/s, m/s, rad/s]
+        self.INITIAL_ARM_ANGLES               = np.array([shoulder_theta, elbow_theta, wrist_theta]) # [rad, rad, rad]
+        self.INITIAL_ARM_RATES                = np.array([shoulder_omega, elbow_omega, wrist_omega]) # [rad/s, rad/s, rad/s]
+        #self.INITIAL_TARGET_POSITION          = np.array([self.MAX_X_POSITION/2, self.MAX_Y_POSITION/2, 0.0]) # [m, m, rad]
+        self.INITIAL_TARGET_POSITION          = np.array([Pi_black_x, Pi_black_y, Pi_black_theta]) # [m, m, rad]
+        self.INITIAL_TARGET_VELOCITY          = np.array([Pi_black_Vx, Pi_black_Vy, Pi_black_omega]) # [m/s, m/s, rad/s]
+
+
     ######################################
     ##### Resettings the Environment #####
     ######################################
-    def reset(self, test_time):
+    def reset(self, test_time, log_filename = None):
         # This method resets the state
         """ NOTES:
                - if test_time = True -> do not add "controller noise" to the kinematics
+               - if log_filename is given, its initial conditions are used from now on
         """
+        if log_filename is not None:
+            self.load_initial_conditions(log_filename)
+
         # Reset the seed for max randomness
         np.random.seed()
                 
@@ -343,7 +313,8 @@ class Environment:
         # Check for collisions
         self.check_collisions()
         # If we are colliding (unfairly) upon a reset, reset the environment again!
-        if self.end_effector_collision or self.forbidden_area_collision or self.chaser_target_collision or self.elbow_target_collision or not(self.chaser_on_table):
+        # (Only when randomizing--the same initial conditions would collide forever.)
+        if self.RANDOMIZE_INITIAL_CONDITIONS and (self.end_effector_collision or self.forbidden_area_collision or self.chaser_target_collision or self.elbow_target_collision or not(self.chaser_on_table)):
             # Reset the environment again!
             self.reset(test_time)        
  
@@ -1168,22 +1139,31 @@ class Environment:
         # This permits the process to continue upon a Ctrl+C event to allow for graceful quitting.
         signal.signal(signal.SIGINT, signal.SIG_IGN)
         
+        # How long this process spends stepping versus waiting for the agent, reported once per episode
+        step_time = 0.
+        idle_time = 0.
+        
         # Loop until the process is terminated
         while True:
             # Blocks until the agent passes us an action
+            idle_start_time = time.perf_counter()
             action, *test_time = self.agent_to_env.get()
+            idle_time += time.perf_counter() - idle_start_time
 
 
             if type(action) == bool and action == True:
                 # The signal to reset the environment was received
-                self.reset(test_time[0])
+                self.reset(*test_time)
                 
                 # Return the TOTAL_STATE
                 self.env_to_agent.put(self.make_total_state())
                 
             elif type(action) == bool and action == False:
-                # A signal to return if we docked, the target angular rate, and the combined angular momentum was received
-                self.env_to_agent.put((self.docked, self.target_velocity[-1]*180/np.pi, self.combined_angular_momentum()))
+                # A signal to return if we docked, the target angular rate, and the combined angular momentum was received.
+                # The time spent stepping and idling this episode is also returned, then reset.
+                self.env_to_agent.put((self.docked, self.target_velocity[-1]*180/np.pi, self.combined_angular_momentum(), (step_time, idle_time)))
+                step_time = 0.
+                idle_time = 0.
 
             else:
                 
@@ -1198,10 +1178,13 @@ class Environment:
                 ################################
                 ##### Step the environment #####
                 ################################ 
+                step_start_time = time.perf_counter()
                 reward, done = self.step(action)
+                total_state = self.make_total_state()
+                step_time += time.perf_counter() - step_start_time
 
                 # Return (TOTAL_STATE, reward, done)
-                self.env_to_agent.put((self.make_total_state(), reward, done))
+                self.env_to_agent.put((total_state, reward, done))
 
 
 #####################################################################
@@ -1522,6 +1505,12 @@ def calculate_coriolis_matrix(chaser_state, t, parameters):
 ##### Function to animate the motion #####
 ##########################################
 def render(states, actions, instantaneous_reward_log, cumulative_reward_log, critic_distributions, target_critic_distributions, projected_target_distribution, bins, loss_log, episode_number, filename, save_directory, time_log):
+    # Imported here rather than at the top so that environment workers never load them
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+    import matplotlib.gridspec as gridspec
 
     # Load in a temporary environment, used to grab the physical parameters
     temp_env = Environment()
@@ -0,0 +1,9 @@
+"""
+The properties of the fixed initial condition environment. They are identical to
+those of the manipulator environment (only the initial conditions differ), so the
+manipulator's EnvironmentSpec is used directly. See environment_manipulator_spec.py.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+from environment_manipulator_spec import EnvironmentSpec
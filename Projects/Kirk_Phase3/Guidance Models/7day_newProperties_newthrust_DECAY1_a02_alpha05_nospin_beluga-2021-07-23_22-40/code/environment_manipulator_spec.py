@@ -0,0 +1,76 @@
+"""
+The properties of the spacecraft-manipulator environment that the rest of the
+code needs to know before an Environment exists: the state and action sizes,
+their bounds, the value distribution range, the timestep, etc.
+
+settings.py used to build a whole Environment just to read these, which imported
+matplotlib, shapely, and scipy (and, for environment_fixedICs, loaded its data
+file) every time anything imported settings.py. Now settings.py reads them from
+this class instead, and the Environment inherits from it so that self.TIMESTEP,
+self.LOWER_STATE_BOUND, etc. work exactly as before.
+
+Only numpy is imported here. Anything that needs the physics, the initial
+conditions, or the animation belongs in the Environment itself.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import numpy as np
+
+class EnvironmentSpec:
+    ##################################
+    ##### Environment Properties #####
+    ##################################
+    ACTIONS_IN_INERTIAL      = True # Are actions being calculated in the inertial frame or body frame?
+    TOTAL_STATE_SIZE         = 29 # [chaser_x, chaser_y, chaser_theta, chaser_x_dot, chaser_y_dot, chaser_theta_dot, shoulder_theta, elbow_theta, wrist_theta, shoulder_theta_dot, elbow_theta_dot, wrist_theta_dot, target_x, target_y, target_theta, target_x_dot, target_y_dot, target_theta_dot, ee_x, ee_y, ee_x_dot, ee_y_dot, relative_x_b, relative_y_b, relative_theta, ee_x_b, ee_y_b, ee_x_dot_b, ee_y_dot_b]
+    ### Note: TOTAL_STATE contains all relevant information describing the problem, and all the information needed to animate the motion
+    #         TOTAL_STATE is returned from the environment to the agent.
+    #         A subset of the TOTAL_STATE, called the 'observation', is passed to the policy network to calculate acitons. This takes place in the agent
+    #         The TOTAL_STATE is passed to the animator below to animate the motion.
+    #         The chaser and target state are contained in the environment. They are packaged up before being returned to the agent.
+    #         The total state information returned must be as commented beside TOTAL_STATE_SIZE.
+    #IRRELEVANT_STATES                = [15,16,18,19,20,21] # [target_velocity & end-effector states] indices of states who are irrelevant to the policy network
+    #IRRELEVANT_STATES                = [0,1,12,13,14,15,16,18,19,20,21,25,26,27,28] # [relative position and chaser info] indices of states who are irrelevant to the policy network
+    IRRELEVANT_STATES                = [12,13,14,15,16,18,19,20,21,25,26,27,28] # [relative position and chaser info + chaser x&y for table falling] indices of states who are irrelevant to the policy network
+    #IRRELEVANT_STATES                = [0,1, 6, 7, 9,10,12,13,14,15,16,18,19,20,21] # [ee_b_wristangle_relative_pos_body_accels] indices of states who are irrelevant to the policy network
+    OBSERVATION_SIZE                 = TOTAL_STATE_SIZE - len(IRRELEVANT_STATES) # the size of the observation input to the policy
+    ACTION_SIZE                      = 6 # [x_dot_dot, y_dot_dot, theta_dot_dot, shoulder_theta_dot_dot, elbow_theta_dot_dot, wrist_theta_dot_dot] in the inertial frame for x, y, theta; in the joint frame for the others.
+    MAX_X_POSITION                   = 3.5 # [m]
+    MAX_Y_POSITION                   = 2.4 # [m]
+    MAX_VELOCITY                     = 0.1 # [m/s]
+    MAX_BODY_ANGULAR_VELOCITY        = 15*np.pi/180 # [rad/s] for body
+    MAX_ARM_ANGULAR_VELOCITY         = 30*np.pi/180 # [rad/s] for joints
+    MAX_LINEAR_ACCELERATION          = 0.02#0.015 # [m/s^2]
+    MAX_ANGULAR_ACCELERATION         = 0.05#0.04 # [rad/s^2]
+    MAX_ARM_ANGULAR_ACCELERATION     = 0.1 # [rad/s^2]
+    LOWER_ACTION_BOUND               = np.array([-MAX_LINEAR_ACCELERATION, -MAX_LINEAR_ACCELERATION, -MAX_ANGULAR_ACCELERATION, -MAX_ARM_ANGULAR_ACCELERATION, -MAX_ARM_ANGULAR_ACCELERATION, -MAX_ARM_ANGULAR_ACCELERATION]) # [m/s^2, m/s^2, rad/s^2, rad/s^2, rad/s^2, rad/s^2]
+    UPPER_ACTION_BOUND               = np.array([ MAX_LINEAR_ACCELERATION,  MAX_LINEAR_ACCELERATION,  MAX_ANGULAR_ACCELERATION,  MAX_ARM_ANGULAR_ACCELERATION,  MAX_ARM_ANGULAR_ACCELERATION,  MAX_ARM_ANGULAR_ACCELERATION]) # [m/s^2, m/s^2, rad/s^2, rad/s^2, rad/s^2, rad/s^2]
+    LOWER_STATE_BOUND                = np.array([ 0.0, 0.0, 0.0, -MAX_VELOCITY, -MAX_VELOCITY, -MAX_BODY_ANGULAR_VELOCITY,  # Chaser 
+                                                      -np.pi/2, -np.pi/2, -np.pi/2, # Shoulder_theta, Elbow_theta, Wrist_theta
+                                                      -MAX_ARM_ANGULAR_VELOCITY, -MAX_ARM_ANGULAR_VELOCITY, -MAX_ARM_ANGULAR_VELOCITY, # Shoulder_theta_dot, Elbow_theta_dot, Wrist_theta_dot
+                                                      0.0, 0.0, 0.0, -MAX_VELOCITY, -MAX_VELOCITY, -MAX_BODY_ANGULAR_VELOCITY, # Target
+                                                      0.0, 0.0, -3*MAX_VELOCITY, -3*MAX_VELOCITY, # End-effector
+                                                      -MAX_X_POSITION, -MAX_Y_POSITION, 0, #relative_x_i, relative_y_i, relative_theta,
+                                                      -0.688, -0.8, -0.2, -0.2]) #ee_x_b, ee_y_b, ee_x_dot_b, ee_y_dot_b
+                                                      # [m, m, rad, m/s, m/s, rad/s, rad, rad, rad, rad/s, rad/s, rad/s, m, m, rad, m/s, m/s, rad/s, m, m, m/s, m/s, m, m, rad, m, m, m/s, m/s] // lower bound for each element of TOTAL_STATE
+    UPPER_STATE_BOUND                = np.array([ MAX_X_POSITION, MAX_Y_POSITION, 2*np.pi, MAX_VELOCITY, MAX_VELOCITY, MAX_BODY_ANGULAR_VELOCITY,  # Chaser 
+                                                      np.pi/2, np.pi/2, np.pi/2, # Shoulder_theta, Elbow_theta, Wrist_theta
+                                                      MAX_ARM_ANGULAR_VELOCITY, MAX_ARM_ANGULAR_VELOCITY, MAX_ARM_ANGULAR_VELOCITY, # Shoulder_theta_dot, Elbow_theta_dot, Wrist_theta_dot
+                                                      MAX_X_POSITION, MAX_Y_POSITION, 2*np.pi, MAX_VELOCITY, MAX_VELOCITY, MAX_BODY_ANGULAR_VELOCITY, # Target
+                                                      MAX_X_POSITION, MAX_Y_POSITION, 3*MAX_VELOCITY, 3*MAX_VELOCITY, # End-effector
+                                                      MAX_X_POSITION, MAX_Y_POSITION, 2*np.pi, #relative_x_i, relative_y_i, relative_theta,
+                                                      0.688, 0.8, 0.2, 0.2]) #ee_x_b, ee_y_b, ee_x_dot_b, ee_y_dot_b
+                                                      # [m, m, rad, m/s, m/s, rad/s, rad, rad, rad, rad/s, rad/s, rad/s, m, m, rad, m/s, m/s, rad/s, m, m, m/s, m/s, m, m, rad, m, m, m/s, m/s] // Upper bound for each element of TOTAL_STATE
+    NORMALIZE_STATE                  = True # Normalize state on each timestep to avoid vanishing gradients
+    MIN_V                            = -100.
+    MAX_V                            =  125.
+    N_STEP_RETURN                    =   5
+    DISCOUNT_FACTOR                  = 0.95**(1/N_STEP_RETURN)
+    TIMESTEP                         = 0.2 # [s]
+    AUGMENT_STATE_WITH_ACTION_LENGTH = 0 # [timesteps] how many timesteps of previous actions should be included in the state. This helps with making good decisions among delayed dynamics.
+    MAX_NUMBER_OF_TIMESTEPS          = 300# per episode
+
+    # Some calculations that don't need to be changed
+    VELOCITY_LIMIT    = np.array([MAX_VELOCITY, MAX_VELOCITY, MAX_BODY_ANGULAR_VELOCITY, MAX_ARM_ANGULAR_VELOCITY, MAX_ARM_ANGULAR_VELOCITY, MAX_ARM_ANGULAR_VELOCITY]) # [m/s, m/s, rad/s] maximum allowable velocity/angular velocity; enforced by the controller
+    LOWER_STATE_BOUND = np.concatenate([LOWER_STATE_BOUND, np.tile(LOWER_ACTION_BOUND, AUGMENT_STATE_WITH_ACTION_LENGTH)]) # lower bound for each element of TOTAL_STATE
+    UPPER_STATE_BOUND = np.concatenate([UPPER_STATE_BOUND, np.tile(UPPER_ACTION_BOUND, AUGMENT_STATE_WITH_ACTION_LENGTH)]) # upper bound for each element of TOTAL_STATE        
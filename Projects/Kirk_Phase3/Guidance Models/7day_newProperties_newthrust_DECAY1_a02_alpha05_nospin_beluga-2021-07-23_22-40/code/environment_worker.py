@@ -0,0 +1,119 @@
+"""
+Runs an environment in its own lightweight Python process.
+
+Previously, each environment was started with multiprocessing.Process after
+Tensorflow, the graph, and the replay buffer had been built in main.py. Forking
+gave every environment process a copy of all of that, even though an environment
+only needs numpy, scipy, shapely, and its own dynamics. (Using 'spawn' instead would
+re-run main.py, and therefore import Tensorflow, in every environment process.)
+
+Instead, EnvironmentWorker launches this file as a fresh interpreter:
+    python environment_worker.py <environment> <agent number> <file descriptor> [CPU cores]
+which imports only environment_<environment>.py and runs its run() loop. The agent
+and the environment talk over one end each of a multiprocessing.Pipe, wrapped in
+ConnectionQueue so that both of them use it exactly as they used the two Queues.
+
+Each worker prints how much memory it uses once its environment is built, and
+main.py periodically reports the memory of all workers alongside its own.
+
+This module deliberately does not import settings.py (or anything that does).
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import os
+import sys
+import signal
+import resource
+import importlib
+import subprocess
+import multiprocessing
+import multiprocessing.connection
+
+class ConnectionQueue:
+    # One end of a Pipe with the put() and get() of a Queue. The agent and environment
+    # strictly take turns, so one duplex connection replaces both Queues.
+    def __init__(self, connection):
+        self.connection = connection
+
+    def put(self, item):
+        self.connection.send(item)
+
+    def get(self):
+        return self.connection.recv()
+
+
+class EnvironmentWorker:
+    # Used by main.py in place of an Environment. Behaves like the Environment and
+    # its multiprocessing.Process: generate_queue() for the agent and start() to launch it.
+
+    def __init__(self, environment, n_agent, cpus = None):
+        self.environment = environment # e.g., 'manipulator'
+        self.n_agent     = n_agent
+        self.cpus        = cpus # CPU cores to pin the worker to, or None
+        self.process     = None
+
+        # The agent keeps one end, the worker gets the other
+        self.agent_connection, self.worker_connection = multiprocessing.Pipe()
+
+    def generate_queue(self):
+        # Generate the queues responsible for communicating with the agent.
+        # Both directions go through the same connection.
+        self.agent_to_env = ConnectionQueue(self.agent_connection)
+        self.env_to_agent = self.agent_to_env
+
+        return self.agent_to_env, self.env_to_agent
+
+    def start(self):
+        # Launch the worker as a fresh interpreter that inherits only its end of the Pipe
+        file_descriptor = self.worker_connection.fileno()
+        arguments = [sys.executable, os.path.abspath(__file__), self.environment, str(self.n_agent), str(file_descriptor)]
+        if self.cpus is not None:
+            arguments.append(','.join(str(cpu) for cpu in self.cpus))
+        self.process = subprocess.Popen(arguments, pass_fds = (file_descriptor,))
+
+        # The worker has its own copy now. Closing ours means the worker sees the
+        # connection close (and exits) when main.py ends.
+        self.worker_connection.close()
+
+    def resident_memory(self):
+        # Returns how much memory [bytes] the worker is currently using, or 0 if it isn't running
+        import psutil # only needed in main.py's process
+        try:
+            return psutil.Process(self.process.pid).memory_info().rss
+        except (AttributeError, psutil.Error):
+            return 0
+
+
+def run_worker(environment, n_agent, file_descriptor, cpus = None):
+    # Builds the environment and runs it until main.py ends
+
+    # Pin this worker to its CPU cores, if desired
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+
+    # Ctrl + C is handled by main.py. Ignore it from the start, since the environment
+    # only starts ignoring it once it begins running.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    connection = multiprocessing.connection.Connection(file_descriptor)
+
+    # Build the environment and connect it to the agent
+    environment_file = importlib.import_module('environment_' + environment)
+    env = environment_file.Environment()
+    env.agent_to_env = ConnectionQueue(connection)
+    env.env_to_agent = env.agent_to_env
+
+    # Report how much memory this worker needs (ru_maxrss is in kilobytes on Linux)
+    print("Environment worker %i (pid %i) is ready and using %.1f MB of RAM" %(n_agent, os.getpid(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1000.))
+
+    try:
+        env.run()
+    except (EOFError, OSError):
+        # main.py has ended and closed the connection
+        pass
+
+
+if __name__ == '__main__':
+    cpus = [int(cpu) for cpu in sys.argv[4].split(',')] if len(sys.argv) > 4 else None
+    run_worker(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), cpus)
@@ -0,0 +1,402 @@
+"""
+Renders episode videos in the background, in parallel.
+
+Previously, agent 1 called render() from environment_manipulator.py at the end of
+each rendered episode. render() drew every frame with FuncAnimation (redrawing the
+whole figure each frame) and encoded the mp4 with animator.save(), all in agent 1's
+thread, so agent 1 collected no data for the whole encode.
+
+Now, the agent hands the episode to an EpisodeRenderer, which only queues it and
+returns immediately. If RENDER_QUEUE_SIZE videos are already waiting, the episode
+is skipped rather than making the agent wait. The queued episodes are sent to a
+render server, which this file runs as a fresh interpreter (like environment_worker.py):
+    python episode_renderer.py <environment> <render processes> <file descriptor>
+For each episode, the render server:
+    1) Calculates everything that is drawn (the chaser, target, and manipulator
+       outlines and all the text) for every frame at once, as arrays.
+    2) Splits the frames into chunks that a pool of RENDER_PROCESSES processes draw.
+       Each process draws its figure's background once and then only redraws the
+       parts that move (blitting).
+    3) Pipes the raw frames, in order, to one ffmpeg process that encodes the mp4.
+The videos are saved where render() saved them: <save_directory><filename>/videos/episode_<n>.mp4
+
+Episodes still waiting in the queue when main.py ends are not rendered. The one
+being rendered is finished.
+
+This module deliberately does not import settings.py (or anything that does) at the
+top, so the render server and its processes stay light.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import os
+import sys
+import time
+import queue
+import shutil
+import signal
+import importlib
+import threading
+import subprocess
+import multiprocessing
+import multiprocessing.connection
+import numpy as np
+
+FFMPEG           = 'ffmpeg' # the ffmpeg executable
+FPS              = 30 # frames per second of the videos
+DPI              = 100 # the figure is 5 x 4 inches, as in render()
+FRAMES_PER_CHUNK = 25 # frames each render process draws at a time
+
+class EpisodeRenderer:
+    # Used by main.py and agent 1. start() launches the render server, and render() queues
+    # an episode, taking the same arguments as render() in environment_manipulator.py.
+
+    def __init__(self, environment, render_processes, queue_size):
+        self.environment      = environment # e.g., 'manipulator'
+        self.render_processes = render_processes
+        self.process          = None
+
+        # Episodes waiting to be sent to the render server
+        self.episodes = queue.Queue(maxsize = queue_size)
+
+        # The render server gets the receiving end, this end sends the episodes
+        self.server_connection, self.agent_connection = multiprocessing.Pipe(duplex = False)
+
+    def start(self):
+        # Launch the render server as a fresh interpreter that inherits only its end of the Pipe
+        file_descriptor = self.server_connection.fileno()
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), self.environment, str(self.render_processes), str(file_descriptor)], pass_fds = (file_descriptor,))
+        self.server_connection.close()
+
+        # Sending waits for the render server to read each episode, so it's done in its own thread
+        threading.Thread(target = self.send_episodes, daemon = True).start()
+
+    def render(self, *render_arguments):
+        # Queue an episode to be rendered, without waiting. Returns whether it was queued.
+        try:
+            self.episodes.put_nowait(render_arguments)
+            return True
+        except queue.Full:
+            print("Renderer is busy. Skipping the animation of episode %i" %render_arguments[9])
+            return False
+
+    def send_episodes(self):
+        # Sends each queued episode to the render server, which reads the next one once it's done with the last
+        while True:
+            render_arguments = self.episodes.get()
+            try:
+                self.agent_connection.send(render_arguments)
+            except OSError:
+                print("The render server has stopped. No more animations will be rendered.")
+                return
+
+
+#####################################
+##### Calculating what is drawn #####
+#####################################
+def make_frame_data(env, states, actions, instantaneous_reward_log, cumulative_reward_log, critic_distributions, target_critic_distributions, projected_target_distribution, bins, loss_log, episode_number, time_log, timestep_where_docking_occurred):
+    # Returns (figure_data, frame_data): what's needed to build the figure, and {name: array with one entry per frame}
+    # of everything that changes between frames. This is the same geometry render() calculates.
+    number_of_frames = len(states)
+    LENGTH = env.LENGTH
+
+    # Unpacking state from TOTAL_STATE
+    chaser_x, chaser_y, chaser_theta, theta_1, theta_2, theta_3 = states[:,0], states[:,1], states[:,2], states[:,6], states[:,7], states[:,8]
+    target_x, target_y, target_theta = states[:,12], states[:,13], states[:,14]
+
+    # Manipulator joint locations (Inertial): shoulder, elbow, wrist, end-effector
+    link_angles  = np.pi/2 + chaser_theta[:, None] + np.cumsum(np.stack([theta_1, theta_2, theta_3], axis = 1), axis = 1) # [frames, 3]
+    link_lengths = np.array([env.A1 + env.B1, env.A2 + env.B2, env.A3 + env.B3])
+    shoulder     = np.stack([chaser_x + env.B0*np.cos(chaser_theta + env.PHI), chaser_y + env.B0*np.sin(chaser_theta + env.PHI)], axis = 1) # [frames, 2]
+    joints       = shoulder[:, :, None] + np.concatenate([np.zeros([number_of_frames, 2, 1]), np.cumsum(link_lengths*np.stack([np.cos(link_angles), np.sin(link_angles)], axis = 1), axis = 2)], axis = 2) # [frames, 2, 4]
+
+    # Chaser and target outlines, rotated from the body frame into the inertial frame
+    chaser_points_body = np.array([[ LENGTH/2,-LENGTH/2],
+                                   [-LENGTH/2,-LENGTH/2],
+                                   [-LENGTH/2, LENGTH/2],
+                                   [ LENGTH/2, LENGTH/2]]).T
+    target_points_body = np.array([[ LENGTH/2,-LENGTH/2],
+                                   [-LENGTH/2,-LENGTH/2],
+                                   [-LENGTH/2, LENGTH/2],
+                                   [ LENGTH/2, LENGTH/2],
+                                   [env.DOCKING_PORT_MOUNT_POSITION[0], LENGTH/2], # artificially adding this to make the docking cone look better
+                                   [env.DOCKING_PORT_MOUNT_POSITION[0], env.DOCKING_PORT_MOUNT_POSITION[1]],
+                                   [env.DOCKING_PORT_CORNER1_POSITION[0], env.DOCKING_PORT_CORNER1_POSITION[1]],
+                                   [env.DOCKING_PORT_CORNER2_POSITION[0], env.DOCKING_PORT_CORNER2_POSITION[1]],
+                                   [env.DOCKING_PORT_MOUNT_POSITION[0], env.DOCKING_PORT_MOUNT_POSITION[1]]]).T
+    front_face_body = np.array([[ LENGTH/2, LENGTH/2],
+                                [ LENGTH/2,-LENGTH/2]])
+
+    def to_inertial(points_body, x, y, theta):
+        # [frames, 2, points]
+        C_Ib = np.moveaxis(np.array([[np.cos(theta), -np.sin(theta)],
+                                     [np.sin(theta),  np.cos(theta)]]), source = 2, destination = 0)
+        return np.matmul(C_Ib, points_body) + np.stack([x, y], axis = 1)[:, :, None]
+
+    # Commanded and true accelerations (numerically differentiated), with a row of zeros for the first timestep
+    velocities = np.concatenate([states[:,3:6], states[:,9:12]], axis = 1)
+    accelerations = np.concatenate([np.zeros([1, env.ACTION_SIZE]), np.diff(velocities, axis = 0)/env.TIMESTEP])
+    actions = np.concatenate([np.zeros([1, env.ACTION_SIZE]), actions])[:number_of_frames]
+
+    # The final combined angular rate, using the final velocities at the docking timestep
+    env.chaser_position   = states[timestep_where_docking_occurred, 0:3]
+    env.arm_angles        = states[timestep_where_docking_occurred, 6:9]
+    env.chaser_velocity   = states[-1, 3:6]
+    env.arm_angular_rates = states[-1, 9:12]
+    env.target_position   = states[timestep_where_docking_occurred, 12:15]
+    env.target_velocity   = states[-1, 15:18]
+    env.update_end_effector_and_docking_locations()
+    env.update_end_effector_location_body_frame()
+    env.update_relative_pose_body_frame()
+    env.check_collisions()
+    docked = env.docked
+    combined_angular_velocity = env.combined_angular_momentum()[1]
+
+    # Text. Once docked, the combined angular rate replaces the target's from the docking frame onwards.
+    target_initial_omega = states[0,17]*180/np.pi
+    angular_rate_text = np.array(['Target angular rate = %.2f deg/s' %target_initial_omega]*number_of_frames, dtype = object)
+    if docked:
+        angular_rate_text[timestep_where_docking_occurred % number_of_frames:] = 'Combined angular rate = %.2f deg/s' %combined_angular_velocity
+    control_labels = [r'$\ddot{x}$ = %6.3f; true = %6.3f', r'$\ddot{y}$ = %6.3f; true = %6.3f', r'$\ddot{\theta}$ = %1.3f; true = %6.3f',
+                      r'$\ddot{q_0}$ = %6.3f; true = %6.3f', r'$\ddot{q_1}$ = %6.3f; true = %6.3f', r'$\ddot{q_2}$ = %6.3f; true = %6.3f']
+
+    frame_data = {'chaser_body':       to_inertial(chaser_points_body, chaser_x, chaser_y, chaser_theta),
+                  'chaser_front_face': to_inertial(front_face_body, chaser_x, chaser_y, chaser_theta),
+                  'target_body':       to_inertial(target_points_body, target_x, target_y, target_theta),
+                  'target_front_face': to_inertial(front_face_body, target_x, target_y, target_theta),
+                  'manipulator':       joints,
+                  'time_text':         np.array(['Time = %.1f s' %each_time for each_time in time_log], dtype = object),
+                  'reward_text':       np.array(['Total reward = %.1f' %each_reward for each_reward in cumulative_reward_log[:number_of_frames]], dtype = object),
+                  'angular_rate_text': angular_rate_text,
+                  'control_text':      np.array([[label %(actions[frame, i], accelerations[frame, i]) for i, label in enumerate(control_labels)] for frame in range(number_of_frames)], dtype = object)}
+
+    figure_data = {'extra_information': env.ADDITIONAL_VALUE_INFO,
+                   'max_x_position':    env.MAX_X_POSITION,
+                   'max_y_position':    env.MAX_Y_POSITION,
+                   'episode_number':    episode_number}
+
+    if env.ADDITIONAL_VALUE_INFO:
+        # The axes limits need the whole episode, so they're calculated here rather than by each render process
+        frame_data['instantaneous_reward']          = np.asarray(instantaneous_reward_log)[:number_of_frames]
+        frame_data['loss']                          = np.asarray(loss_log)[:number_of_frames]
+        frame_data['critic_distributions']          = np.asarray(critic_distributions)[:number_of_frames]
+        frame_data['target_critic_distributions']   = np.asarray(target_critic_distributions)[:number_of_frames]
+        frame_data['projected_target_distribution'] = np.asarray(projected_target_distribution)[:number_of_frames]
+        figure_data['bins']          = bins
+        figure_data['reward_limits'] = (np.min(instantaneous_reward_log), np.max(instantaneous_reward_log))
+        figure_data['loss_limits']   = (np.min(loss_log), np.max(loss_log))
+
+    return figure_data, frame_data
+
+
+##############################
+##### Drawing the frames #####
+##############################
+# Each render process keeps the figure of the episode it's drawing, so it only builds it once per episode
+_current_figure = (None, None)
+
+def build_figure(figure_data):
+    # Builds the figure exactly as render() does, and returns (figure, background, artists) where artists
+    # maps the name of everything that changes between frames to its (axes, artist or list of artists)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.gridspec as gridspec
+
+    figure = plt.figure(constrained_layout = True)
+    figure.set_size_inches(5, 4, True)
+    figure.set_dpi(DPI)
+
+    if figure_data['extra_information']:
+        bins = figure_data['bins']
+        reward_min, reward_max = figure_data['reward_limits']
+        loss_min, loss_max     = figure_data['loss_limits']
+        grid_spec = gridspec.GridSpec(nrows = 2, ncols = 3, figure = figure)
+        subfig1 = figure.add_subplot(grid_spec[0,0], aspect = 'equal', autoscale_on = False, xlim = (0, 3.5), ylim = (0, 2.4))
+        subfig2 = figure.add_subplot(grid_spec[0,1], xlim = (np.min([reward_min, 0]) - (reward_max - reward_min)*0.02, np.max([reward_max, 0]) + (reward_max - reward_min)*0.02), ylim = (-0.5, 0.5))
+        subfig3 = figure.add_subplot(grid_spec[0,2], xlim = (loss_min-0.01, loss_max+0.01), ylim = (-0.5, 0.5))
+        subfig4 = figure.add_subplot(grid_spec[1,0], ylim = (0, 1.02))
+        subfig5 = figure.add_subplot(grid_spec[1,1], ylim = (0, 1.02))
+        subfig6 = figure.add_subplot(grid_spec[1,2], ylim = (0, 1.02))
+
+        # Setting titles
+        subfig1.set_xlabel("X Position (m)",    fontdict = {'fontsize': 8})
+        subfig1.set_ylabel("Y Position (m)",    fontdict = {'fontsize': 8})
+        subfig2.set_title("Timestep Reward",    fontdict = {'fontsize': 8})
+        subfig3.set_title("Current loss",       fontdict = {'fontsize': 8})
+        subfig4.set_title("Q-dist",             fontdict = {'fontsize': 8})
+        subfig5.set_title("Target Q-dist",      fontdict = {'fontsize': 8})
+        subfig6.set_title("Bellman projection", fontdict = {'fontsize': 8})
+
+        # Changing around the axes
+        subfig1.tick_params(labelsize = 8)
+        subfig2.tick_params(which = 'both', left = False, labelleft = False, labelsize = 8)
+        subfig3.tick_params(which = 'both', left = False, labelleft = False, labelsize = 8)
+        for subfig in [subfig4, subfig5, subfig6]:
+            subfig.tick_params(which = 'both', left = False, labelleft = False, right = True, labelright = subfig is subfig6, labelsize = 8)
+            subfig.grid(True)
+            subfig.set_xticks([bins[i*5] for i in range(round(len(bins)/5) + 1)])
+            subfig.tick_params(axis = 'x', labelrotation = -90)
+            subfig.set_yticks([0, 0.2, 0.4, 0.6, 0.8, 1.])
+
+        # Setting appropriate axes ticks
+        subfig2.set_xticks([reward_min, 0, reward_max] if np.sign(reward_min) != np.sign(reward_max) else [reward_min, reward_max])
+        subfig3.set_xticks([loss_min, loss_max])
+    else:
+        subfig1 = figure.add_subplot(1, 1, 1, aspect = 'equal', autoscale_on = False, xlim = (0, figure_data['max_x_position']), ylim = (0, figure_data['max_y_position']), xlabel = 'X Position (m)', ylabel = 'Y Position (m)')
+
+    # Everything that changes between frames
+    artists = {'chaser_body':       (subfig1, subfig1.plot([], [], color = 'r', linestyle = '-', linewidth = 2)[0]),
+               'chaser_front_face': (subfig1, subfig1.plot([], [], color = 'k', linestyle = '-', linewidth = 2)[0]),
+               'target_body':       (subfig1, subfig1.plot([], [], color = 'g', linestyle = '-', linewidth = 2)[0]),
+               'target_front_face': (subfig1, subfig1.plot([], [], color = 'k', linestyle = '-', linewidth = 2)[0]),
+               'manipulator':       (subfig1, subfig1.plot([], [], color = 'r', linestyle = '-', linewidth = 2)[0])}
+
+    if figure_data['extra_information']:
+        artists['time_text']                     = (subfig1, subfig1.text(x = 0.2, y = 0.91, s = '', fontsize = 8, transform = subfig1.transAxes))
+        artists['reward_text']                   = (subfig1, subfig1.text(x = 0.0, y = 1.02, s = '', fontsize = 8, transform = subfig1.transAxes))
+        artists['instantaneous_reward']          = (subfig2, list(subfig2.barh(y = 0, height = 0.2, width = 0)))
+        artists['loss']                          = (subfig3, list(subfig3.barh(y = 0, height = 0.2, width = 0)))
+        artists['critic_distributions']          = (subfig4, list(subfig4.bar(x = bins, height = np.zeros(shape = len(bins)), width = bins[1]-bins[0])))
+        artists['target_critic_distributions']   = (subfig5, list(subfig5.bar(x = bins, height = np.zeros(shape = len(bins)), width = bins[1]-bins[0])))
+        artists['projected_target_distribution'] = (subfig6, list(subfig6.bar(x = bins, height = np.zeros(shape = len(bins)), width = bins[1]-bins[0])))
+    else:
+        artists['time_text']         = (subfig1, subfig1.text(x = 0.03, y = 0.96, s = '', fontsize = 8, transform = subfig1.transAxes))
+        artists['reward_text']       = (subfig1, subfig1.text(x = 0.62, y = 0.96, s = '', fontsize = 8, transform = subfig1.transAxes))
+        artists['angular_rate_text'] = (subfig1, subfig1.text(x = 0.55, y = 0.90, s = '', fontsize = 8, transform = subfig1.transAxes))
+        artists['control_text']      = (subfig1, [subfig1.text(x = 0.01, y = y, s = '', fontsize = 6, transform = subfig1.transAxes) for y in [0.90, 0.85, 0.80, 0.75, 0.70, 0.65]])
+        subfig1.text(x = 0.40, y = 1.02, s = 'Episode ' + str(figure_data['episode_number']), fontsize = 8, transform = subfig1.transAxes)
+
+    # Draw everything that doesn't change once, and keep it as the background of every frame
+    for _, each_artist in artists.values():
+        for artist in (each_artist if isinstance(each_artist, list) else [each_artist]):
+            artist.set_animated(True)
+    figure.canvas.draw()
+    background = figure.canvas.copy_from_bbox(figure.bbox)
+
+    return figure, background, artists
+
+
+def draw_frames(chunk):
+    # Draws a chunk of frames of one episode. Returns the (width, height) of the frames and the raw RGBA bytes of each.
+    global _current_figure
+    episode_id, figure_data, frame_data = chunk
+
+    # Build the figure the first time this process sees this episode
+    if _current_figure[0] != episode_id:
+        if _current_figure[1] is not None:
+            import matplotlib.pyplot as plt
+            plt.close(_current_figure[1][0])
+        _current_figure = (episode_id, build_figure(figure_data))
+    figure, background, artists = _current_figure[1]
+    canvas = figure.canvas
+
+    frames = []
+    for frame in range(len(frame_data['time_text'])):
+        canvas.restore_region(background)
+
+        for name, (axes, artist) in artists.items():
+            value = frame_data[name][frame]
+            if name in ['chaser_body', 'chaser_front_face', 'target_body', 'target_front_face', 'manipulator']:
+                artist.set_data(value[0], value[1])
+            elif name == 'control_text':
+                for each_artist, text in zip(artist, value):
+                    each_artist.set_text(text)
+            elif name in ['instantaneous_reward', 'loss']:
+                artist[0].set_width(value)
+                if name == 'instantaneous_reward':
+                    artist[0].set_color('r' if value < 0 else 'g')
+            elif name in ['critic_distributions', 'target_critic_distributions', 'projected_target_distribution']:
+                for each_artist, new_value in zip(artist, value):
+                    each_artist.set_height(new_value)
+            else:
+                artist.set_text(value)
+
+            # Blit only what changed
+            for each_artist in (artist if isinstance(artist, list) else [artist]):
+                axes.draw_artist(each_artist)
+
+        frames.append(bytes(canvas.buffer_rgba()))
+
+    return canvas.get_width_height(), frames
+
+
+#####################################
+##### Running the render server #####
+#####################################
+def render_episode(pool, environment_file, states, actions, instantaneous_reward_log, cumulative_reward_log, critic_distributions, target_critic_distributions, projected_target_distribution, bins, loss_log, episode_number, filename, save_directory, time_log, timestep_where_docking_occurred = -1):
+    # Renders one episode to <save_directory><filename>/videos/episode_<episode_number>.mp4.
+    # Takes the same arguments as render(), plus the pool of render processes and the environment file.
+    start_time = time.time()
+
+    # A temporary environment, used to grab the physical parameters
+    env = environment_file.Environment()
+    env.reset(False)
+    figure_data, frame_data = make_frame_data(env, states, actions, instantaneous_reward_log, cumulative_reward_log, critic_distributions, target_critic_distributions, projected_target_distribution, bins, loss_log, episode_number, time_log, timestep_where_docking_occurred)
+    number_of_frames = len(states)
+
+    # Where the video goes. On Cedar, it's written to $SLURM_TMPDIR first and then moved.
+    video_filename = save_directory + filename + '/videos/episode_' + str(episode_number) + '.mp4'
+    os.makedirs(os.path.dirname(video_filename), exist_ok = True)
+    encode_filename = os.environ['SLURM_TMPDIR'] + '/episode_' + str(episode_number) + '.mp4' if env.ON_CEDAR else video_filename
+
+    # Split the frames into chunks for the render processes, each carrying only its own frames
+    episode_id = (filename, episode_number, start_time)
+    chunks = [(episode_id, figure_data, {name: values[first_frame:first_frame + FRAMES_PER_CHUNK] for name, values in frame_data.items()}) for first_frame in range(0, number_of_frames, FRAMES_PER_CHUNK)]
+
+    # The frame size is known once the first chunk is drawn
+    encoder = None
+    try:
+        for (width, height), frames in pool.imap(draw_frames, chunks):
+            if encoder is None:
+                encoder = subprocess.Popen([FFMPEG, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', '%ix%i' %(width, height), '-r', str(FPS), '-i', '-',
+                                            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', encode_filename], stdin = subprocess.PIPE)
+            for frame in frames:
+                encoder.stdin.write(frame)
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            raise RuntimeError("ffmpeg exited with code %i" %encoder.returncode)
+    except:
+        # Don't leave a partially completed video behind
+        if encoder is not None:
+            encoder.kill()
+        try:
+            os.remove(encode_filename)
+        except OSError:
+            pass
+        raise
+
+    if encode_filename != video_filename:
+        shutil.move(encode_filename, video_filename)
+
+    print("Rendered episode %i (%i frames) in %.1f s" %(episode_number, number_of_frames, time.time() - start_time))
+
+
+def run_server(environment, render_processes, file_descriptor):
+    # Renders each episode that is sent, until main.py ends
+
+    # Ctrl + C is handled by main.py. The episode being rendered is finished, and so are the render processes, which inherit this.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    connection = multiprocessing.connection.Connection(file_descriptor)
+    environment_file = importlib.import_module('environment_' + environment)
+    pool = multiprocessing.Pool(render_processes)
+
+    while True:
+        try:
+            render_arguments = connection.recv()
+        except (EOFError, OSError):
+            # main.py has ended and closed the connection
+            break
+
+        try:
+            render_episode(pool, environment_file, *render_arguments)
+        except Exception as error:
+            print("Skipping animation for episode %i due to an error: %s" %(render_arguments[9], error))
+
+    pool.close()
+    pool.join()
+
+
+if __name__ == '__main__':
+    run_server(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
@@ -0,0 +1,125 @@
+"""
+This Class builds the Evaluator, which calculates the q-distributions that are
+shown when an agent renders an episode.
+
+Previously, the learner checked for these requests every training iteration and
+calculated them in between training steps. Now, the Evaluator holds its own copy
+of the critic, target critic, and target actor in a separate graph and session.
+When an agent asks for an episode to be evaluated, the Evaluator takes a snapshot
+of the learner's current parameters and calculates everything itself. Training
+is never paused, and the agent gets its answer even while the learner is busy
+(e.g., saving a checkpoint).
+
+The Evaluator's session is limited to a single thread so that it stays out of
+the way of the learner and agents.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import tensorflow as tf
+import numpy as np
+import multiprocessing
+import queue # for empty error catching
+
+from build_neural_networks import BuildActorNetwork, BuildQNetwork
+from settings import Settings
+
+class Evaluator:
+    def __init__(self, sess, learner):
+        print("Initialising evaluator...")
+
+        # The learner's session and the parameters that will be snapshotted from it
+        self.learner_sess = sess
+        self.learner_parameters = learner.critic.parameters + learner.target_critic.parameters + learner.target_actor.parameters
+
+        # The reward options that the distributional critic predicts the liklihood of being in
+        self.bins = np.linspace(Settings.MIN_V, Settings.MAX_V, Settings.NUMBER_OF_BINS, dtype = np.float32)
+
+        # Build the evaluation networks in their own graph, always on the CPU
+        self.graph = tf.Graph()
+        with self.graph.as_default(), tf.device('/device:CPU:0'):
+            with tf.variable_scope("Preparing_placeholders"):
+                self.state_placeholder                       = tf.placeholder(dtype = tf.float32, shape = [None, Settings.OBSERVATION_SIZE], name = "state_placeholder")
+                self.action_placeholder                      = tf.placeholder(dtype = tf.float32, shape = [None, Settings.ACTION_SIZE], name = "action_placeholder")
+                self.target_bins_placeholder                 = tf.placeholder(dtype = tf.float32, shape = [None, Settings.NUMBER_OF_BINS], name = "target_bins_placeholder")
+                self.target_q_distribution_placeholder       = tf.placeholder(dtype = tf.float32, shape = [None, Settings.NUMBER_OF_BINS], name = "target_q_distribution_placeholder")
+                self.importance_sampling_weights_placeholder = tf.placeholder(dtype = tf.float32, shape = None, name = "importance_sampling_weights_placeholder")
+
+            # Same scopes as the learner so that the networks are identical
+            self.critic        = BuildQNetwork(self.state_placeholder, self.action_placeholder, scope='learner_critic_main')
+            self.target_critic = BuildQNetwork(self.state_placeholder, self.action_placeholder, scope='learner_critic_target')
+            self.target_actor  = BuildActorNetwork(self.state_placeholder, scope='learner_actor_target')
+
+            # Only the projected target distribution and the loss are used, the training operation never is
+            _, self.projected_target_distribution = self.critic.generate_training_function(self.target_q_distribution_placeholder, self.target_bins_placeholder, self.importance_sampling_weights_placeholder)
+
+            # Operation that loads a snapshot of the learner's parameters into these networks
+            self.parameters = self.critic.parameters + self.target_critic.parameters + self.target_actor.parameters
+            self.parameter_placeholders = [tf.placeholder(dtype = tf.float32, shape = parameter.shape) for parameter in self.parameters]
+            self.load_parameters = [parameter.assign(placeholder) for parameter, placeholder in zip(self.parameters, self.parameter_placeholders)]
+
+            initialize_parameters = tf.global_variables_initializer()
+
+        # Single-threaded so evaluations stay low-priority
+        config = tf.ConfigProto()
+        config.intra_op_parallelism_threads = 1
+        config.inter_op_parallelism_threads = 1
+        self.sess = tf.Session(graph = self.graph, config = config)
+        self.sess.run(initialize_parameters)
+
+        print("Evaluator created!")
+
+    def generate_queue(self):
+        # Generate the queues responsible for communicating with the agent
+        self.agent_to_evaluator = multiprocessing.Queue(maxsize = 1)
+        self.evaluator_to_agent = multiprocessing.Queue(maxsize = 1)
+
+        return self.agent_to_evaluator, self.evaluator_to_agent
+
+    def snapshot_learner_parameters(self):
+        # Copy the learner's current parameters into the evaluation networks
+        learner_parameters = self.learner_sess.run(self.learner_parameters)
+        self.sess.run(self.load_parameters, feed_dict = dict(zip(self.parameter_placeholders, learner_parameters)))
+
+    def run(self, stop_run_flag):
+        # Wait for evaluation requests from the agent until the run is stopped
+        print("Starting to run evaluator")
+
+        while not stop_run_flag.is_set():
+
+            # Check if the agent wants some q-distributions calculated
+            try:
+                state_log, action_log, next_state_log, reward_log, done_log, gamma_log = self.agent_to_evaluator.get(timeout = 1)
+            except queue.Empty:
+                # If queue was empty, check if we should stop and wait again
+                continue
+
+            # Use the most recent parameters
+            self.snapshot_learner_parameters()
+
+            # Reshapping
+            gamma_log = np.reshape(gamma_log,  [-1, 1])
+
+            # Get the online q-distribution
+            critic_distribution = self.sess.run(self.critic.q_distribution, feed_dict = {self.state_placeholder: state_log, self.action_placeholder: action_log}) # [episode length, number of bins]
+
+            # Clean next actions from the target actor
+            clean_next_actions = self.sess.run(self.target_actor.action_scaled, {self.state_placeholder:next_state_log}) # [episode length, num_actions]
+
+            # Get the target q-distribution
+            target_critic_distribution = self.sess.run(self.target_critic.q_distribution, feed_dict = {self.state_placeholder:next_state_log, self.action_placeholder:clean_next_actions}) # [episode length, number of bins]
+
+            # Create batch of bins [see the learner for a full description]
+            target_bins = np.repeat(np.expand_dims(self.bins, axis = 0), len(reward_log), axis = 0) # [episode length, number_of_bins]
+            target_bins[done_log, :] = 0.0
+            target_bins = np.expand_dims(reward_log, axis = 1) + (target_bins*gamma_log)
+
+            # Calculating the bellman distribution (r + gamma*target_q_distribution) and the loss at each timestep
+            weights_batch = np.ones(shape = len(reward_log))
+            projected_target_distribution, loss_log = self.sess.run([self.projected_target_distribution, self.critic.loss], feed_dict = {self.state_placeholder:state_log, self.action_placeholder:action_log, self.target_q_distribution_placeholder:target_critic_distribution, self.target_bins_placeholder:target_bins, self.importance_sampling_weights_placeholder:weights_batch})
+
+            # Send the results back to the agent
+            self.evaluator_to_agent.put((critic_distribution, target_critic_distribution, projected_target_distribution, loss_log))
+
+        self.sess.close()
+        print("Evaluator finished!")
@@ -0,0 +1,121 @@
+"""
+Writes the experiment data log to disk as it is produced, and reads it back.
+
+use_deep_guidance_arm.py used to keep every timestep's data in a list and only
+np.save it when the experiment stopped cleanly, so memory grew for the whole
+experiment and a crash lost everything. The ExperimentLogger instead:
+    1) Writes a .npy header with one named float64 field per column (the column
+       names are in the file itself), declaring zero rows.
+    2) Takes each row with log(), which only packs it into bytes and queues it,
+       so the guidance loop never waits on the disk.
+    3) Every SYNC_PERIOD, in a background thread, appends the queued rows, updates
+       the number of rows in the header (written at a fixed width so it can be
+       rewritten in place) and fsyncs. At most SYNC_PERIOD of data is lost in a crash.
+
+The file is a standard .npy file (with the same deep_guidance_data_*.txt name as
+before), so np.load() reads it as a structured array. load_experiment_log() returns
+it as the familiar [timesteps, columns] float64 array through a memory map, without
+copying it, and does the same for the logs saved before this logger existed. It also
+recovers rows that were written after the last header update.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import os
+import struct
+import threading
+import numpy as np
+from collections import deque
+
+SYNC_PERIOD = 1. # [s] how often the queued rows are written and synced to disk
+
+# The columns of the deep guidance data log
+DEEP_GUIDANCE_LOG_COLUMNS = ['Pi_time', 'deep_guidance_ax', 'deep_guidance_ay', 'deep_guidance_alpha', 'deep_guidance_shoulder', 'deep_guidance_elbow', 'deep_guidance_wrist',
+                             'red_x', 'red_y', 'red_theta', 'red_vx', 'red_vy', 'red_omega',
+                             'black_x', 'black_y', 'black_theta', 'black_vx', 'black_vy', 'black_omega',
+                             'shoulder_theta', 'elbow_theta', 'wrist_theta', 'shoulder_omega', 'elbow_omega', 'wrist_omega', 'docked']
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00' # .npy format version 1.0
+
+def make_header(dtype, number_of_rows):
+    # A .npy header whose length doesn't depend on number_of_rows, padded so the data starts on a 64-byte boundary
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%20i,), }" %(np.lib.format.dtype_to_descr(dtype), number_of_rows)
+    header += ' '*(-(len(NPY_MAGIC) + 2 + len(header) + 1) % 64) + '\n'
+    return NPY_MAGIC + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+class ExperimentLogger:
+
+    def __init__(self, filename, columns = DEEP_GUIDANCE_LOG_COLUMNS):
+        self.filename = filename
+        self.dtype = np.dtype([(column, '<f8') for column in columns])
+        self.number_of_columns = len(columns)
+        self.number_of_rows = 0 # rows written to the file so far
+
+        self.queued_rows = deque() # packed rows waiting to be written. Appending and popping are thread-safe.
+        self.stop_flag = threading.Event()
+
+        self.file = open(filename, 'wb')
+        self.file.write(make_header(self.dtype, 0))
+        self.sync()
+
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def log(self, row):
+        # Queue one row (a sequence of number_of_columns numbers) to be written
+        self.queued_rows.append(np.asarray(row, dtype = '<f8').tobytes())
+
+    def write_queued_rows(self):
+        # Append every queued row to the file, update the header, and sync it to disk
+        rows = []
+        while self.queued_rows:
+            rows.append(self.queued_rows.popleft())
+        if not rows:
+            return
+        self.file.write(b''.join(rows))
+        self.number_of_rows += len(rows)
+
+        # Rewrite the header with the new number of rows, then go back to the end for the next rows
+        self.file.seek(0)
+        self.file.write(make_header(self.dtype, self.number_of_rows))
+        self.file.seek(0, os.SEEK_END)
+        self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def run(self):
+        # Write the queued rows every SYNC_PERIOD until stopped
+        while not self.stop_flag.wait(SYNC_PERIOD):
+            self.write_queued_rows()
+
+    def close(self):
+        # Write the remaining rows and close the file. Returns the number of rows in it.
+        self.stop_flag.set()
+        self.thread.join()
+        self.write_queued_rows()
+        self.file.close()
+        return self.number_of_rows
+
+
+def load_experiment_log(filename):
+    # Returns the log as a read-only [timesteps, columns] float64 array, memory-mapped rather than read into memory.
+    # Works for logs from the ExperimentLogger and for the older logs that were np.save'd all at once.
+    with open(filename, 'rb') as log_file:
+        version = np.lib.format.read_magic(log_file)
+        read_array_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_array_header(log_file)
+        data_offset = log_file.tell()
+
+    if dtype.names is None:
+        # An older log: already a [timesteps, columns] array
+        return np.load(filename, mmap_mode = 'r')
+
+    # Use every complete row in the file, including any written after the header was last updated
+    number_of_rows = (os.path.getsize(filename) - data_offset)//dtype.itemsize
+    if number_of_rows == 0:
+        # An empty file can't be memory-mapped
+        return np.zeros([0, len(dtype.names)])
+    return np.memmap(filename, dtype = '<f8', mode = 'r', offset = data_offset, shape = (number_of_rows, len(dtype.names)))
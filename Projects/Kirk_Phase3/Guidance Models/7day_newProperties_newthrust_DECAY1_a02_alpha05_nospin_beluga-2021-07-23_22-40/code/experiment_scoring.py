@@ -0,0 +1,268 @@
+"""
+Scores a whole experiment log at once.
+
+analyze_experiment.py used to loop over every row of the log that
+use_deep_guidance_arm.py saves, copying the row into an Environment and calling
+update_end_effector_and_docking_locations(), update_end_effector_location_body_frame(),
+update_relative_pose_body_frame(), check_collisions(), reward_function(0), and is_done().
+With shapely doing the collision checks, that took seconds for a long experiment.
+
+score_experiment() does the same calculations on every row at once, with numpy arrays
+in place of shapely:
+    - points within the target and forbidden area are checked in the target's body frame
+    - the chaser/target overlap is checked with the separating axis theorem
+    - the docking and mid-way circles are checked against the same polygons shapely uses
+The Environment is only used for its physical properties and reward settings.
+
+As in analyze_experiment.py, each row is scored as if the environment had just been
+reset with test_time = False (so the joints are never past their limits and the
+mid-way reward is only given the first time).
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import numpy as np
+
+# Columns of the log saved by use_deep_guidance_arm.py
+TIME_COLUMN            = 0
+ACTION_COLUMNS         = slice(1, 7) # deep guidance Ax, Ay, alpha_base, alpha_shoulder, alpha_elbow, alpha_wrist
+CHASER_POSITION        = slice(7, 10) # Pi_red_x, Pi_red_y, Pi_red_theta
+CHASER_VELOCITY        = slice(10, 13) # Pi_red_Vx, Pi_red_Vy, Pi_red_omega
+TARGET_POSITION        = slice(13, 16) # Pi_black_x, Pi_black_y, Pi_black_theta
+TARGET_VELOCITY        = slice(16, 19) # Pi_black_Vx, Pi_black_Vy, Pi_black_omega
+ARM_ANGLES             = slice(19, 22) # shoulder_theta, elbow_theta, wrist_theta
+ARM_RATES              = slice(22, 25) # shoulder_omega, elbow_omega, wrist_omega
+DOCKED_COLUMN          = 25
+
+
+def make_C_Ib(angles):
+    # Rotation matrices (body -> inertial) for an array of angles. [T, 2, 2]
+    return np.stack([np.stack([np.cos(angles), -np.sin(angles)], axis = -1),
+                     np.stack([np.sin(angles),  np.cos(angles)], axis = -1)], axis = -2)
+
+
+def to_body_frame(points, positions, C_Ib):
+    # Expresses inertial points [T, 2] in the body frames at positions [T, 2]
+    return np.einsum('tji,tj->ti', C_Ib, points - positions)
+
+
+def points_within_polygon(points, vertices):
+    # Crossing number test of points [T, 2] against one closed polygon [M, 2] (first vertex repeated last)
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1, x2, y2 = vertices[:-1, 0], vertices[:-1, 1], vertices[1:, 0], vertices[1:, 1]
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        crossings = ((y1 > y) != (y2 > y)) & (x < (x2 - x1)*(y - y1)/(y2 - y1) + x1)
+    return np.sum(crossings, axis = 1) % 2 == 1
+
+
+def squares_intersect(corners_a, C_Ib_a, corners_b, C_Ib_b):
+    # Separating axis test between two squares at each row. Corners are [T, 4, 2] in the inertial frame.
+    # The candidate axes are the two edge directions of each square (the columns of C_Ib). Touching counts as intersecting.
+    axes = np.concatenate([np.swapaxes(C_Ib_a, 1, 2), np.swapaxes(C_Ib_b, 1, 2)], axis = 1) # [T, 4, 2]
+    projections_a = np.einsum('tcj,taj->tac', corners_a, axes) # [T, axes, corners]
+    projections_b = np.einsum('tcj,taj->tac', corners_b, axes)
+    separated = (projections_a.max(axis = 2) < projections_b.min(axis = 2)) | (projections_b.max(axis = 2) < projections_a.min(axis = 2))
+    return ~np.any(separated, axis = 1)
+
+
+def within_circle(offsets, radius, segments = 64):
+    # Whether offsets [T, 2] from a centre are within a circle made by shapely's Point.buffer(radius),
+    # which is really a regular polygon with a vertex at 0 rad. Its edges are closest to the centre midway between vertices.
+    half_segment = np.pi/segments
+    angle_from_edge_middle = np.arctan2(offsets[:, 1], offsets[:, 0]) % (2*half_segment) - half_segment
+    return np.linalg.norm(offsets, axis = 1)*np.cos(angle_from_edge_middle) < radius*np.cos(half_segment)
+
+
+def cross(a, b):
+    # z-component of the cross product of rows of planar vectors
+    return a[..., 0]*b[..., 1] - a[..., 1]*b[..., 0]
+
+
+def combined_angular_momentum(env, chaser_position, chaser_velocity, arm_angles, arm_rates, target_position, target_velocity):
+    # Environment.combined_angular_momentum() for every row at once. Returns the [T] combined angular momentum.
+    x, y, q0 = chaser_position.T
+    q1, q2, q3 = arm_angles.T
+    x_dot, y_dot, q0_dot = chaser_velocity.T
+    q1_dot, q2_dot, q3_dot = arm_rates.T
+
+    # Centres of mass of the chaser and its links
+    chaser_body_com = chaser_position[:, :2]
+    link1_com = np.stack([x + env.B0*np.cos(env.PHI + q0) + env.A1*np.cos(np.pi/2 + q0 + q1),
+                          y + env.B0*np.sin(env.PHI + q0) + env.A1*np.sin(np.pi/2 + q0 + q1)], axis = 1)
+    link2_com = link1_com + np.stack([env.B1*np.cos(np.pi/2 + q0 + q1) + env.A2*np.cos(np.pi/2 + q0 + q1 + q2),
+                                      env.B1*np.sin(np.pi/2 + q0 + q1) + env.A2*np.sin(np.pi/2 + q0 + q1 + q2)], axis = 1)
+    link3_com = link2_com + np.stack([env.B2*np.cos(np.pi/2 + q0 + q1 + q2) + env.A3*np.cos(np.pi/2 + q0 + q1 + q2 + q3),
+                                      env.B2*np.sin(np.pi/2 + q0 + q1 + q2) + env.A3*np.sin(np.pi/2 + q0 + q1 + q2 + q3)], axis = 1)
+    chaser_mass = env.MASS + env.M1 + env.M2 + env.M3
+    chaser_com = (env.MASS*chaser_body_com + env.M1*link1_com + env.M2*link2_com + env.M3*link3_com)/chaser_mass
+
+    # Link velocities, from the same Jacobians as make_jacobian_Jc1(), Jc2(), and Jc3()
+    L1 = env.A1 + env.B1
+    L2 = env.A2 + env.B2
+    v1 = np.stack([x_dot + (-env.B0*np.sin(env.PHI + q0) - env.A1*np.sin(np.pi/2 + q0 + q1))*q0_dot - env.A1*np.sin(np.pi/2 + q0 + q1)*q1_dot,
+                   y_dot + ( env.B0*np.cos(env.PHI + q0) + env.A1*np.cos(np.pi/2 + q0 + q1))*q0_dot + env.A1*np.cos(np.pi/2 + q0 + q1)*q1_dot], axis = 1)
+    S0, S1, S2 = np.sin(env.PHI + q0), np.sin(np.pi/2 + q0 + q1), np.sin(np.pi/2 + q0 + q1 + q2)
+    C0, C1, C2 = np.cos(env.PHI + q0), np.cos(np.pi/2 + q0 + q1), np.cos(np.pi/2 + q0 + q1 + q2)
+    v2 = np.stack([x_dot + (-env.B0*S0 - L1*S1 - env.A2*S2)*q0_dot + (-L1*S1 - env.A2*S2)*q1_dot - env.A2*S2*q2_dot,
+                   y_dot + ( env.B0*C0 + L1*C1 + env.A2*C2)*q0_dot + ( L1*C1 + env.A2*C2)*q1_dot + env.A2*C2*q2_dot], axis = 1)
+    S0, S1, S2, S3 = np.sin(env.PHI + q0), np.sin(env.PHI + q0 + q1), np.sin(env.PHI + q0 + q1 + q2), np.sin(env.PHI + q0 + q1 + q2 + q3)
+    C0, C1, C2, C3 = np.cos(env.PHI + q0), np.cos(env.PHI + q0 + q1), np.cos(env.PHI + q0 + q1 + q2), np.cos(env.PHI + q0 + q1 + q2 + q3)
+    v3 = np.stack([x_dot + (-env.B0*S0 - L1*S1 - L2*S2 - env.A3*S3)*q0_dot + (-L1*S1 - L2*S2 - env.A3*S3)*q1_dot + (-L2*S2 - env.A3*S3)*q2_dot - env.A3*S3*q3_dot,
+                   y_dot + ( env.B0*C0 + L1*C1 + L2*C2 + env.A3*C3)*q0_dot + ( L1*C1 + L2*C2 + env.A3*C3)*q1_dot + ( L2*C2 + env.A3*C3)*q2_dot + env.A3*C3*q3_dot], axis = 1)
+    omega1 = q0_dot + q1_dot
+    omega2 = omega1 + q2_dot
+    omega3 = omega2 + q3_dot
+
+    # Angular and linear momentum of the chaser about its centre of mass (with the same inertias and masses as the Environment)
+    total_angular_momentum_chaser_com = env.INERTIA*q0_dot + env.MASS*cross(chaser_body_com - chaser_com, chaser_velocity[:, :2]) + \
+                                        env.INERTIA1*omega1 + env.M1*cross(link1_com - chaser_com, v1) + \
+                                        env.INERTIA1*omega2 + env.M2*cross(link2_com - chaser_com, v2) + \
+                                        env.INERTIA1*omega3 + env.M3*cross(link3_com - chaser_com, v3)
+    total_linear_momentum_chaser = env.MASS*chaser_velocity[:, :2] + env.M1*(v1 + v2 + v3)
+
+    # Combined with the target, about the combined centre of mass
+    combined_com = (chaser_mass*chaser_com + env.TARGET_MASS*target_position[:, :2])/(chaser_mass + env.TARGET_MASS)
+    return total_angular_momentum_chaser_com + cross(chaser_com - combined_com, total_linear_momentum_chaser) + \
+           env.TARGET_INERTIA*target_velocity[:, 2] + cross(target_position[:, :2] - combined_com, env.TARGET_MASS*target_velocity[:, :2])
+
+
+def score_experiment(env, data):
+    # Scores every row of an experiment log [T, 26] with the Environment env's properties.
+    # Returns a dictionary of:
+    #     total_states       [T, TOTAL_STATE_SIZE] as make_total_state() would return at each row
+    #     actions            [T, ACTION_SIZE] the deep guidance commands
+    #     rewards            [T] reward_function(0) at each row
+    #     cumulative_rewards [T] the rewards summed until the episode would have been done
+    #     done_index         the first row where is_done() would be True, or -1
+    #     docking_index      the first row where the end-effector is docked, or -1
+    #     collisions         {name: [T] booleans} for each collision check, plus mid_way, docked, and chaser_on_table
+    chaser_position = data[:, CHASER_POSITION]
+    chaser_velocity = data[:, CHASER_VELOCITY]
+    target_position = data[:, TARGET_POSITION]
+    target_velocity = data[:, TARGET_VELOCITY]
+    arm_angles      = data[:, ARM_ANGLES]
+    arm_rates       = data[:, ARM_RATES]
+
+    #################################################
+    ##### End-effector, elbow, and docking port #####
+    #################################################
+    # Inertial frame (update_end_effector_and_docking_locations)
+    theta = chaser_position[:, 2]
+    link_angles = np.pi/2 + theta[:, None] + np.cumsum(arm_angles, axis = 1) # [T, 3] inertial angle of each link
+    link_rates  = chaser_velocity[:, 2:3] + np.cumsum(arm_rates, axis = 1) # [T, 3]
+    link_lengths = np.array([env.A1 + env.B1, env.A2 + env.B2, env.A3 + env.B3])
+
+    end_effector_position = chaser_position[:, :2] + env.B0*np.stack([np.cos(env.PHI + theta), np.sin(env.PHI + theta)], axis = 1) + \
+                            np.stack([np.sum(link_lengths*np.cos(link_angles), axis = 1), np.sum(link_lengths*np.sin(link_angles), axis = 1)], axis = 1)
+    end_effector_velocity = chaser_velocity[:, :2] + env.B0*chaser_velocity[:, 2:3]*np.stack([-np.sin(env.PHI + theta), np.cos(env.PHI + theta)], axis = 1) + \
+                            np.stack([-np.sum(link_lengths*np.sin(link_angles)*link_rates, axis = 1), np.sum(link_lengths*np.cos(link_angles)*link_rates, axis = 1)], axis = 1)
+    elbow_position = chaser_position[:, :2] + env.B0*np.stack([np.cos(env.PHI + theta), np.sin(env.PHI + theta)], axis = 1) + \
+                     link_lengths[0]*np.stack([np.cos(link_angles[:, 0]), np.sin(link_angles[:, 0])], axis = 1)
+
+    C_Ib_target = make_C_Ib(target_position[:, 2])
+    docking_port_position = target_position[:, :2] + np.einsum('tij,j->ti', C_Ib_target, env.DOCKING_PORT_MOUNT_POSITION)
+    docking_port_velocity = target_velocity[:, :2] + target_velocity[:, 2:3]*np.einsum('tij,j->ti', C_Ib_target, [-env.DOCKING_PORT_MOUNT_POSITION[1], env.DOCKING_PORT_MOUNT_POSITION[0]])
+
+    # Chaser's body frame (update_end_effector_location_body_frame). The sign of the first
+    # x velocity term matches the Environment.
+    body_link_angles = link_angles - theta[:, None]
+    body_link_rates  = np.cumsum(arm_rates, axis = 1)
+    end_effector_position_body = env.B0*np.array([np.cos(env.PHI), np.sin(env.PHI)]) + \
+                                 np.stack([np.sum(link_lengths*np.cos(body_link_angles), axis = 1), np.sum(link_lengths*np.sin(body_link_angles), axis = 1)], axis = 1)
+    end_effector_velocity_body = np.stack([link_lengths[0]*np.sin(body_link_angles[:, 0])*body_link_rates[:, 0] - np.sum((link_lengths*np.sin(body_link_angles)*body_link_rates)[:, 1:], axis = 1),
+                                           np.sum(link_lengths*np.cos(body_link_angles)*body_link_rates, axis = 1)], axis = 1)
+
+    # Relative pose (update_relative_pose_body_frame)
+    relative_position_inertial = target_position[:, :2] - chaser_position[:, :2]
+    relative_angle = (target_position[:, 2] - chaser_position[:, 2]) % (2*np.pi)
+
+    total_states = np.column_stack([chaser_position[:, :2], chaser_position[:, 2] % (2*np.pi), chaser_velocity, arm_angles, arm_rates,
+                                    target_position[:, :2], target_position[:, 2] % (2*np.pi), target_velocity,
+                                    end_effector_position, end_effector_velocity, relative_position_inertial, relative_angle,
+                                    end_effector_position_body, end_effector_velocity_body])
+
+    ##############################
+    ##### Collision checking #####
+    ##############################
+    # End-effector and elbow in the target's body frame, where the target is a square and the forbidden area is fixed
+    end_effector_target_body = to_body_frame(end_effector_position, target_position[:, :2], C_Ib_target)
+    elbow_target_body        = to_body_frame(elbow_position, target_position[:, :2], C_Ib_target)
+    forbidden_area_body      = np.array([[env.LENGTH/2, env.LENGTH/2],
+                                         env.DOCKING_PORT_CORNER1_POSITION,
+                                         env.DOCKING_PORT_MOUNT_POSITION,
+                                         env.DOCKING_PORT_CORNER2_POSITION,
+                                         [-env.LENGTH/2, env.LENGTH/2],
+                                         [env.LENGTH/2, env.LENGTH/2]])
+
+    # Chaser and target corners in the inertial frame
+    square_body = np.array([[ env.LENGTH/2,-env.LENGTH/2],
+                            [-env.LENGTH/2,-env.LENGTH/2],
+                            [-env.LENGTH/2, env.LENGTH/2],
+                            [ env.LENGTH/2, env.LENGTH/2]])
+    C_Ib_chaser = make_C_Ib(chaser_position[:, 2])
+    chaser_corners = chaser_position[:, None, :2] + np.einsum('tij,cj->tci', C_Ib_chaser, square_body)
+    target_corners = target_position[:, None, :2] + np.einsum('tij,cj->tci', C_Ib_target, square_body)
+
+    no_collision = np.zeros(len(data), dtype = bool)
+    collisions = {}
+    collisions['end_effector_collision']   = np.all(np.abs(end_effector_target_body) < env.LENGTH/2, axis = 1) if env.CHECK_END_EFFECTOR_COLLISION else no_collision
+    collisions['forbidden_area_collision'] = points_within_polygon(end_effector_target_body, forbidden_area_body) if env.CHECK_END_EFFECTOR_FORBIDDEN else no_collision
+    collisions['chaser_target_collision']  = squares_intersect(chaser_corners, C_Ib_chaser, target_corners, C_Ib_target) if env.CHECK_CHASER_TARGET_COLLISION else no_collision
+    collisions['elbow_target_collision']   = np.all(np.abs(elbow_target_body) < env.LENGTH/2, axis = 1) if env.CHECK_END_EFFECTOR_COLLISION else no_collision
+
+    # Mid-way or docked, and on the table
+    docking_offset = end_effector_position - docking_port_position
+    collisions['mid_way']         = within_circle(docking_offset, env.MID_WAY_REWARD_RADIUS) if env.GIVE_MID_WAY_REWARD else no_collision
+    collisions['docked']          = within_circle(docking_offset, env.SUCCESSFUL_DOCKING_RADIUS)
+    collisions['chaser_on_table'] = np.all((chaser_corners >= 0) & (chaser_corners <= [env.MAX_X_POSITION, env.MAX_Y_POSITION]), axis = (1, 2))
+
+    ###################
+    ##### Rewards #####
+    ###################
+    # (reward_function)
+    docked = collisions['docked']
+    rewards = np.zeros(len(data))
+    if np.any(docked):
+        end_effector_angle_inertial = chaser_position[:, 2] + np.sum(arm_angles, axis = 1) + np.pi/2
+        docking_cone_angle_body = np.arctan2(env.DOCKING_PORT_CORNER1_POSITION[1] - env.DOCKING_PORT_CORNER2_POSITION[1], env.DOCKING_PORT_CORNER1_POSITION[0] - env.DOCKING_PORT_CORNER2_POSITION[0])
+        docking_angle_error = (docking_cone_angle_body + target_position[:, 2] - np.pi/2 - end_effector_angle_inertial + np.pi) % (2*np.pi) - np.pi
+        end_effector_angular_velocity = chaser_velocity[:, 2] + np.sum(arm_rates, axis = 1)
+        docking_reward = env.DOCKING_REWARD - \
+                         np.abs(np.sin(docking_angle_error/2))*env.MAX_DOCKING_ANGLE_PENALTY - \
+                         np.maximum(0, np.linalg.norm(end_effector_velocity - docking_port_velocity, axis = 1) - env.ALLOWED_EE_COLLISION_VELOCITY)*env.DOCKING_EE_VELOCITY_PENALTY - \
+                         np.maximum(0, np.abs(end_effector_angular_velocity - target_velocity[:, 2]) - env.ALLOWED_EE_COLLISION_ANGULAR_VELOCITY)*env.DOCKING_ANGULAR_VELOCITY_PENALTY - \
+                         env.ANGULAR_MOMENTUM_PENALTY*np.abs(combined_angular_momentum(env, chaser_position, chaser_velocity, arm_angles, arm_rates, target_position, target_velocity))/env.AT_MAX_ANGULAR_MOMENTUM
+        rewards += np.where(docked, docking_reward, 0.)
+
+    # The mid-way reward is only given the first time
+    if np.any(collisions['mid_way']):
+        rewards[np.argmax(collisions['mid_way'])] += env.MID_WAY_REWARD
+
+    rewards -= collisions['chaser_target_collision']*env.TARGET_COLLISION_PENALTY
+    rewards -= (collisions['end_effector_collision'].astype(int) + collisions['forbidden_area_collision'] + collisions['elbow_target_collision'])*env.END_EFFECTOR_COLLISION_PENALTY
+
+    fell = ~collisions['chaser_on_table'] | (np.abs(chaser_position[:, 2]) > 6*np.pi)
+    if env.END_ON_FALL:
+        rewards -= fell*env.FALL_OFF_TABLE_PENALTY
+
+    #############################
+    ##### When we'd be done #####
+    #############################
+    # (is_done)
+    done = docked | (fell & env.END_ON_FALL)
+    if env.END_ON_COLLISION:
+        done |= collisions['end_effector_collision'] | collisions['forbidden_area_collision'] | collisions['chaser_target_collision'] | collisions['elbow_target_collision']
+    done_index = int(np.argmax(done)) if np.any(done) else -1
+
+    # Rewards stop accumulating after the row where we're done
+    cumulative_rewards = np.cumsum(rewards)
+    if done_index >= 0:
+        cumulative_rewards[done_index + 1:] = cumulative_rewards[done_index]
+
+    return {'total_states':       total_states,
+            'actions':            data[:, ACTION_COLUMNS],
+            'rewards':            rewards,
+            'cumulative_rewards': cumulative_rewards,
+            'done_index':         done_index,
+            'docking_index':      int(np.argmax(docked)) if np.any(docked) else -1,
+            'collisions':         collisions}
@@ -0,0 +1,89 @@
+"""
+Exports the trained policy as a frozen policy (frozen_policy.py) for use on the
+Nvidia Jetson TX2 board.
+
+The actor is loaded from the latest checkpoint in CHECKPOINT_DIRECTORY and its
+weights, together with the normalization constants and action bounds in
+settings.py, are saved to FROZEN_POLICY_FILENAME in the same folder. The frozen
+policy is then loaded back and checked against the Tensorflow actor on
+NUMBER_OF_CHECKS random observations.
+
+Run this once after training, and copy the .npz file along with the code to the
+Jetson. use_deep_guidance_arm.py loads it instead of the full checkpoint.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from build_neural_networks import BuildActorNetwork
+from frozen_policy import FrozenPolicy, FROZEN_POLICY_FILENAME
+from settings import Settings
+
+CHECKPOINT_DIRECTORY = '../' # the policy is loaded from the latest checkpoint here, and the frozen policy is saved here
+NUMBER_OF_CHECKS     = 1000 # random observations run through both policies
+TOLERANCE            = 1e-4 # largest allowable difference between their actions, relative to the action range
+
+# The frozen policy only handles fully-connected actors that use the current state alone
+if Settings.LEARN_FROM_PIXELS or Settings.AUGMENT_STATE_WITH_ACTION_LENGTH > 0:
+    print("The frozen policy does not support LEARN_FROM_PIXELS or AUGMENT_STATE_WITH_ACTION_LENGTH > 0\n\nQuitting.")
+    raise SystemExit
+
+
+#%%
+#####################################
+##### Loading the trained actor #####
+#####################################
+state_placeholder = tf.placeholder(dtype = tf.float32, shape = [None, Settings.OBSERVATION_SIZE], name = "state_placeholder")
+policy = BuildActorNetwork(state_placeholder, scope = 'learner_actor_main')
+sess = tf.Session()
+
+ckpt = tf.train.get_checkpoint_state(CHECKPOINT_DIRECTORY)
+if ckpt is None:
+    print("No checkpoint found in %s... :(" %CHECKPOINT_DIRECTORY)
+    raise SystemExit
+tf.train.Saver(var_list = policy.parameters).restore(sess, ckpt.model_checkpoint_path)
+print("Model %s successfully loaded!" %ckpt.model_checkpoint_path)
+
+
+#%%
+####################################
+##### Saving the frozen policy #####
+####################################
+# The parameters are in the order they were built: kernel and bias of each layer, ending with the output layer
+parameters = sess.run(policy.parameters)
+frozen_policy = {'number_of_layers':   len(parameters)//2,
+                 'state_mean':         Settings.STATE_MEAN,
+                 'state_half_range':   Settings.STATE_HALF_RANGE,
+                 'normalize_state':    Settings.NORMALIZE_STATE,
+                 'irrelevant_states':  np.asarray(Settings.IRRELEVANT_STATES, dtype = np.int64),
+                 'lower_action_bound': Settings.LOWER_ACTION_BOUND,
+                 'upper_action_bound': Settings.UPPER_ACTION_BOUND,
+                 'checkpoint':         ckpt.model_checkpoint_path}
+for i in range(len(parameters)//2):
+    frozen_policy['weights_%i' %i] = parameters[2*i]
+    frozen_policy['biases_%i' %i]  = parameters[2*i + 1]
+
+np.savez(CHECKPOINT_DIRECTORY + FROZEN_POLICY_FILENAME, **frozen_policy)
+print("Frozen policy saved to %s" %(CHECKPOINT_DIRECTORY + FROZEN_POLICY_FILENAME))
+
+
+#%%
+######################################
+##### Checking the frozen policy #####
+######################################
+frozen = FrozenPolicy(CHECKPOINT_DIRECTORY + FROZEN_POLICY_FILENAME)
+
+# Normalized observations are roughly within [-1, 1]; go a bit beyond to cover the states seen in experiments
+observations = np.random.uniform(-1.5, 1.5, size = [NUMBER_OF_CHECKS, Settings.OBSERVATION_SIZE])
+tensorflow_actions = sess.run(policy.action_scaled, feed_dict = {state_placeholder: observations})
+frozen_actions = frozen.action(observations)
+sess.close()
+
+largest_difference = np.max(np.abs(tensorflow_actions - frozen_actions)/Settings.ACTION_RANGE)
+print("Largest difference between the Tensorflow and frozen policies: %.2e of the action range" %largest_difference)
+if largest_difference > TOLERANCE:
+    print("The frozen policy does not match the trained policy! Do not use it.")
+    raise SystemExit(1)
+print("Done!")
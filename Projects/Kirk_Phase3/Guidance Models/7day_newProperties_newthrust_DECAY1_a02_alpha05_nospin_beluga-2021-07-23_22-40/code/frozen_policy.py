@@ -0,0 +1,54 @@
+"""
+Loads and runs a frozen policy: an inference-only copy of the trained actor,
+written by export_policy.py.
+
+A training checkpoint holds the actor, the critic, their target networks and
+all of their optimizer slots, and restoring it means building the graph with
+Tensorflow first. The frozen policy is a single .npz file that holds only what
+inference needs:
+    - the weights and biases of each of the actor's fully-connected layers
+    - the normalization constants (STATE_MEAN, STATE_HALF_RANGE, NORMALIZE_STATE)
+    - which states the policy ignores (IRRELEVANT_STATES)
+    - the action bounds (LOWER_ACTION_BOUND, UPPER_ACTION_BOUND)
+
+The actor is run with numpy alone, so this file does not import Tensorflow or
+settings.py and loads in a fraction of a second.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import numpy as np
+
+FROZEN_POLICY_FILENAME = 'frozen_policy.npz'
+
+class FrozenPolicy:
+
+    def __init__(self, filename):
+        with np.load(filename) as frozen_policy:
+            # The layers are saved in order as weights_0, biases_0, weights_1, ...
+            number_of_layers = int(frozen_policy['number_of_layers'])
+            self.weights = [frozen_policy['weights_%i' %i] for i in range(number_of_layers)]
+            self.biases  = [frozen_policy['biases_%i' %i] for i in range(number_of_layers)]
+
+            self.state_mean         = frozen_policy['state_mean']
+            self.state_half_range   = frozen_policy['state_half_range']
+            self.normalize_state    = bool(frozen_policy['normalize_state'])
+            self.irrelevant_states  = frozen_policy['irrelevant_states']
+            self.lower_action_bound = frozen_policy['lower_action_bound']
+            self.upper_action_bound = frozen_policy['upper_action_bound']
+            self.checkpoint         = str(frozen_policy['checkpoint'])
+
+        self.observation_size = self.weights[0].shape[0]
+        self.action_size = self.weights[-1].shape[1]
+
+    def action(self, observation):
+        # Runs the actor on one observation, or a batch of them, and returns the scaled action(s)
+        layer = np.asarray(observation, dtype = np.float32)
+
+        # Fully-connected hidden layers with relu, as in BuildActorNetwork
+        for weights, biases in zip(self.weights[:-1], self.biases[:-1]):
+            layer = np.maximum(np.matmul(layer, weights) + biases, 0.)
+
+        # The output layer is squished with a tanh and then scaled to the action range
+        actions_out_unscaled = np.tanh(np.matmul(layer, self.weights[-1]) + self.biases[-1])
+        return 0.5*(actions_out_unscaled*(self.upper_action_bound - self.lower_action_bound) + self.lower_action_bound + self.upper_action_bound)
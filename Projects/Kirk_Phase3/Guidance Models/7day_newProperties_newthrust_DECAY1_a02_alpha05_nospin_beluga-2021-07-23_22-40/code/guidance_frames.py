@@ -0,0 +1,71 @@
+"""
+Encodes and decodes the binary frames that can be used, instead of newline-separated
+text, to send guidance inputs from the Pi and guidance outputs back to it.
+
+The text messages cost a string conversion and parse for every value on every cycle,
+and std::to_string on the Pi only keeps 6 decimal places. A binary frame holds the
+values as float64s, and checks they arrived intact.
+
+Frame layout (little-endian, FRAME_HEADER_SIZE + 8*number_of_values + 4 bytes):
+    magic             4 bytes   b'SPOT'
+    version           uint8     FRAME_VERSION
+    message_type      uint8     INPUT_MESSAGE (Pi -> Jetson) or OUTPUT_MESSAGE (Jetson -> Pi)
+    number_of_values  uint16
+    sequence_number   uint32    incremented by the Pi for each input; outputs repeat the sequence number of the input they answer
+    timestamp         float64   [s] the Pi's time of the input; outputs repeat the timestamp of the input they answer
+    values            float64 x number_of_values
+    checksum          uint32    CRC-32 (as zlib.crc32) of everything before it
+
+Custom_Library/NVIDIA_Jetson/src/guidance_frame.cpp is the matching C++ implementation
+used on the Pi.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import zlib
+import struct
+import numpy as np
+
+FRAME_MAGIC    = b'SPOT'
+FRAME_VERSION  = 1
+INPUT_MESSAGE  = 1 # [time, red_x, red_y, red_angle, red_vx, red_vy, red_dangle, black_x, black_y, black_angle, black_vx, black_vy, black_dangle, shoulder_angle, elbow_angle, wrist_angle, shoulder_omega, elbow_omega, wrist_omega]
+OUTPUT_MESSAGE = 2 # [accel_x, accel_y, alpha, shoulder_alpha, elbow_alpha, wrist_alpha, have_we_docked]
+INPUT_VALUES   = 19
+OUTPUT_VALUES  = 7
+
+FRAME_HEADER      = struct.Struct('<4sBBHId')
+FRAME_HEADER_SIZE = FRAME_HEADER.size # 20 bytes
+FRAME_CHECKSUM    = struct.Struct('<I')
+
+class FrameError(Exception):
+    # Raised when a frame is malformed or fails its checksum
+    pass
+
+def frame_size(number_of_values):
+    # Total size of a frame holding number_of_values values [bytes]
+    return FRAME_HEADER_SIZE + 8*number_of_values + FRAME_CHECKSUM.size
+
+def encode_frame(message_type, sequence_number, timestamp, values):
+    # Returns the frame holding these values as bytes
+    values = np.asarray(values, dtype = '<f8')
+    frame = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, message_type, len(values), sequence_number & 0xFFFFFFFF, timestamp) + values.tobytes()
+    return frame + FRAME_CHECKSUM.pack(zlib.crc32(frame))
+
+def decode_frame(frame):
+    # Returns (message_type, sequence_number, timestamp, values) from one complete frame.
+    # Raises a FrameError if it is not a valid frame.
+    if len(frame) < frame_size(0):
+        raise FrameError("Frame is too short (%i bytes)" %len(frame))
+    magic, version, message_type, number_of_values, sequence_number, timestamp = FRAME_HEADER.unpack_from(frame)
+    if magic != FRAME_MAGIC:
+        raise FrameError("Frame does not start with %s" %FRAME_MAGIC)
+    if version != FRAME_VERSION:
+        raise FrameError("Frame is version %i, but version %i is expected" %(version, FRAME_VERSION))
+    if len(frame) != frame_size(number_of_values):
+        raise FrameError("Frame holds %i values and should be %i bytes, but is %i bytes" %(number_of_values, frame_size(number_of_values), len(frame)))
+    checksum, = FRAME_CHECKSUM.unpack_from(frame, len(frame) - FRAME_CHECKSUM.size)
+    if checksum != zlib.crc32(frame[:-FRAME_CHECKSUM.size]):
+        raise FrameError("Frame failed its checksum")
+
+    values = np.frombuffer(frame, dtype = '<f8', count = number_of_values, offset = FRAME_HEADER_SIZE)
+    return message_type, sequence_number, timestamp, values
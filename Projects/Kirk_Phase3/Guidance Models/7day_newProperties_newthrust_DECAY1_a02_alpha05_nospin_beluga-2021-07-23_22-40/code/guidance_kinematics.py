@@ -0,0 +1,125 @@
+"""
+Calculates the policy input, and how far the end-effector is from the docking
+port, straight from the 19 values the Pi sends to use_deep_guidance_arm.py.
+
+use_deep_guidance_arm.py used to copy every message into an Environment, update
+its end-effector, docking port and relative pose, run check_collisions() (which
+builds five shapely polygons to find the collisions, the mid-way point and
+whether we've docked), and then ask it for its TOTAL_STATE. Only the TOTAL_STATE
+and the docking check are used during an experiment, so here they are calculated
+directly with the same equations as the Environment, one scalar at a time.
+
+Everything here is a pure function of the received values and constants: the
+arm geometry (arm_geometry(), read once from an Environment) and the
+normalization constants. Only numpy and math are used.
+
+The docking check is whether the end-effector is within SUCCESSFUL_DOCKING_RADIUS
+of the docking port. The Environment checks it against a shapely circle, which is
+a polygon with its corners on the circle, so the two only differ within 0.2% of
+the radius from its edge.
+
+compare_guidance_kinematics.py checks these against the Environment.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import math
+import numpy as np
+from collections import namedtuple
+
+# The dimensions of the chaser's arm and the target's docking port, as in the Environment
+ArmGeometry = namedtuple('ArmGeometry', ['B0', 'PHI', 'LINK_1', 'LINK_2', 'LINK_3', 'DOCKING_PORT_X', 'DOCKING_PORT_Y'])
+
+def arm_geometry(environment):
+    # Reads the arm and docking port dimensions from an Environment (or anything with the same attributes)
+    return ArmGeometry(B0             = environment.B0,
+                       PHI            = environment.PHI,
+                       LINK_1         = environment.A1 + environment.B1,
+                       LINK_2         = environment.A2 + environment.B2,
+                       LINK_3         = environment.A3 + environment.B3,
+                       DOCKING_PORT_X = environment.DOCKING_PORT_MOUNT_POSITION[0],
+                       DOCKING_PORT_Y = environment.DOCKING_PORT_MOUNT_POSITION[1])
+
+
+def end_effector(received_values, geometry):
+    # The end-effector position and velocity in the Inertial frame [x, y, x_dot, y_dot]
+    _, x, y, theta, x_dot, y_dot, theta_dot, _, _, _, _, _, _, theta_1, theta_2, theta_3, theta_1_dot, theta_2_dot, theta_3_dot = received_values
+
+    # Angle and angular rate of the arm's base and each link
+    base_angle   = geometry.PHI + theta
+    link_1_angle = math.pi/2 + theta + theta_1
+    link_2_angle = link_1_angle + theta_2
+    link_3_angle = link_2_angle + theta_3
+    link_1_rate  = theta_dot + theta_1_dot
+    link_2_rate  = link_1_rate + theta_2_dot
+    link_3_rate  = link_2_rate + theta_3_dot
+
+    x_ee = x + geometry.B0*math.cos(base_angle) + geometry.LINK_1*math.cos(link_1_angle) + geometry.LINK_2*math.cos(link_2_angle) + geometry.LINK_3*math.cos(link_3_angle)
+    y_ee = y + geometry.B0*math.sin(base_angle) + geometry.LINK_1*math.sin(link_1_angle) + geometry.LINK_2*math.sin(link_2_angle) + geometry.LINK_3*math.sin(link_3_angle)
+    x_ee_dot = x_dot - geometry.B0*math.sin(base_angle)*theta_dot - geometry.LINK_1*math.sin(link_1_angle)*link_1_rate - geometry.LINK_2*math.sin(link_2_angle)*link_2_rate - geometry.LINK_3*math.sin(link_3_angle)*link_3_rate
+    y_ee_dot = y_dot + geometry.B0*math.cos(base_angle)*theta_dot + geometry.LINK_1*math.cos(link_1_angle)*link_1_rate + geometry.LINK_2*math.cos(link_2_angle)*link_2_rate + geometry.LINK_3*math.cos(link_3_angle)*link_3_rate
+    return x_ee, y_ee, x_ee_dot, y_ee_dot
+
+
+def end_effector_body_frame(received_values, geometry):
+    # The end-effector position and velocity in the chaser's body frame [x, y, x_dot, y_dot]
+    theta_1, theta_2, theta_3, theta_1_dot, theta_2_dot, theta_3_dot = received_values[13:19]
+
+    link_1_angle = math.pi/2 + theta_1
+    link_2_angle = link_1_angle + theta_2
+    link_3_angle = link_2_angle + theta_3
+    link_2_rate  = theta_1_dot + theta_2_dot
+    link_3_rate  = link_2_rate + theta_3_dot
+
+    x_ee = geometry.B0*math.cos(geometry.PHI) + geometry.LINK_1*math.cos(link_1_angle) + geometry.LINK_2*math.cos(link_2_angle) + geometry.LINK_3*math.cos(link_3_angle)
+    y_ee = geometry.B0*math.sin(geometry.PHI) + geometry.LINK_1*math.sin(link_1_angle) + geometry.LINK_2*math.sin(link_2_angle) + geometry.LINK_3*math.sin(link_3_angle)
+    # The sign of the first term is as in Environment.update_end_effector_location_body_frame(), which the policy was trained with
+    x_ee_dot = geometry.LINK_1*math.sin(link_1_angle)*theta_1_dot - geometry.LINK_2*math.sin(link_2_angle)*link_2_rate - geometry.LINK_3*math.sin(link_3_angle)*link_3_rate
+    y_ee_dot = geometry.LINK_1*math.cos(link_1_angle)*theta_1_dot + geometry.LINK_2*math.cos(link_2_angle)*link_2_rate + geometry.LINK_3*math.cos(link_3_angle)*link_3_rate
+    return x_ee, y_ee, x_ee_dot, y_ee_dot
+
+
+def make_total_state(received_values, geometry):
+    # The Environment's TOTAL_STATE from the 19 values received from the Pi:
+    # [time, red_x, red_y, red_angle, red_vx, red_vy, red_dangle, black_x, black_y, black_angle, black_vx, black_vy, black_dangle, shoulder_angle, elbow_angle, wrist_angle, shoulder_omega, elbow_omega, wrist_omega]
+    _, x, y, theta, x_dot, y_dot, theta_dot, target_x, target_y, target_theta, target_x_dot, target_y_dot, target_theta_dot, theta_1, theta_2, theta_3, theta_1_dot, theta_2_dot, theta_3_dot = received_values
+
+    return np.array([x, y, theta % (2*np.pi), x_dot, y_dot, theta_dot,
+                     theta_1, theta_2, theta_3, theta_1_dot, theta_2_dot, theta_3_dot,
+                     target_x, target_y, target_theta % (2*np.pi), target_x_dot, target_y_dot, target_theta_dot,
+                     *end_effector(received_values, geometry),
+                     target_x - x, target_y - y, (target_theta - theta) % (2*np.pi),
+                     *end_effector_body_frame(received_values, geometry)])
+
+
+def normalize_total_state(total_state, state_mean, state_half_range, irrelevant_states, normalize_state = True):
+    # Processes the TOTAL_STATE into the policy input, exactly as the agent does
+    if normalize_state:
+        total_state = (total_state - state_mean)/state_half_range
+    return np.delete(total_state, irrelevant_states, axis = -1)
+
+
+def make_observation(received_values, geometry, state_mean, state_half_range, irrelevant_states, normalize_state = True):
+    # The normalized policy input from the 19 values received from the Pi
+    return normalize_total_state(make_total_state(received_values, geometry), state_mean, state_half_range, irrelevant_states, normalize_state)
+
+
+def docking_error(received_values, geometry):
+    # The end-effector position relative to the docking port, in the target's body frame [x, y]
+    target_x, target_y, target_theta = received_values[7:10]
+    x_ee, y_ee, _, _ = end_effector(received_values, geometry)
+
+    # Docking port position in Inertial = target position + C_Ib * docking port position in the target's body frame
+    cos_theta = math.cos(target_theta)
+    sin_theta = math.sin(target_theta)
+    error_x = x_ee - (target_x + cos_theta*geometry.DOCKING_PORT_X - sin_theta*geometry.DOCKING_PORT_Y)
+    error_y = y_ee - (target_y + sin_theta*geometry.DOCKING_PORT_X + cos_theta*geometry.DOCKING_PORT_Y)
+
+    # Rotated into the target's body frame with C_bI
+    return np.array([cos_theta*error_x + sin_theta*error_y, -sin_theta*error_x + cos_theta*error_y])
+
+
+def is_docked(received_values, geometry, successful_docking_radius):
+    # Whether the end-effector is within successful_docking_radius of the docking port
+    error_x, error_y = docking_error(received_values, geometry)
+    return math.hypot(error_x, error_y) < successful_docking_radius
@@ -0,0 +1,118 @@
+"""
+Measures where the time goes between a PhaseSpace sample arriving on the Jetson
+and the guidance calculated from it being sent back.
+
+Each message is stamped with time.perf_counter() at every stage of
+use_deep_guidance_arm.py, and the time spent in each stage is added to a histogram:
+    - arrival_delay: how much later than the fastest message so far this one arrived,
+                     compared to the Pi's own clock (Pi_time). The Pi and Jetson
+                     clocks aren't synchronized, so this is the delay added by the
+                     Pi, network and jetsonRepeater.py above their minimum.
+    - parse:         MessageParser reassembling and decoding the message
+    - mailbox_wait:  waiting for the DeepGuidanceModelRunner to pick it up
+    - kinematics:    the docking check and the policy input
+    - inference:     running the policy
+    - send:          limiting the output and sending it back
+    - total:         from arrival to sending, all of the above except arrival_delay
+
+The histograms have logarithmically-spaced bins (BINS_PER_DECADE per factor of 10),
+so recording is a logarithm and a list increment with no allocation. Each stage is
+only recorded by one thread, so no lock is needed. The percentiles are calculated
+at the end of the experiment and saved next to its data log. They can be used to
+check delay assumptions such as CAMERA_PROCESSING_TIME in use_deep_guidance_spot.py.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import math
+import json
+
+SMALLEST_LATENCY = 1e-6 # [s] anything shorter is counted in the first bin
+LARGEST_LATENCY  = 10. # [s] anything longer is counted in the last bin
+BINS_PER_DECADE  = 20 # histogram resolution: each bin is ~12% wider than the last
+PERCENTILES      = [50, 90, 99, 99.9]
+
+NUMBER_OF_BINS = int(round(math.log10(LARGEST_LATENCY/SMALLEST_LATENCY)*BINS_PER_DECADE))
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = [0]*(NUMBER_OF_BINS + 2) # including one bin below SMALLEST_LATENCY and one above LARGEST_LATENCY
+        self.number_of_samples = 0
+        self.total = 0.
+        self.maximum = 0.
+
+    def record(self, duration):
+        # Add one duration [s] to the histogram (as a Python float: the Pi's times are parsed as numpy float32s, which json can't save)
+        duration = float(duration)
+        if duration <= SMALLEST_LATENCY:
+            index = 0
+        else:
+            index = min(int(math.log10(duration/SMALLEST_LATENCY)*BINS_PER_DECADE) + 1, NUMBER_OF_BINS + 1)
+        self.counts[index] += 1
+        self.number_of_samples += 1
+        self.total += duration
+        self.maximum = max(self.maximum, duration)
+
+    def percentile(self, percent):
+        # Upper edge of the bin holding this percentile [s] (never more than the largest duration recorded)
+        target = percent/100.*self.number_of_samples
+        cumulative_count = 0
+        for index, count in enumerate(self.counts):
+            cumulative_count += count
+            if cumulative_count >= target:
+                return min(SMALLEST_LATENCY*10**(index/BINS_PER_DECADE), self.maximum)
+        return self.maximum
+
+class LatencyTracer:
+
+    STAGES = ['arrival_delay', 'parse', 'mailbox_wait', 'kinematics', 'inference', 'send', 'total']
+
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.smallest_clock_offset = math.inf # [s] arrival time minus Pi_time of the fastest message so far
+
+    def record(self, stage, duration):
+        self.histograms[stage].record(duration)
+
+    def record_arrival(self, received_time, Pi_time):
+        # Record how much later than the fastest message so far this one arrived, relative to the Pi's clock
+        clock_offset = received_time - Pi_time
+        self.smallest_clock_offset = min(self.smallest_clock_offset, clock_offset)
+        self.record('arrival_delay', clock_offset - self.smallest_clock_offset)
+
+    def record_message(self, trace):
+        # Record every stage of one message. trace is the perf_counter() time when it was
+        # (received, parsed, picked up, through the kinematics, through the policy, sent)
+        received_time, parsed_time, picked_up_time, kinematics_time, inference_time, sent_time = trace
+        self.record('parse',        parsed_time     - received_time)
+        self.record('mailbox_wait', picked_up_time  - parsed_time)
+        self.record('kinematics',   kinematics_time - picked_up_time)
+        self.record('inference',    inference_time  - kinematics_time)
+        self.record('send',         sent_time       - inference_time)
+        self.record('total',        sent_time       - received_time)
+
+    def statistics(self):
+        # Returns {stage: {count, mean_ms, p50_ms, ..., max_ms}} for every stage that was recorded
+        statistics = {}
+        for stage in self.STAGES:
+            histogram = self.histograms[stage]
+            if histogram.number_of_samples == 0:
+                continue
+            statistics[stage] = {'count': histogram.number_of_samples, 'mean_ms': histogram.total/histogram.number_of_samples*1000}
+            for percent in PERCENTILES:
+                statistics[stage]['p%g_ms' %percent] = histogram.percentile(percent)*1000
+            statistics[stage]['max_ms'] = histogram.maximum*1000
+        return statistics
+
+    def print_summary(self):
+        for stage, stage_statistics in self.statistics().items():
+            print("%15s: " %stage + ", ".join("%s %.3f" %(name, value) if name != 'count' else "%i messages" %value for name, value in stage_statistics.items()))
+
+    def save(self, filename, extra_statistics = None):
+        # Saves the statistics of every stage, and any extra_statistics {name: value} that belong with them
+        statistics = self.statistics()
+        if extra_statistics is not None:
+            statistics.update(extra_statistics)
+        with open(filename, 'w') as latency_file:
+            json.dump(statistics, latency_file, indent = 4)
@@ -0,0 +1,40 @@
+"""
+A mailbox that holds only the most recent value put into it.
+
+use_deep_guidance_arm.py used a deque(maxlen = 1) to pass the newest packet from
+the MessageParser to the DeepGuidanceModelRunner, which popped it in a loop and
+tried again whenever it was empty. That kept one core of the Jetson busy doing
+nothing and took the GIL from the MessageParser. Here, the reader sleeps on a
+condition variable until a new value is put in, and then takes exactly the
+newest one. Values that are overwritten before being read are counted.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import threading
+
+class LatestValueMailbox:
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.value = None
+        self.has_new_value = False
+        self.number_overwritten = 0 # values that were replaced before they were read
+
+    def put(self, value):
+        # Replace whatever is in the mailbox and wake the reader
+        with self.condition:
+            if self.has_new_value:
+                self.number_overwritten += 1
+            self.value = value
+            self.has_new_value = True
+            self.condition.notify()
+
+    def get(self, timeout = None):
+        # Wait for a value that hasn't been read yet and return it.
+        # Returns None if there still isn't one after timeout [s].
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.has_new_value, timeout):
+                return None
+            self.has_new_value = False
+            return self.value
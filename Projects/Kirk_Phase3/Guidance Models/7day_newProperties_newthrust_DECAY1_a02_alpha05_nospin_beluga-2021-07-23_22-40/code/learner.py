@@ -23,10 +23,12 @@ Training:
 import tensorflow as tf
 import numpy as np
 import time
-import multiprocessing
-import queue # for empty error catching
+import threading # for BrokenBarrierError
+import contextlib
 
 from build_neural_networks import BuildActorNetwork, BuildQNetwork
+from phase_timer import PhaseTimer
+from resume_manifest import write_resume_manifest
 from settings import Settings
 
 class Learner:
@@ -58,19 +60,39 @@ class Learner:
         # The reward options that the distributional critic predicts the liklihood of being in
         self.bins = np.linspace(Settings.MIN_V, Settings.MAX_V, Settings.NUMBER_OF_BINS, dtype = np.float32)
 
+        # Optionally mark every learner operation for XLA compilation so the many
+        # small operations in each training step get fused together on the CPU.
+        # Resource variables are needed for XLA to compile the variable reads and updates.
+        if Settings.XLA_JIT_LEARNER:
+            from tensorflow.contrib.compiler import jit
+            compilation_scope = jit.experimental_jit_scope()
+        else:
+            compilation_scope = contextlib.nullcontext()
+
         ######################################################
         ##### Build the networks and training operations #####
         ######################################################
-        self.build_main_networks()
-        self.build_target_networks()
+        with compilation_scope, tf.variable_scope(tf.get_variable_scope(), use_resource = Settings.XLA_JIT_LEARNER):
+            self.build_main_networks()
+            self.build_target_networks()
 
-        # Build the operation to update the target network parameters
-        self.build_target_parameter_update_operations()
+            # Build the operation to update the target network parameters
+            self.build_target_parameter_update_operations()
+
+            # Build the operations that share training with other learner processes, if used
+            if Settings.NUMBER_OF_LEARNERS > 1:
+                self.build_learner_process_operations()
 
         # Create operstions for Tensorboard logging
         self.writer = writer
         self.create_summary_functions()
 
+        # Times each phase of the training iteration, logged to Tensorboard under Perf/
+        self.phase_timer = PhaseTimer()
+
+        # The agents whose episode numbers are recorded in the resume manifest
+        self.agents = []
+
         print("Learner created!")
 
 
@@ -134,12 +156,109 @@ class Learner:
         self.initialize_target_network_parameters = initialize_target_network_parameters
         self.update_target_network_parameters = update_target_network_parameters
 
-    def generate_queue(self):
-        # Generate the queues responsible for communicating with the learner
-        self.agent_to_learner = multiprocessing.Queue(maxsize = 1)
-        self.learner_to_agent = multiprocessing.Queue(maxsize = 1)
-
-        return self.agent_to_learner, self.learner_to_agent
+    def build_learner_process_operations(self):
+        # Build the operations needed when training is shared between several learner
+        # processes (Settings.NUMBER_OF_LEARNERS > 1). Every process calculates the gradients
+        # on its own mini-batch, the gradients are averaged, and the main learner applies them.
+        self.apply_critic_gradients = self.critic.generate_gradient_application_function()
+        self.apply_actor_gradients  = self.actor.generate_gradient_application_function()
+
+        # All the parameters, in the order that they are placed in shared memory.
+        # The target networks are included so they remain identical in every process.
+        self.shared_parameters_list = self.actor.parameters + self.critic.parameters + self.target_actor.parameters + self.target_critic.parameters
+        self.shared_parameter_sizes = [int(np.prod(parameter.shape.as_list())) for parameter in self.shared_parameters_list]
+
+        # The gradients are only for the main networks, in the same order as their parameters
+        self.number_of_main_parameters = len(self.actor.parameters) + len(self.critic.parameters)
+
+        # Operation that loads the shared parameters into this process' networks
+        self.shared_parameter_placeholders = [tf.placeholder(dtype = tf.float32, shape = parameter.shape) for parameter in self.shared_parameters_list]
+        self.load_shared_parameters = [parameter.assign(placeholder) for parameter, placeholder in zip(self.shared_parameters_list, self.shared_parameter_placeholders)]
+
+    def connect_agents(self, agents):
+        # Store the agents so their episode numbers can be recorded in the resume manifest
+        self.agents = agents
+
+    def connect_learner_processes(self, shared_parameters, shared_gradients, parameters_ready, gradients_ready):
+        # Store the shared memory and barriers generated by learner_process.generate_shared_memory()
+        self.shared_parameters = shared_parameters # [total number of parameters] written by the main learner
+        self.shared_gradients  = shared_gradients  # [NUMBER_OF_LEARNERS - 1, number of main parameters] written by the learner processes
+        self.parameters_ready  = parameters_ready  # all learners wait here until the new parameters are shared
+        self.gradients_ready   = gradients_ready   # all learners wait here until all gradients are calculated
+
+    def write_shared_parameters(self):
+        # Copy the current parameters of every network into shared memory
+        self.shared_parameters[:] = np.concatenate([np.ravel(parameter) for parameter in self.sess.run(self.shared_parameters_list)])
+
+    def read_shared_parameters(self):
+        # Load the parameters in shared memory into this process' networks
+        split_parameters = np.split(self.shared_parameters, np.cumsum(self.shared_parameter_sizes)[:-1])
+        feed_dict = {placeholder: np.reshape(parameter, placeholder.shape.as_list()) for placeholder, parameter in zip(self.shared_parameter_placeholders, split_parameters)}
+        self.sess.run(self.load_shared_parameters, feed_dict = feed_dict)
+
+    def prepare_critic_training(self, rewards_batch, next_states_batch, dones_batch, gammas_batch):
+        # Calculate the target q-distribution for a mini-batch, and the bins it lies on after the Bellman update
+
+        # Get clean next actions by feeding the next states through the target actor
+        self.phase_timer.start()
+        clean_next_actions = self.sess.run(self.target_actor.action_scaled, {self.state_placeholder:next_states_batch}) # [batch_size, num_actions]
+        self.phase_timer.stop('Target_actor_forward')
+
+        # Get the next q-distribution by passing the next states and clean next actions through the target critic
+        target_critic_distribution = self.sess.run(self.target_critic.q_distribution, {self.state_placeholder:next_states_batch, self.action_placeholder:clean_next_actions}) # [batch_size, number_of_bins]
+        self.phase_timer.stop('Target_critic_forward')
+
+        # Create batch of bins
+        target_bins = np.repeat(np.expand_dims(self.bins, axis = 0), len(rewards_batch), axis = 0) # [batch_size, number_of_bins]
+
+        # If this data in the batch corresponds to the end of an episode (dones_batch[i] = True),
+        # set all the bins to 0.0. This will eliminate the inclusion of the predicted future
+        # reward when computing the bellman update (i.e., the predicted future rewards are only
+        # the current reward, since we aren't continuing the episode any further).
+        target_bins[dones_batch, :] = 0.0
+
+        # Bellman projection. reward + gamma^N*bin -> The new
+        # expected reward, according to the recently-received reward.
+        # If the new reward is outside of the current bin, then we will
+        # adjust the probability that is assigned to the bin.
+        target_bins = np.expand_dims(rewards_batch, axis = 1) + (target_bins*gammas_batch)
+
+        return target_critic_distribution, target_bins
+
+    def calculate_gradients(self, states_batch, actions_batch, target_critic_distribution, target_bins, weights_batch):
+        # Calculate, but do not apply, the actor and critic gradients for this mini-batch.
+        # Both are calculated with the same parameters so that every learner process agrees.
+        critic_loss, critic_gradients, clean_actions = self.sess.run([self.critic.loss, self.critic.gradients, self.actor.action_scaled], {self.state_placeholder:states_batch, self.action_placeholder:actions_batch, self.target_q_distribution_placeholder:target_critic_distribution, self.target_bins_placeholder:target_bins, self.importance_sampling_weights_placeholder:weights_batch})
+        dQ_dAction = self.sess.run(self.critic.dQ_dAction, {self.state_placeholder:states_batch, self.action_placeholder:clean_actions})
+        actor_gradients = self.sess.run(self.actor.actor_gradients_scaled, {self.state_placeholder:states_batch, self.dQ_dAction_placeholder:dQ_dAction[0]})
+
+        return critic_loss, actor_gradients + critic_gradients
+
+    def train_with_learner_processes(self, states_batch, actions_batch, target_critic_distribution, target_bins, weights_batch):
+        # Trains the actor and critic one step using the averaged gradients from all learner processes.
+        # Share the current parameters and release the learner processes
+        self.write_shared_parameters()
+        self.parameters_ready.wait(Settings.LEARNER_PROCESS_TIMEOUT)
+
+        # Calculate our own gradients while the learner processes calculate theirs
+        critic_loss, gradients = self.calculate_gradients(states_batch, actions_batch, target_critic_distribution, target_bins, weights_batch)
+        self.gradients_ready.wait(Settings.LEARNER_PROCESS_TIMEOUT)
+
+        # Average our gradients with those of the learner processes
+        averaged_gradients = np.concatenate([np.ravel(gradient) for gradient in gradients]) + np.sum(self.shared_gradients, axis = 0)
+        averaged_gradients /= Settings.NUMBER_OF_LEARNERS
+        averaged_gradients = np.split(averaged_gradients, np.cumsum(self.shared_parameter_sizes[:self.number_of_main_parameters])[:-1])
+
+        # Apply them to the main networks
+        feed_dict = {placeholder: np.reshape(gradient, placeholder.shape.as_list()) for placeholder, gradient in zip(self.actor.gradient_placeholders + self.critic.gradient_placeholders, averaged_gradients)}
+        self.sess.run([self.apply_actor_gradients, self.apply_critic_gradients], feed_dict = feed_dict)
+
+        return critic_loss
+
+    def stop_learner_processes(self):
+        # Break the barriers so that any learner process waiting on them exits
+        self.parameters_ready.abort()
+        self.gradients_ready.abort()
 
     def run(self, stop_run_flag, replay_buffer_dump_flag, starting_training_iteration):
         # Continuously train the actor and the critic, by applying stochastic gradient
@@ -173,45 +292,14 @@ class Learner:
         ###############################
         while self.total_training_iterations < Settings.MAX_TRAINING_ITERATIONS and not stop_run_flag.is_set():
 
-            # Check if the agent wants some q-distributions calculated
-            try:
-                state_log, action_log, next_state_log, reward_log, done_log, gamma_log = self.agent_to_learner.get(False)
-
-                # Reshapping
-                gamma_log = np.reshape(gamma_log,  [-1, 1])
-                
-                # Get the online q-distribution
-                critic_distribution = self.sess.run(self.critic.q_distribution, feed_dict = {self.state_placeholder: state_log, self.action_placeholder: action_log}) # [episode length, number of bins]
-
-                # Clean next actions from the target actor
-                clean_next_actions = self.sess.run(self.target_actor.action_scaled, {self.state_placeholder:next_state_log}) # [episode length, num_actions]
-
-                # Get the target q-distribution
-                target_critic_distribution = self.sess.run(self.target_critic.q_distribution, feed_dict = {self.state_placeholder:state_log, self.action_placeholder:clean_next_actions}) # [episode length, number of bins]
-
-                # Create batch of bins [see further description below]
-                target_bins = np.repeat(np.expand_dims(self.bins, axis = 0), len(reward_log), axis = 0) # [episode length, number_of_bins]
-                target_bins[done_log, :] = 0.0
-                target_bins = np.expand_dims(reward_log, axis = 1) + (target_bins*gamma_log)
-
-                # Calculating the bellman distribution (r + gamma*target_q_distribution). The critic loss is with respect to this projection.
-                projected_target_distribution = self.sess.run(self.projected_target_distribution, feed_dict = {self.target_q_distribution_placeholder: target_critic_distribution, self.target_bins_placeholder: target_bins})
-
-                # Calculating the loss at each timestep
-                weights_batch = weights_batch = np.ones(shape = len(reward_log))
-                loss_log = self.sess.run(self.critic.loss, feed_dict = {self.state_placeholder:state_log, self.action_placeholder:action_log, self.target_q_distribution_placeholder:target_critic_distribution, self.target_bins_placeholder:target_bins, self.importance_sampling_weights_placeholder:weights_batch})
-
-                # Send the results back to the agent
-                self.learner_to_agent.put((critic_distribution, target_critic_distribution, projected_target_distribution, loss_log))
-
-            except queue.Empty:
-                # If queue was empty, do nothing
-                pass
-
             # If we don't have enough data yet to train OR we want to wait before we start to train
             if (self.replay_buffer.how_filled() < Settings.MINI_BATCH_SIZE) or (self.replay_buffer.how_filled() < Settings.REPLAY_BUFFER_START_TRAINING_FULLNESS):
                 continue # Skip this training iteration. Wait for more training data.
 
+            # Start timing this iteration
+            iteration_start_time = time.perf_counter()
+            self.phase_timer.start()
+
             # Sample a mini-batch of data from the replay_buffer
             if Settings.PRIORITY_REPLAY_BUFFER:
                 sampled_batch = self.replay_buffer.sample(priority_beta)
@@ -227,59 +315,64 @@ class Learner:
             next_states_batch      = sampled_batch[3]
             dones_batch            = sampled_batch[4]
             gammas_batch           = sampled_batch[5]
+            self.phase_timer.stop('Sample')
 
             ###################################
             ##### Prepare Critic Training #####
             ###################################
-            # Get clean next actions by feeding the next states through the target actor
-            clean_next_actions = self.sess.run(self.target_actor.action_scaled, {self.state_placeholder:next_states_batch}) # [batch_size, num_actions]
-
-            # Get the next q-distribution by passing the next states and clean next actions through the target critic
-            target_critic_distribution = self.sess.run(self.target_critic.q_distribution, {self.state_placeholder:next_states_batch, self.action_placeholder:clean_next_actions}) # [batch_size, number_of_bins]
-
-            # Create batch of bins
-            target_bins = np.repeat(np.expand_dims(self.bins, axis = 0), Settings.MINI_BATCH_SIZE, axis = 0) # [batch_size, number_of_bins]
-
-            # If this data in the batch corresponds to the end of an episode (dones_batch[i] = True),
-            # set all the bins to 0.0. This will eliminate the inclusion of the predicted future
-            # reward when computing the bellman update (i.e., the predicted future rewards are only
-            # the current reward, since we aren't continuing the episode any further).
-            target_bins[dones_batch, :] = 0.0
-
-            # Bellman projection. reward + gamma^N*bin -> The new
-            # expected reward, according to the recently-received reward.
-            # If the new reward is outside of the current bin, then we will
-            # adjust the probability that is assigned to the bin.
-            target_bins = np.expand_dims(rewards_batch, axis = 1) + (target_bins*gammas_batch)
+            # Get the target q-distribution and the bins it lies on after the Bellman update
+            target_critic_distribution, target_bins = self.prepare_critic_training(rewards_batch, next_states_batch, dones_batch, gammas_batch)
+
+            if Settings.NUMBER_OF_LEARNERS > 1:
+                ########################################################
+                ##### TRAIN THE ACTOR AND CRITIC ACROSS PROCESSES #####
+                ########################################################
+                try:
+                    self.phase_timer.start()
+                    critic_loss = self.train_with_learner_processes(states_batch, actions_batch, target_critic_distribution, target_bins, weights_batch)
+                    self.phase_timer.stop('Distributed_train')
+                except threading.BrokenBarrierError:
+                    # A learner process did not respond within Settings.LEARNER_PROCESS_TIMEOUT.
+                    # Stop here; the most recent regular checkpoint can be resumed from.
+                    print("A learner process has stopped responding! Stopping the learner.")
+                    break
 
-            #####################################
-            ##### TRAIN THE CRITIC ONE STEP #####
-            #####################################
-            critic_loss, _ = self.sess.run([self.critic.loss, self.train_critic_one_step], {self.state_placeholder:states_batch, self.action_placeholder:actions_batch, self.target_q_distribution_placeholder:target_critic_distribution, self.target_bins_placeholder:target_bins, self.importance_sampling_weights_placeholder:weights_batch})
+            else:
+                #####################################
+                ##### TRAIN THE CRITIC ONE STEP #####
+                #####################################
+                self.phase_timer.start()
+                critic_loss, _ = self.sess.run([self.critic.loss, self.train_critic_one_step], {self.state_placeholder:states_batch, self.action_placeholder:actions_batch, self.target_q_distribution_placeholder:target_critic_distribution, self.target_bins_placeholder:target_bins, self.importance_sampling_weights_placeholder:weights_batch})
+                self.phase_timer.stop('Critic_train')
 
 
-            ##################################
-            ##### Prepare Actor Training #####
-            ##################################
-            # Get clean actions that the main actor would have taken for this batch of states if there were no noise added
-            clean_actions = self.sess.run(self.actor.action_scaled, {self.state_placeholder:states_batch})
+                ##################################
+                ##### Prepare Actor Training #####
+                ##################################
+                # Get clean actions that the main actor would have taken for this batch of states if there were no noise added
+                clean_actions = self.sess.run(self.actor.action_scaled, {self.state_placeholder:states_batch})
 
-            # Calculate the derivative of the main critic's q-value with respect to these actions
-            dQ_dAction = self.sess.run(self.critic.dQ_dAction, {self.state_placeholder:states_batch, self.action_placeholder:clean_actions}) # also known as action gradients
+                # Calculate the derivative of the main critic's q-value with respect to these actions
+                dQ_dAction = self.sess.run(self.critic.dQ_dAction, {self.state_placeholder:states_batch, self.action_placeholder:clean_actions}) # also known as action gradients
 
-            ####################################
-            ##### TRAIN THE ACTOR ONE STEP #####
-            ####################################
-            self.sess.run(self.train_actor_one_step, {self.state_placeholder:states_batch, self.dQ_dAction_placeholder:dQ_dAction[0]})
+                ####################################
+                ##### TRAIN THE ACTOR ONE STEP #####
+                ####################################
+                self.sess.run(self.train_actor_one_step, {self.state_placeholder:states_batch, self.dQ_dAction_placeholder:dQ_dAction[0]})
+                self.phase_timer.stop('Actor_train') # includes the clean actions and dQ_dAction above
 
 
             # If it's time to update the target networks
             if self.total_training_iterations % Settings.UPDATE_TARGET_NETWORKS_EVERY_NUM_ITERATIONS == 0:
                 # Update target networks according to TAU!
+                self.phase_timer.start()
                 self.sess.run(self.update_target_network_parameters)
+                self.phase_timer.stop('Target_update')
 
             # If we're using a priority buffer, tend to it now.
             if Settings.PRIORITY_REPLAY_BUFFER:
+                self.phase_timer.start()
+
                 # The priority replay buffer ranks the data according to how unexpected they were
                 # An unexpected data point will have high loss. Now that we've just calculated the loss,
                 # update the priorities in the replay buffer.
@@ -301,16 +394,22 @@ class Learner:
                         # Allow the agents to continue now that the buffer is ready
                         replay_buffer_dump_flag.set()
 
+                self.phase_timer.stop('Priority_update')
+
             # If it's time to log the training performance to TensorBoard
             if self.total_training_iterations % Settings.LOG_TRAINING_PERFORMANCE_EVERY_NUM_ITERATIONS == 0 and Settings.ENVIRONMENT != 'fixedICs':
                 # Logging the mean critic loss across the batch
                 summary = self.sess.run(self.iteration_summary, feed_dict = {self.iteration_loss_placeholder: np.mean(critic_loss)})
                 self.writer.add_summary(summary, self.total_training_iterations)
 
+                # Logging the rolling mean and p99 time of each phase of the training iteration
+                self.writer.add_summary(self.phase_timer.summary(), self.total_training_iterations)
+
             # If it's time to save a checkpoint. Be it a regular checkpoint, the final planned iteration, or the final unplanned iteration
             if (self.total_training_iterations % Settings.SAVE_CHECKPOINT_EVERY_NUM_ITERATIONS == 0) or (self.total_training_iterations == Settings.MAX_TRAINING_ITERATIONS) or stop_run_flag.is_set():
                 # Save the state of all networks and note the training iteration
-                self.saver.save(self.total_training_iterations, self.state_placeholder, self.actor.action_scaled)
+                self.phase_timer.start()
+                checkpoint_path = self.saver.save(self.total_training_iterations, self.state_placeholder, self.actor.action_scaled)
                 
                 # Make the agents wait before adding any more data to the buffer
                 replay_buffer_dump_flag.clear()
@@ -319,17 +418,30 @@ class Learner:
                 # Allow the agents to continue now that the buffer is ready
                 replay_buffer_dump_flag.set()
 
+                # Record where to resume from, now that the checkpoint and replay buffer are saved
+                episode_numbers = [agent.last_episode_number for agent in self.agents]
+                if checkpoint_path is not None and None not in episode_numbers:
+                    write_resume_manifest(self.saver.filename, self.total_training_iterations, episode_numbers, checkpoint_path)
+                self.phase_timer.stop('Checkpoint')
+
             # If it's time to print the training performance to the screen
             if self.total_training_iterations % Settings.DISPLAY_TRAINING_PERFORMANCE_EVERY_NUM_ITERATIONS == 0:
                 print("Trained actor and critic %i iterations in %.2f minutes, at %.3f s/iteration. Now at iteration %i." % (Settings.DISPLAY_TRAINING_PERFORMANCE_EVERY_NUM_ITERATIONS, (time.time() - start_time)/60, (time.time() - start_time)/Settings.DISPLAY_TRAINING_PERFORMANCE_EVERY_NUM_ITERATIONS, self.total_training_iterations))
                 start_time = time.time() # resetting the timer for the next PERFORMANCE_UPDATE_EVERY_NUM_ITERATIONS of iterations
 
+            # Finish timing this iteration
+            self.phase_timer.record('Iteration', time.perf_counter() - iteration_start_time)
+
             # Incrementing training iteration counter
             self.total_training_iterations += 1
 
         # If we are done training
         print("Learner finished after running " + str(self.total_training_iterations) + " training iterations!")
 
+        # Release any learner processes that are waiting on us
+        if Settings.NUMBER_OF_LEARNERS > 1:
+            self.stop_learner_processes()
+
         # Flip the flag signalling all agents to stop
         stop_run_flag.set()
 
@@ -0,0 +1,113 @@
+"""
+This Class builds an additional learner that runs in its own process and shares
+each training iteration with the main Learner. It is used when
+Settings.NUMBER_OF_LEARNERS > 1.
+
+Every training iteration:
+    1) The main Learner writes the parameters of all its networks (including the
+       target networks) to shared memory, and everyone waits at parameters_ready.
+    2) Each learner process loads these parameters, samples its own mini-batch from
+       the SharedReplayBuffer, and calculates the actor and critic gradients.
+    3) Each learner process writes its gradients to its row of shared memory, and
+       everyone waits at gradients_ready.
+    4) The main Learner averages all the gradients, applies them, and updates the
+       target networks. Since only the main Learner ever changes the parameters,
+       the target networks remain identical in every process.
+
+The learner processes must be started before the main Tensorflow session is
+created, since Tensorflow does not survive being forked.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import os
+import signal
+import threading # for BrokenBarrierError
+import multiprocessing
+import numpy as np
+import tensorflow as tf
+
+from learner import Learner
+from shared_replay_buffer import make_shared_array
+from settings import Settings
+
+def generate_shared_memory():
+    # Generate the shared memory and barriers that the learners use to share each training iteration
+
+    # Build a throwaway copy of the networks to count how many parameters they have
+    with tf.Graph().as_default():
+        learner = Learner(None, None, None, None)
+        number_of_parameters      = sum(learner.shared_parameter_sizes)
+        number_of_main_parameters = sum(learner.shared_parameter_sizes[:learner.number_of_main_parameters])
+
+    shared_parameters = make_shared_array([number_of_parameters], 'f', np.float32)
+    shared_gradients  = make_shared_array([Settings.NUMBER_OF_LEARNERS - 1, number_of_main_parameters], 'f', np.float32)
+    parameters_ready  = multiprocessing.Barrier(Settings.NUMBER_OF_LEARNERS)
+    gradients_ready   = multiprocessing.Barrier(Settings.NUMBER_OF_LEARNERS)
+
+    return shared_parameters, shared_gradients, parameters_ready, gradients_ready
+
+def generate_config():
+    # Split the CPU cores evenly between the learners so they don't fight over them
+    config = tf.ConfigProto()
+    config.intra_op_parallelism_threads = max(1, (Settings.TF_INTRA_OP_THREADS or len(os.sched_getaffinity(0))) // Settings.NUMBER_OF_LEARNERS)
+    config.inter_op_parallelism_threads = Settings.TF_INTER_OP_THREADS # 0 -> auto-picked by tensorflow
+    config.gpu_options.allow_growth = True # so that every learner can fit on the same GPU
+
+    return config
+
+class LearnerProcess:
+    def __init__(self, n_learner, replay_buffer, shared_parameters, shared_gradients, parameters_ready, gradients_ready):
+        print("Initialising learner process " + str(n_learner))
+
+        # Saving items to the self. object for future use
+        self.n_learner         = n_learner # the main Learner is learner 1
+        self.replay_buffer     = replay_buffer
+        self.shared_parameters = shared_parameters
+        self.shared_gradients  = shared_gradients
+        self.parameters_ready  = parameters_ready
+        self.gradients_ready   = gradients_ready
+
+    def run(self):
+        # Continuously calculate gradients for the main Learner, until it stops
+
+        # Ctrl + C is handled by main.py, which stops this process through the main Learner
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        # Forked processes inherit the random state, so re-seed to sample different mini-batches
+        np.random.seed(Settings.RANDOM_SEED + self.n_learner)
+
+        tf.reset_default_graph()
+        with tf.Session(config = generate_config()) as sess:
+            if Settings.USE_GPU_WHEN_AVAILABLE:
+                learner = Learner(sess, None, self.replay_buffer, None)
+            else:
+                with tf.device('/device:CPU:0'):
+                    learner = Learner(sess, None, self.replay_buffer, None)
+            learner.connect_learner_processes(self.shared_parameters, self.shared_gradients, self.parameters_ready, self.gradients_ready)
+
+            # Importance sampling weights are all one since the prioritized replay buffer is not supported
+            weights_batch = np.ones(shape = Settings.MINI_BATCH_SIZE)
+
+            print("Learner process %i ready!" %self.n_learner)
+
+            while True:
+                try:
+                    # Wait for the main Learner to share its parameters, then load them
+                    self.parameters_ready.wait()
+                    learner.read_shared_parameters()
+
+                    # Sample a mini-batch of data and calculate the gradients on it
+                    states_batch, actions_batch, rewards_batch, next_states_batch, dones_batch, gammas_batch = self.replay_buffer.sample()
+                    target_critic_distribution, target_bins = learner.prepare_critic_training(rewards_batch, next_states_batch, dones_batch, gammas_batch)
+                    _, gradients = learner.calculate_gradients(states_batch, actions_batch, target_critic_distribution, target_bins, weights_batch)
+
+                    # Share them with the main Learner
+                    self.shared_gradients[self.n_learner - 2] = np.concatenate([np.ravel(gradient) for gradient in gradients])
+                    self.gradients_ready.wait()
+
+                except threading.BrokenBarrierError:
+                    # The main Learner has stopped
+                    break
+
+        print("Learner process %i finished!" %self.n_learner)
@@ -51,8 +51,16 @@ import signal # to catch tsp -k
 
 # My own
 from learner import Learner
+from evaluator import Evaluator
+from suite_evaluator import SuiteEvaluator
+from telemetry import write_status_file
+from resume_manifest import read_resume_manifest
 from replay_buffer import ReplayBuffer
 from prioritized_replay_buffer import PrioritizedReplayBuffer
+from shared_replay_buffer import SharedReplayBuffer
+from learner_process import LearnerProcess, generate_shared_memory, generate_config
+from environment_worker import EnvironmentWorker
+from episode_renderer import EpisodeRenderer
 from settings import Settings
 import saver
 
@@ -76,16 +84,29 @@ start_time = time.time()
 # Clearing Tensorflow graph
 tf.reset_default_graph()
 
+# Pin main.py (and the learner processes it starts) to its CPU cores, if desired.
+# Done first, so the learners' thread counts are split over the pinned cores.
+if Settings.LEARNER_CPUS is not None:
+    os.sched_setaffinity(0, Settings.LEARNER_CPUS)
+
 # Setting Tensorflow configuration parameters
 config = tf.ConfigProto()
-config.intra_op_parallelism_threads = 0 # auto-picked by tensorflow yields best results
-config.inter_op_parallelism_threads = 0 # auto-picked by tensorflow yields best results
+config.intra_op_parallelism_threads = Settings.TF_INTRA_OP_THREADS # 0 -> auto-picked by tensorflow, which usually yields the best results
+config.inter_op_parallelism_threads = Settings.TF_INTER_OP_THREADS # 0 -> auto-picked by tensorflow (use calibrate.py to check on a new machine)
+if Settings.NUMBER_OF_LEARNERS > 1:
+    # Split the CPU cores between the learners instead
+    config = generate_config()
 
 # Check if we're using the right environment
 if Settings.ENVIRONMENT != 'manipulator' and Settings.RESUME_TRAINING == False:
     print("You must set RESUME_TRAINING to True in settings.py if you wish to use environment_fixedICs")
     raise SystemExit
 
+# Check that the replay buffer can be shared between learners
+if Settings.NUMBER_OF_LEARNERS > 1 and Settings.PRIORITY_REPLAY_BUFFER:
+    print("The prioritized replay buffer cannot be shared between learners. Set PRIORITY_REPLAY_BUFFER to False or NUMBER_OF_LEARNERS to 1 in settings.py")
+    raise SystemExit
+
 ############################################################
 ##### New run or continuing a partially completed one? #####
 ############################################################
@@ -95,34 +116,43 @@ if Settings.RESUME_TRAINING and Settings.ENVIRONMENT == 'manipulator':
     starting_episode_number   = np.zeros(Settings.NUMBER_OF_ACTORS, dtype = np.int32) # initializing
     starting_iteration_number = 0 # initializing
     print("\nTrying to resume training")
-    print("\nReading tensorboard file to see where to start...", end = "")
-    try:
-        # Grab the tensorboard path
-        old_tensorboard_filename = [i for i in sorted(os.listdir('..')) if i.endswith(Settings.TENSORBOARD_FILE_EXTENSION)][-1]
-
-        # For every entry in the tensorboard file
-        for tensorboard_entry in tf.train.summary_iterator("../" + old_tensorboard_filename):
-            # Search each one for the Loss value so you can find the final iteration number
-            for tensorboard_value in tensorboard_entry.summary.value:
-                if tensorboard_value.tag == 'Logging_Learning/Loss':
-                    starting_iteration_number = max(tensorboard_entry.step, starting_iteration_number)
-
-            # Search also for the actors so you can find what episode they were on
-            for agent_number in range(Settings.NUMBER_OF_ACTORS):
+
+    # Try the resume manifest first, since it is instant. Fall back to scanning the tensorboard file.
+    resume_manifest = read_resume_manifest()
+    if resume_manifest is not None:
+        print("\nResuming from the manifest of " + resume_manifest['checkpoint'] + "\n")
+        starting_iteration_number = resume_manifest['training_iteration']
+        starting_episode_number   = np.asarray(resume_manifest['episode_numbers'], dtype = np.int32)
+    else:
+        print("\nReading tensorboard file to see where to start...", end = "")
+        try:
+            # Grab the tensorboard path
+            old_tensorboard_filename = [i for i in sorted(os.listdir('..')) if i.endswith(Settings.TENSORBOARD_FILE_EXTENSION)][-1]
+
+            # For every entry in the tensorboard file
+            for tensorboard_entry in tf.train.summary_iterator("../" + old_tensorboard_filename):
+                # Search each one for the Loss value so you can find the final iteration number
                 for tensorboard_value in tensorboard_entry.summary.value:
-                    if tensorboard_value.tag == 'Agent_' + str(agent_number + 1) + '/Number_of_timesteps':
-                        starting_episode_number[agent_number] = max(tensorboard_entry.step, starting_episode_number[agent_number])
-        print("Done!\n")
-    except:
-        # If the load failed... quit run
-        print("\n\nError! Couldn't load in old tensorboard file! Quitting run.\nIf this is a new run, turn off RESUME_TRAINING")
-        raise SystemExit
+                    if tensorboard_value.tag == 'Logging_Learning/Loss':
+                        starting_iteration_number = max(tensorboard_entry.step, starting_iteration_number)
+
+                # Search also for the actors so you can find what episode they were on
+                for agent_number in range(Settings.NUMBER_OF_ACTORS):
+                    for tensorboard_value in tensorboard_entry.summary.value:
+                        if tensorboard_value.tag == 'Agent_' + str(agent_number + 1) + '/Number_of_timesteps':
+                            starting_episode_number[agent_number] = max(tensorboard_entry.step, starting_episode_number[agent_number])
+            print("Done!\n")
+        except:
+            # If the load failed... quit run
+            print("\n\nError! Couldn't load in old tensorboard file! Quitting run.\nIf this is a new run, turn off RESUME_TRAINING")
+            raise SystemExit
 
 elif Settings.RESUME_TRAINING and Settings.ENVIRONMENT != 'manipulator':
     # Checking the behaviour from given initial conditions, assume the old filename but don't load in the tensorboard file.
     filename                  = ''
     starting_episode_number   = np.ones(Settings.NUMBER_OF_ACTORS, dtype = int) # All actors start at episode 0
     starting_iteration_number = 1 # learner starts at iteration 0
+    resume_manifest           = None
     
     # Set the max number of episodes to 2 so that we stop quickly
     Settings.NUMBER_OF_EPISODES = 2
@@ -132,6 +162,7 @@ else: # Otherwise, we are starting from scratch
     filename                  = Settings.RUN_NAME + '-{:%Y-%m-%d_%H-%M}'.format(datetime.datetime.now())
     starting_episode_number   = np.ones(Settings.NUMBER_OF_ACTORS, dtype = int) # All actors start at episode 0
     starting_iteration_number = 1 # learner starts at iteration 0
+    resume_manifest           = None
 
 # Generate writer that will log Tensorboard scalars & graph
 if Settings.ENVIRONMENT != 'fixedICs':
@@ -150,6 +181,20 @@ if not Settings.RESUME_TRAINING:
     for each_file in files_grabbed:
         shutil.copy2(each_file, Settings.MODEL_SAVE_DIRECTORY + filename + '/code/')
 
+############################################
+##### Starting extra learner processes #####
+############################################
+# These must be started before the Tensorflow session below, since Tensorflow cannot be forked.
+# They sample from a replay buffer held in shared memory, so it is created here too.
+learner_processes = []
+if Settings.NUMBER_OF_LEARNERS > 1:
+    replay_buffer = SharedReplayBuffer(filename)
+    shared_parameters, shared_gradients, parameters_ready, gradients_ready = generate_shared_memory()
+    for i in range(1, Settings.NUMBER_OF_LEARNERS):
+        learner_process = LearnerProcess(i+1, replay_buffer, shared_parameters, shared_gradients, parameters_ready, gradients_ready) # the main learner is learner 1
+        learner_processes.append(multiprocessing.Process(target = learner_process.run, daemon = True)) # daemon ensures process is killed when main ends
+        learner_processes[-1].start()
+
 #######################################
 ##### Starting Tensorflow session #####
 #######################################
@@ -194,8 +239,11 @@ with tf.Session(config = config) as sess:
     # Initializing saver class (for loading & saving data)
     saver = saver.Saver(sess, filename)
 
-    # Initializing replay buffer, with the option of a prioritized replay buffer
-    if Settings.PRIORITY_REPLAY_BUFFER:
+    # Initializing replay buffer, with the option of a prioritized replay buffer.
+    # The shared replay buffer has already been created if there are several learners.
+    if Settings.NUMBER_OF_LEARNERS > 1:
+        pass
+    elif Settings.PRIORITY_REPLAY_BUFFER:
         # Loading is not implemented for prioritized replay buffer
         replay_buffer = PrioritizedReplayBuffer()
     else:
@@ -204,6 +252,7 @@ with tf.Session(config = config) as sess:
     # Initializing thread & process list
     threads = []
     environment_processes = []
+    agents = []
 
     # Event()s are used to communicate with threads while they run.
     # In this case, it is used to signal to the threads when it is time to stop gracefully.
@@ -215,16 +264,33 @@ with tf.Session(config = config) as sess:
     if Settings.USE_GPU_WHEN_AVAILABLE:
         # Allow GPU use when appropriate
         learner = Learner(sess, saver, replay_buffer, writer)
-        # Generate the queue responsible for communicating with the agent (for test distribution calculating)
-        agent_to_learner, learner_to_agent = learner.generate_queue()
     else:
         # Forcing to the CPU only
         with tf.device('/device:CPU:0'):
             learner = Learner(sess, saver, replay_buffer, writer)
-            # Generate the queue responsible for communicating with the agent (for test distribution calculating)
-            agent_to_learner, learner_to_agent = learner.generate_queue()
+    # Connect the learner to the extra learner processes, if used
+    if Settings.NUMBER_OF_LEARNERS > 1:
+        learner.connect_learner_processes(shared_parameters, shared_gradients, parameters_ready, gradients_ready)
     threads.append(threading.Thread(target = learner.run, args = (stop_run_flag, replay_buffer_dump_flag, starting_iteration_number)))
 
+    # Generating the evaluator, which calculates the q-distributions for rendered episodes outside of the learner.
+    # It is not in the threads list since it runs until the learner stops.
+    evaluator = Evaluator(sess, learner)
+    # Generate the queue responsible for communicating with the agent (for test distribution calculating)
+    agent_to_evaluator, evaluator_to_agent = evaluator.generate_queue()
+    evaluator_threads = [threading.Thread(target = evaluator.run, args = (stop_run_flag,), daemon = True)]
+
+    # Generating the suite evaluator, which periodically evaluates the greedy policy on a fixed suite of initial conditions
+    if Settings.SUITE_EVALUATION and Settings.ENVIRONMENT == 'manipulator':
+        suite_evaluator = SuiteEvaluator(sess, learner, writer)
+        evaluator_threads.append(threading.Thread(target = suite_evaluator.run, args = (stop_run_flag,), daemon = True))
+
+    # Generating the renderer, which renders agent 1's videos in the background
+    if Settings.RECORD_VIDEO and Settings.PARALLEL_RENDERING and Settings.ENVIRONMENT in ['manipulator', 'fixedICs']:
+        renderer = EpisodeRenderer(Settings.ENVIRONMENT, Settings.RENDER_PROCESSES, Settings.RENDER_QUEUE_SIZE)
+    else:
+        renderer = None
+
     # Generating the actors and placing them into their own threads
     for i in range(Settings.NUMBER_OF_ACTORS):
         if Settings.USE_GPU_WHEN_AVAILABLE:
@@ -232,12 +298,14 @@ with tf.Session(config = config) as sess:
             # Make an instance of the environment which will be placed in its own process
             if Settings.ENVIRONMENT == 'gym':
                 environment = environment_file.Environment(filename, i+1, Settings.CHECK_GREEDY_PERFORMANCE_EVERY_NUM_EPISODES, Settings.VIDEO_RECORD_FREQUENCY, Settings.MODEL_SAVE_DIRECTORY) # Additional parameters needed for gym
+            elif Settings.LEAN_ENVIRONMENTS:
+                environment = EnvironmentWorker(Settings.ENVIRONMENT, i+1, None if Settings.ENVIRONMENT_CPUS is None else [Settings.ENVIRONMENT_CPUS[i % len(Settings.ENVIRONMENT_CPUS)]]) # launched in its own lightweight process
             else:
                 environment = environment_file.Environment()
             # Generate the queue responsible for communicating with the agent
             agent_to_env, env_to_agent = environment.generate_queue()
             # Generate the actor
-            actor = agent_file.Agent(sess, i+1, agent_to_env, env_to_agent, replay_buffer, writer, filename, learner.actor.parameters, agent_to_learner, learner_to_agent)
+            actor = agent_file.Agent(sess, i+1, agent_to_env, env_to_agent, replay_buffer, writer, filename, learner.actor.parameters, agent_to_evaluator, evaluator_to_agent, renderer)
 
         else:
             with tf.device('/device:CPU:0'):
@@ -245,20 +313,26 @@ with tf.Session(config = config) as sess:
                 # Make an instance of the environment which will be placed in its own process
                 if Settings.ENVIRONMENT == 'gym':
                     environment = environment_file.Environment(filename, i+1, Settings.CHECK_GREEDY_PERFORMANCE_EVERY_NUM_EPISODES, Settings.VIDEO_RECORD_FREQUENCY, Settings.MODEL_SAVE_DIRECTORY) # Additional parameters needed for gym
+                elif Settings.LEAN_ENVIRONMENTS:
+                    environment = EnvironmentWorker(Settings.ENVIRONMENT, i+1, None if Settings.ENVIRONMENT_CPUS is None else [Settings.ENVIRONMENT_CPUS[i % len(Settings.ENVIRONMENT_CPUS)]]) # launched in its own lightweight process
                 else:
                     environment = environment_file.Environment()
                 # Generate the queue responsible for communicating with the agent
                 agent_to_env, env_to_agent = environment.generate_queue()
                 # Generate the actor
-                actor = agent_file.Agent(sess, i+1, agent_to_env, env_to_agent, replay_buffer, writer, filename, learner.actor.parameters, agent_to_learner, learner_to_agent)
+                actor = agent_file.Agent(sess, i+1, agent_to_env, env_to_agent, replay_buffer, writer, filename, learner.actor.parameters, agent_to_evaluator, evaluator_to_agent, renderer)
 
         # Add thread and process to the list
+        agents.append(actor)
         threads.append(threading.Thread(target = actor.run, args = (stop_run_flag, replay_buffer_dump_flag, starting_episode_number)))
-        environment_processes.append(multiprocessing.Process(target = environment.run, daemon = True)) # daemon ensures process is killed when main ends
+        if isinstance(environment, EnvironmentWorker):
+            environment_processes.append(environment) # ends when main ends and closes its connection
+        else:
+            environment_processes.append(multiprocessing.Process(target = environment.run, daemon = True)) # daemon ensures process is killed when main ends
 
     # If desired, try to load in partially-trained parameters
     if Settings.RESUME_TRAINING == True:
-        if not saver.load():
+        if not saver.load(resume_manifest['checkpoint'] if resume_manifest is not None else None):
             # If loading was not successful -> quit program
             print("Could not load in parameters... quitting program")
             raise SystemExit
@@ -270,10 +344,17 @@ with tf.Session(config = config) as sess:
         sess.run(tf.global_variables_initializer())
 
 
+    # The learner records each agent's episode in the resume manifest
+    learner.connect_agents(agents)
+
     # Starting all environments
     for each_process in environment_processes:
         each_process.start()
 
+    # Starting the renderer
+    if renderer is not None:
+        renderer.start()
+
     #############################################
     ##### STARTING EXECUTION OF ALL THREADS #####
     #############################################
@@ -282,6 +363,8 @@ with tf.Session(config = config) as sess:
     for each_thread in threads:                 #
     #                                           #
         each_thread.start()                     #
+    for each_thread in evaluator_threads:       #
+        each_thread.start()                     #
     #                                           #
     #                                           #
     #############################################
@@ -309,6 +392,13 @@ with tf.Session(config = config) as sess:
             time.sleep(0.5)
             if counter % 1200 == 0:
                 print("Main.py (Environment %s) is using %2.3f GB of RAM and the buffer has %i samples" %(Settings.RUN_NAME, process.memory_info().rss/1000000000.0, replay_buffer.how_filled()))
+                # Report the memory of each lightweight environment worker
+                worker_memory = [each_process.resident_memory()/1000000.0 for each_process in environment_processes if isinstance(each_process, EnvironmentWorker)]
+                if worker_memory:
+                    print("The %i environment workers are using %2.3f GB of RAM in total (%s MB each)" %(len(worker_memory), sum(worker_memory)/1000.0, ', '.join('%.0f' %memory for memory in worker_memory)))
+            # Periodically write the learner and agent telemetry to status.json
+            if counter % (2*Settings.WRITE_STATUS_FILE_EVERY_NUM_SECONDS) == 0 and Settings.ENVIRONMENT != 'fixedICs':
+                write_status_file(filename, learner, agents, replay_buffer)
             counter += 1
 
             # If all agents have finished, gracefully stop the learner and end
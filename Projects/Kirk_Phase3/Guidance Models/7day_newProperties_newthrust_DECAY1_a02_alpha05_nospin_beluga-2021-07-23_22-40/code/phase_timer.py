@@ -0,0 +1,59 @@
+"""
+Times the phases of a loop (e.g., each part of a learner training iteration)
+so we can see where the time goes.
+
+Each phase keeps its most recent Settings.PHASE_TIMING_WINDOW durations in a
+ring buffer. Recording a duration is two clock reads and an array write, so it
+is cheap enough to leave on all the time. The rolling mean and 99th percentile
+of each phase are calculated only when they are logged to Tensorboard.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import time
+import numpy as np
+import tensorflow as tf
+
+from settings import Settings
+
+class PhaseTimer:
+
+    def __init__(self, window = Settings.PHASE_TIMING_WINDOW):
+        self.window = window
+        self.durations = {} # [s] ring buffer of recent durations for each phase
+        self.counts = {} # how many times each phase has been recorded
+        self.start_time = time.perf_counter()
+
+    def start(self):
+        # Mark the start of a phase
+        self.start_time = time.perf_counter()
+
+    def stop(self, phase):
+        # Record the time since start() under this phase name, and start the next phase
+        now = time.perf_counter()
+        self.record(phase, now - self.start_time)
+        self.start_time = now
+
+    def record(self, phase, duration):
+        # Add a duration to this phase's ring buffer, creating it the first time the phase is seen
+        if phase not in self.durations:
+            self.durations[phase] = np.zeros(self.window)
+            self.counts[phase] = 0
+        self.durations[phase][self.counts[phase] % self.window] = duration
+        self.counts[phase] += 1
+
+    def statistics(self):
+        # Returns {phase: (rolling mean, 99th percentile)} in seconds
+        statistics = {}
+        for phase, durations in list(self.durations.items()): # list() since another thread may add a phase meanwhile
+            recent_durations = durations[:min(self.counts[phase], self.window)]
+            statistics[phase] = (np.mean(recent_durations), np.percentile(recent_durations, 99))
+        return statistics
+
+    def summary(self, namespace = 'Perf'):
+        # Builds a Tensorboard summary of every phase, in milliseconds, without needing the graph
+        values = []
+        for phase, (mean, p99) in sorted(self.statistics().items()):
+            values.append(tf.Summary.Value(tag = namespace + '/' + phase + '_mean_ms', simple_value = mean*1000))
+            values.append(tf.Summary.Value(tag = namespace + '/' + phase + '_p99_ms',  simple_value = p99*1000))
+        return tf.Summary(value = values)
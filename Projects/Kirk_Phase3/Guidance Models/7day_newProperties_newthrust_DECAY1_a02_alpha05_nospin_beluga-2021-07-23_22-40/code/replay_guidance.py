@@ -0,0 +1,230 @@
+"""
+Replays a recorded experiment through use_deep_guidance_arm.py, without the Pi,
+the PhaseSpace or jetsonRepeater.py, and records what the guidance sends back
+and how long it takes.
+
+This script stands in for jetsonRepeater.py: it listens on the same Unix socket,
+starts use_deep_guidance_arm.py (unchanged, with testing = False) and sends it the
+messages from REPLAY_FILE, which is either:
+    - a deep_guidance_data_*.txt log saved by use_deep_guidance_arm.py. Each
+      timestep's 19 received values are sent as text, or as binary frames if
+      BINARY_FRAMES (which must match USE_BINARY_FRAMES in use_deep_guidance_arm.py).
+      Repeated rows, where the guidance ran again on the same message, are sent once.
+    - a capture saved by jetsonRepeater.py (CAPTURE_PI_MESSAGES). Every message is
+      sent exactly as the Pi sent it. SPOTNet messages are skipped.
+
+The messages are sent either:
+    - REAL_TIME = True:  at the times they were recorded, as the Pi would.
+    - REAL_TIME = False: as fast as possible, each one as soon as the guidance has
+                         answered the one before (or after OUTPUT_TIMEOUT). This is
+                         the guidance's throughput, and no message is overwritten.
+
+Outputs, in OUTPUT_DIRECTORY:
+    - <replay file>_replay.csv: for every message sent, when it was sent, the
+                                guidance that came back for it and when, and, for a
+                                log, the guidance that was recorded in the experiment.
+    - the data log and latency statistics that use_deep_guidance_arm.py saved
+    - guidance_output.txt: everything use_deep_guidance_arm.py printed
+
+Any Linux machine with this code, and the policy it uses, can run this.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+import os
+import sys
+import csv
+import glob
+import time
+import signal
+import socket
+import threading
+import subprocess
+import numpy as np
+
+from experiment_logger import load_experiment_log
+from guidance_frames import encode_frame, decode_frame, FrameError, INPUT_MESSAGE, OUTPUT_VALUES
+
+# stream_framer.py is shared with jetsonRepeater.py, in Projects/Kirk_Phase3/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../'))
+from stream_framer import StreamFramer, FRAME_START, SPOTNET_START, read_capture
+
+REPLAY_FILE      = '../../../Saved Data/ExperimentData_RED_2021_8_10_12_35/deep_guidance_data_2021-08-10_12-35-47.txt' # a deep_guidance_data_*.txt log or a jetsonRepeater_*.capture
+REAL_TIME        = False # send the messages at the recorded times, instead of as fast as the guidance answers them
+BINARY_FRAMES    = False # send a log's messages as binary frames. Must match USE_BINARY_FRAMES in use_deep_guidance_arm.py
+REPEATER_ADDRESS = "/tmp/jetsonRepeater" # the Unix socket use_deep_guidance_arm.py connects to
+OUTPUT_DIRECTORY = 'Replay/'
+STARTUP_TIMEOUT  = 120. # [s] how long to wait for use_deep_guidance_arm.py to connect and answer the first message
+OUTPUT_TIMEOUT   = 1. # [s] when not in REAL_TIME, how long to wait for an answer before sending the next message anyway
+FINAL_WAIT       = 1. # [s] how long to wait for the last answers before stopping the guidance
+
+def load_replay_messages(filename):
+    # Returns the messages to send as a list of (time [s], message bytes, 19 values), and the recorded guidance (or None)
+    if filename.endswith('.capture'):
+        messages = []
+        for arrival_time, message in read_capture(filename):
+            if message.startswith(SPOTNET_START):
+                continue
+            if message.startswith(FRAME_START):
+                _, _, _, values = decode_frame(message)
+            else:
+                values = np.array(message.decode("utf-8").splitlines(), dtype = np.float64)
+            messages.append((arrival_time, message, values))
+        return messages, None
+
+    # A deep_guidance_data_*.txt log: [Pi_time, 6 x guidance, 18 x received state, docked]
+    data = np.asarray(load_experiment_log(filename))
+    
+    # Older logs have a row every time the guidance ran, even when no new message had arrived. Only the first row of each message is sent.
+    new_message = np.concatenate([[True], np.any(data[1:, [0] + list(range(7, 25))] != data[:-1, [0] + list(range(7, 25))], axis = 1)])
+    data = data[new_message]
+    messages = []
+    for row_number, row in enumerate(data):
+        values = np.concatenate([row[:1], row[7:25]])
+        if BINARY_FRAMES:
+            message = encode_frame(INPUT_MESSAGE, row_number + 1, values[0], values)
+        else:
+            message = "".join(str(value) + "\n" for value in values).encode()
+        messages.append((values[0], message, values))
+    return messages, np.concatenate([data[:, 1:7], data[:, 25:26]], axis = 1)
+
+
+class OutputReceiver:
+    # Receives the guidance's answers in the background and notes when each arrived, and which message had been sent last
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.framer = StreamFramer(OUTPUT_VALUES)
+        self.outputs = [] # (time received, number of messages sent so far, [7 values])
+        self.messages_sent = 0
+        self.condition = threading.Condition()
+        self.stop_flag = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_flag.is_set():
+            try:
+                data = self.connection.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if len(data) == 0:
+                break
+            received_time = time.perf_counter()
+            for message in self.framer.feed(data):
+                try:
+                    if message.startswith(FRAME_START):
+                        _, _, _, values = decode_frame(message)
+                    else:
+                        values = np.array(message.decode("utf-8").splitlines(), dtype = np.float64)
+                except (FrameError, ValueError):
+                    continue
+                with self.condition:
+                    self.outputs.append((received_time, self.messages_sent, values))
+                    self.condition.notify_all()
+
+    def wait_for_answer(self, messages_sent, timeout):
+        # Waits until an answer arrives after messages_sent messages had been sent. Returns whether one did.
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.outputs) > 0 and self.outputs[-1][1] >= messages_sent, timeout)
+
+
+def start_guidance():
+    # Listens on the repeater's socket and starts use_deep_guidance_arm.py, which connects to it
+    try:
+        os.remove(REPEATER_ADDRESS)
+    except OSError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(REPEATER_ADDRESS)
+    server.listen(1)
+    server.settimeout(STARTUP_TIMEOUT)
+
+    # Python ignores Ctrl+C if it starts with SIGINT ignored (as in a background job), so it is restored for the guidance to be stopped gently
+    guidance_output = open(OUTPUT_DIRECTORY + 'guidance_output.txt', 'w')
+    guidance_process = subprocess.Popen([sys.executable, 'use_deep_guidance_arm.py'], stdout = guidance_output, stderr = subprocess.STDOUT,
+                                        preexec_fn = lambda: signal.signal(signal.SIGINT, signal.SIG_DFL))
+    try:
+        connection, _ = server.accept()
+    except socket.timeout:
+        guidance_process.kill()
+        print("use_deep_guidance_arm.py didn't connect within %i seconds, see %sguidance_output.txt" %(STARTUP_TIMEOUT, OUTPUT_DIRECTORY))
+        raise SystemExit
+    connection.settimeout(0.1)
+    return server, connection, guidance_process
+
+
+def stop_guidance(server, connection, guidance_process):
+    # Stops use_deep_guidance_arm.py as Ctrl+C would, so it saves its log, and closes the socket
+    guidance_process.send_signal(signal.SIGINT)
+    guidance_process.wait()
+    connection.close()
+    server.close()
+    os.remove(REPEATER_ADDRESS)
+
+
+def percentiles_ms(durations):
+    return ", ".join("p%g %.3f" %(percent, np.percentile(durations, percent)*1000) for percent in [50, 90, 99]) + ", max %.3f ms" %(np.max(durations)*1000)
+
+
+os.makedirs(OUTPUT_DIRECTORY, exist_ok = True)
+messages, recorded_guidance = load_replay_messages(REPLAY_FILE)
+print("Replaying %i messages from %s %s" %(len(messages), REPLAY_FILE, "in real time" if REAL_TIME else "as fast as possible"))
+
+start_time = time.time()
+server, connection, guidance_process = start_guidance()
+receiver = OutputReceiver(connection)
+
+# The first message also waits for the guidance to finish starting up
+sent_times = []
+for message_number, (message_time, message, _) in enumerate(messages):
+    if REAL_TIME and message_number > 0:
+        time.sleep(max(0., sent_times[0] + message_time - messages[0][0] - time.perf_counter()))
+    with receiver.condition:
+        connection.sendall(message)
+        sent_times.append(time.perf_counter())
+        receiver.messages_sent = message_number + 1
+    if not REAL_TIME or message_number == 0:
+        if not receiver.wait_for_answer(message_number + 1, STARTUP_TIMEOUT if message_number == 0 else OUTPUT_TIMEOUT) and message_number == 0:
+            print("use_deep_guidance_arm.py didn't answer the first message, see %sguidance_output.txt" %OUTPUT_DIRECTORY)
+            break
+receiver.wait_for_answer(len(sent_times), FINAL_WAIT)
+receiver.stop_flag.set()
+stop_guidance(server, connection, guidance_process)
+
+# Each answer is for the newest message sent before it arrived (the guidance only ever uses the newest)
+guidance_for_message = {}
+for received_time, messages_sent, values in receiver.outputs:
+    guidance_for_message[messages_sent - 1] = (received_time, values)
+
+replay_name = os.path.splitext(os.path.basename(REPLAY_FILE))[0]
+with open(OUTPUT_DIRECTORY + replay_name + '_replay.csv', 'w', newline = '') as replay_file:
+    writer = csv.writer(replay_file)
+    header = ['message', 'Pi_time', 'sent_time', 'received_time', 'round_trip_time'] + ['guidance_%i' %i for i in range(OUTPUT_VALUES)]
+    if recorded_guidance is not None:
+        header += ['recorded_guidance_%i' %i for i in range(OUTPUT_VALUES)]
+    writer.writerow(header)
+    for message_number, (message_time, _, values) in enumerate(messages[:len(sent_times)]):
+        received_time, guidance = guidance_for_message.get(message_number, (np.nan, np.full(OUTPUT_VALUES, np.nan)))
+        row = [message_number, values[0], sent_times[message_number] - sent_times[0], received_time - sent_times[0], received_time - sent_times[message_number]] + list(guidance)
+        if recorded_guidance is not None:
+            row += list(recorded_guidance[message_number])
+        writer.writerow(row)
+
+# use_deep_guidance_arm.py saved its log and latency statistics where it ran
+for filename in glob.glob('deep_guidance_data_*.txt') + glob.glob('deep_guidance_latency_*.json'):
+    if os.path.getmtime(filename) >= start_time:
+        os.replace(filename, OUTPUT_DIRECTORY + filename)
+
+# Summary
+answered = sorted(guidance_for_message)
+round_trip_times = np.array([guidance_for_message[message_number][0] - sent_times[message_number] for message_number in answered[1:]]) # the first includes starting up
+duration = sent_times[-1] - sent_times[0]
+print("Sent %i messages in %.2f s (%.1f per second), %i answered" %(len(sent_times), duration, (len(sent_times) - 1)/max(duration, 1e-9), len(answered)))
+if len(round_trip_times) > 0:
+    print("Round trip: " + percentiles_ms(round_trip_times))
+if recorded_guidance is not None and answered:
+    guidance_difference = np.max([np.abs(guidance_for_message[message_number][1] - recorded_guidance[message_number]) for message_number in answered], axis = 0)
+    print("Largest difference from the recorded guidance: " + str(guidance_difference))
+print("Saved to " + OUTPUT_DIRECTORY)
@@ -0,0 +1,252 @@
+"""
+Re-simulates every logged experiment with the trained policy and compares the
+simulated and experimental trajectories.
+
+Previously, comparing an experiment to simulation meant copying its log into this
+folder, setting DATA_FILE_TIME in environment_fixedICs.py, and running one episode
+by hand. Here, every deep_guidance_data_*.txt under SAVED_DATA_DIRECTORY (as saved by
+use_deep_guidance_arm.py) is:
+    1) Used as the initial conditions of environment_fixedICs.py (the first entry of the log).
+    2) Simulated with the trained policy (the latest checkpoint in CHECKPOINT_DIRECTORY),
+       without noise, for as long as the experiment lasted or until the episode ends.
+    3) Compared to the experiment at every simulated timestep (the experiment is
+       interpolated to the simulation's times).
+
+The experiments are simulated in parallel by NUMBER_OF_WORKERS environment workers
+(environment_worker.py) that all step at the same time, while the policy is run on
+all of their states at once.
+
+Outputs, in OUTPUT_DIRECTORY:
+    - errors.csv: one row per experiment with the RMS and final errors of the chaser,
+                  arm, and target states, and whether/when each of them docked
+    - <experiment>_resimulated.txt: the simulated time, TOTAL_STATEs, and actions
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+import os
+import csv
+import glob
+import time
+import numpy as np
+import tensorflow as tf
+from collections import deque
+
+from build_neural_networks import BuildActorNetwork
+from environment_worker import EnvironmentWorker
+from experiment_logger import load_experiment_log
+from settings import Settings
+
+SAVED_DATA_DIRECTORY = '../../../Saved Data/' # searched for deep_guidance_data_*.txt, including sub-folders
+INCLUDE_FAILED       = True # whether to include the experiments in FAIL_ folders
+CHECKPOINT_DIRECTORY = '../' # the policy is loaded from the latest checkpoint here
+NUMBER_OF_WORKERS    = 8 # experiments simulated at once
+OUTPUT_DIRECTORY     = 'Resimulation/'
+
+# Columns of the experiment logs that are compared, and where the same quantity is in the TOTAL_STATE
+LOG_TIME_COLUMN   = 0
+LOG_DOCKED_COLUMN = 25
+COMPARED_STATES   = {'chaser_x':       (7,  0), # [m]
+                     'chaser_y':       (8,  1), # [m]
+                     'chaser_theta':   (9,  2), # [rad]
+                     'shoulder_theta': (19, 6), # [rad]
+                     'elbow_theta':    (20, 7), # [rad]
+                     'wrist_theta':    (21, 8), # [rad]
+                     'target_x':       (13, 12), # [m]
+                     'target_y':       (14, 13), # [m]
+                     'target_theta':   (15, 14)} # [rad]
+ANGLES            = ['chaser_theta', 'shoulder_theta', 'elbow_theta', 'wrist_theta', 'target_theta']
+
+
+def find_experiment_logs():
+    # Returns the filename of every experiment log, sorted by folder
+    log_filenames = sorted(glob.glob(SAVED_DATA_DIRECTORY + '**/deep_guidance_data_*.txt', recursive = True))
+    if not INCLUDE_FAILED:
+        log_filenames = [log_filename for log_filename in log_filenames if not os.path.basename(os.path.dirname(log_filename)).startswith('FAIL_')]
+    return [os.path.abspath(log_filename) for log_filename in log_filenames]
+
+
+def experiment_name(log_filename):
+    # The experiment's folder name (e.g., ExperimentData_RED_2021_8_10_12_35) is used to identify it
+    return os.path.basename(os.path.dirname(log_filename))
+
+
+def make_observation(total_state, past_actions):
+    # Processes the total_state exactly as the agent does
+    if Settings.AUGMENT_STATE_WITH_ACTION_LENGTH > 0:
+        total_state = np.concatenate([total_state, np.reshape(past_actions, [-1])])
+    if Settings.NORMALIZE_STATE:
+        total_state = (total_state - Settings.STATE_MEAN)/Settings.STATE_HALF_RANGE
+    return np.delete(total_state, Settings.IRRELEVANT_STATES)
+
+
+def load_policy():
+    # Builds the actor and loads the trained parameters into it
+    state_placeholder = tf.placeholder(dtype = tf.float32, shape = [None, Settings.OBSERVATION_SIZE], name = "state_placeholder")
+    policy = BuildActorNetwork(state_placeholder, scope = 'learner_actor_main')
+    sess = tf.Session()
+
+    ckpt = tf.train.get_checkpoint_state(CHECKPOINT_DIRECTORY)
+    if ckpt is None:
+        print("No checkpoint found in %s... :(" %CHECKPOINT_DIRECTORY)
+        raise SystemExit
+    tf.train.Saver(var_list = policy.parameters).restore(sess, ckpt.model_checkpoint_path)
+    print("Model %s successfully loaded!" %ckpt.model_checkpoint_path)
+
+    return sess, state_placeholder, policy
+
+
+def resimulate(log_filenames, sess, state_placeholder, policy):
+    # Simulates the policy from the initial conditions of every log.
+    # Returns {log_filename: (times, total_states, actions, docked)}.
+    waiting_logs = deque(log_filenames)
+    durations = {log_filename: np.ptp(load_experiment_log(log_filename)[:, LOG_TIME_COLUMN]) for log_filename in log_filenames}
+
+    workers = [EnvironmentWorker('fixedICs', n + 1) for n in range(min(NUMBER_OF_WORKERS, len(log_filenames)))]
+    queues = [worker.generate_queue()[0] for worker in workers]
+    for worker in workers:
+        worker.start()
+
+    # What each worker is currently doing
+    current_logs = [None]*len(workers)
+    observations = [None]*len(workers)
+    past_actions = [None]*len(workers)
+    total_states = [None]*len(workers)
+    actions      = [None]*len(workers)
+
+    results = {}
+
+    def start_experiment(n):
+        # Reset worker n to the initial conditions of the next log, if there are any left
+        if not waiting_logs:
+            return False
+        current_logs[n] = waiting_logs.popleft()
+        queues[n].put((True, True, current_logs[n])) # (reset, test_time, log_filename)
+        total_state = queues[n].get()
+        past_actions[n] = deque([np.zeros(Settings.ACTION_SIZE)]*Settings.AUGMENT_STATE_WITH_ACTION_LENGTH, maxlen = Settings.AUGMENT_STATE_WITH_ACTION_LENGTH)
+        observations[n] = make_observation(total_state, past_actions[n])
+        total_states[n] = [total_state]
+        actions[n] = []
+        return True
+
+    active_workers = [n for n in range(len(workers)) if start_experiment(n)]
+
+    while active_workers:
+        # Run the policy on every active worker's state at once
+        policy_actions = sess.run(policy.action_scaled, feed_dict = {state_placeholder: np.asarray([observations[n] for n in active_workers])})
+
+        # Send all the actions first so that the workers step in parallel, then collect the results
+        for n, action in zip(active_workers, policy_actions):
+            queues[n].put((action,))
+            actions[n].append(action)
+            if Settings.AUGMENT_STATE_WITH_ACTION_LENGTH > 0:
+                past_actions[n].append(action)
+
+        for n in list(active_workers):
+            next_total_state, _, done = queues[n].get()
+            total_states[n].append(next_total_state)
+            observations[n] = make_observation(next_total_state, past_actions[n])
+
+            # Stop once the episode ends or the experiment would have ended
+            if done or (len(total_states[n]) - 1)*Settings.TIMESTEP >= durations[current_logs[n]]:
+                queues[n].put((False,))
+                docked = queues[n].get()[0]
+
+                # No action is taken in the final state
+                actions[n].append(np.full(Settings.ACTION_SIZE, np.nan))
+                results[current_logs[n]] = (np.arange(len(total_states[n]))*Settings.TIMESTEP, np.asarray(total_states[n]), np.asarray(actions[n]), docked)
+                print("Resimulated %s (%i of %i)" %(experiment_name(current_logs[n]), len(results), len(log_filenames)))
+
+                # Move on to the next experiment
+                if not start_experiment(n):
+                    active_workers.remove(n)
+
+    # Closing the connections ends the workers
+    for worker in workers:
+        worker.agent_connection.close()
+        worker.process.wait()
+
+    return results
+
+
+def compare(log_filename, times, total_states, docked):
+    # Returns a row of the error table for one experiment
+    data = load_experiment_log(log_filename)
+    experiment_times = data[:, LOG_TIME_COLUMN] - data[0, LOG_TIME_COLUMN]
+
+    # Only compare where both the simulation and experiment exist
+    compared = times <= experiment_times[-1]
+    times = times[compared]
+    total_states = total_states[compared]
+
+    row = {'experiment':   experiment_name(log_filename),
+           'duration_s':   experiment_times[-1],
+           'compared_s':   times[-1]}
+
+    errors = {}
+    for state, (log_column, total_state_index) in COMPARED_STATES.items():
+        experiment_values = data[:, log_column]
+        if state in ANGLES:
+            # Unwrap so that interpolating across +/- pi doesn't pass through zero
+            experiment_values = np.unwrap(experiment_values)
+        errors[state] = total_states[:, total_state_index] - np.interp(times, experiment_times, experiment_values)
+        if state in ANGLES:
+            errors[state] = (errors[state] + np.pi) % (2*np.pi) - np.pi
+
+    # Position errors are distances, angle errors are in degrees
+    for body in ['chaser', 'target']:
+        position_error = np.sqrt(errors[body + '_x']**2 + errors[body + '_y']**2)
+        row[body + '_position_rms_m']   = np.sqrt(np.mean(position_error**2))
+        row[body + '_position_final_m'] = position_error[-1]
+    for state in ANGLES:
+        row[state + '_rms_deg']   = np.sqrt(np.mean(errors[state]**2))*180/np.pi
+        row[state + '_final_deg'] = np.abs(errors[state][-1])*180/np.pi
+
+    # Whether, and when, each of them docked
+    experiment_docked = data[:, LOG_DOCKED_COLUMN] > 0
+    row['simulation_docked']       = bool(docked)
+    row['experiment_docked']       = bool(np.any(experiment_docked))
+    row['simulation_docking_time'] = times[-1] if docked else np.nan
+    row['experiment_docking_time'] = experiment_times[np.argmax(experiment_docked)] if np.any(experiment_docked) else np.nan
+
+    return row
+
+
+#%%
+############################################
+##### Resimulating all the experiments #####
+############################################
+log_filenames = find_experiment_logs()
+if not log_filenames:
+    print("No experiment logs found in %s" %SAVED_DATA_DIRECTORY)
+    raise SystemExit
+print("Resimulating %i experiments with %i environment workers" %(len(log_filenames), min(NUMBER_OF_WORKERS, len(log_filenames))))
+
+sess, state_placeholder, policy = load_policy()
+start_time = time.time()
+results = resimulate(log_filenames, sess, state_placeholder, policy)
+sess.close()
+print("Done resimulating in %.1f s" %(time.time() - start_time))
+
+
+#%%
+####################################
+##### Building the error table #####
+####################################
+os.makedirs(OUTPUT_DIRECTORY, exist_ok = True)
+table = []
+for log_filename in log_filenames:
+    times, total_states, actions, docked = results[log_filename]
+    np.savetxt(OUTPUT_DIRECTORY + experiment_name(log_filename) + '_resimulated.txt', np.column_stack([times, total_states, actions]),
+               header = 'time [s], TOTAL_STATE (%i), action (%i)' %(total_states.shape[1], actions.shape[1]))
+    table.append(compare(log_filename, times, total_states, docked))
+
+columns = list(table[0].keys())
+print("\n" + " | ".join("%40s" %column if column == 'experiment' else "%10s" %column[:10] for column in columns))
+for row in table:
+    print(" | ".join("%40s" %row[column] if column == 'experiment' else ("%10.4g" %row[column] if isinstance(row[column], float) else "%10s" %row[column]) for column in columns))
+
+with open(OUTPUT_DIRECTORY + 'errors.csv', 'w', newline = '') as errors_file:
+    errors_writer = csv.DictWriter(errors_file, fieldnames = columns)
+    errors_writer.writeheader()
+    errors_writer.writerows(table)
+print("Errors saved to %serrors.csv" %OUTPUT_DIRECTORY)
@@ -0,0 +1,52 @@
+"""
+Reads and writes the resume manifest: a small file, updated at every checkpoint,
+that records everything main.py needs to continue a run where it left off:
+    - the training iteration of the checkpoint
+    - the episode each agent had completed
+    - the name of the checkpoint
+The replay buffer is saved alongside each checkpoint, and its dump holds
+everything needed to restore it (including, for the shared replay buffer,
+where the next sample will be written), so it isn't recorded here.
+
+Reading it is instant, whereas finding the same information by scanning the
+Tensorboard file takes minutes after a long run. The Tensorboard scan is still
+used if the manifest is missing (e.g., runs started before it existed).
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import os
+import json
+
+from settings import Settings
+
+MANIFEST_FILENAME = 'resume_manifest.json'
+
+def write_resume_manifest(filename, training_iteration, episode_numbers, checkpoint_path):
+    # Write the manifest to a temporary file and then rename it, so that a crash
+    # part-way through never leaves a half-written manifest behind
+    manifest = {'training_iteration': int(training_iteration),
+                'episode_numbers':    [int(episode_number) for episode_number in episode_numbers],
+                'checkpoint':         os.path.basename(checkpoint_path)}
+
+    manifest_filename = Settings.MODEL_SAVE_DIRECTORY + filename + '/' + MANIFEST_FILENAME
+    with open(manifest_filename + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent = 4)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.replace(manifest_filename + '.tmp', manifest_filename)
+
+def read_resume_manifest(directory = '../'):
+    # Returns the manifest of the run being resumed, or None if it doesn't have one
+    try:
+        with open(directory + MANIFEST_FILENAME, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+    # The manifest is only useful if it matches the current number of agents
+    if len(manifest['episode_numbers']) != Settings.NUMBER_OF_ACTORS:
+        print("The resume manifest is for %i agents, but there are now %i. Ignoring it." %(len(manifest['episode_numbers']), Settings.NUMBER_OF_ACTORS))
+        return None
+
+    return manifest
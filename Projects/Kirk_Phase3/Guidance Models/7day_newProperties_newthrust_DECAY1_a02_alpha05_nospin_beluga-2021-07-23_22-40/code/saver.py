@@ -23,14 +23,17 @@ class Saver:
             print("Saving neural networks at iteration number " + str(n_iteration) + "...")
     
             os.makedirs(os.path.dirname(Settings.MODEL_SAVE_DIRECTORY + self.filename), exist_ok = True)
-            self.saver.save(self.sess, Settings.MODEL_SAVE_DIRECTORY + self.filename + "/Iteration_" + str(n_iteration) + ".ckpt")
+            # Returns the checkpoint's path so it can be recorded in the resume manifest
+            return self.saver.save(self.sess, Settings.MODEL_SAVE_DIRECTORY + self.filename + "/Iteration_" + str(n_iteration) + ".ckpt")
         else:
             print("Skipping saving the networks since we are simulating initial conditions")
+            return None
 
-    def load(self):
+    def load(self, checkpoint_name = None):
         # Try to load in weights to the networks in the current Session.
         # If it fails, or we don't want to load (Settings.RESUME_TRAINING = False)
-        # then we start from scratch
+        # then we start from scratch.
+        # checkpoint_name (from the resume manifest) picks the checkpoint, otherwise the most recent one is found
 
         self.saver = tf.train.Saver(max_to_keep = Settings.NUM_CHECKPOINT_MODELS_TO_SAVE) # initialize the tensorflow Saver()
 
@@ -38,7 +41,10 @@ class Saver:
             print("\nAttempting to load in the most recent previously-trained model")
             try:
                 # Finding the most recent checkpoint file
-                most_recent_checkpoint_filename = [i for i in sorted(os.listdir('..')) if i.endswith('.index')][-1].rsplit('.',1)[0]
+                if checkpoint_name is not None:
+                    most_recent_checkpoint_filename = checkpoint_name
+                else:
+                    most_recent_checkpoint_filename = [i for i in sorted(os.listdir('..')) if i.endswith('.index')][-1].rsplit('.',1)[0]
                 self.saver.restore(self.sess, '../' + most_recent_checkpoint_filename)
                 print("Model successfully loaded!\n")
                 return True
@@ -22,9 +22,18 @@ class Settings:
     AGENT                  = '' # '' for Task 1, '_runway' for runway experiment
     RECORD_VIDEO           = True
     VIDEO_RECORD_FREQUENCY = 20 # Multiples of "CHECK_GREEDY_PERFORMANCE_EVERY_NUM_EPISODES"
+    PARALLEL_RENDERING     = False # True -> videos are rendered in the background by episode_renderer.py, on RENDER_PROCESSES cores that calibrate.py and sweep.py do not budget for; False -> agent 1 renders them itself
+    RENDER_PROCESSES       = 4 # processes drawing the frames of each video (with PARALLEL_RENDERING)
+    RENDER_QUEUE_SIZE      = 2 # videos that may wait to be rendered; any more are skipped (with PARALLEL_RENDERING)
     NOISELESS_AT_TEST_TIME = True # Whether or not to test without action noise (Keep at True unless debugging)
     LEARN_FROM_PIXELS      = False # False = learn from state (fully observed); True = learn from pixels (partially observed)
     USE_GPU_WHEN_AVAILABLE = True # As of Nov 19, 2018, it appears better to use CPU. Re-evaluate again later
+    XLA_JIT_LEARNER        = False # Compile the learner's training operations with XLA (needs a TensorFlow build with XLA). Benchmark with benchmark_learner.py
+    LEAN_ENVIRONMENTS      = True # Run each environment in a fresh interpreter (environment_worker.py) rather than a fork of main.py, so it doesn't carry Tensorflow
+    TF_INTRA_OP_THREADS    = 0 # threads each Tensorflow operation may use; 0 lets Tensorflow choose. calibrate.py recommends values for the machine
+    TF_INTER_OP_THREADS    = 0 # independent Tensorflow operations that may run at once; 0 lets Tensorflow choose
+    LEARNER_CPUS           = None # CPU cores main.py (learner & agents) is pinned to, e.g., [0, 1, 2, 3]; None -> not pinned
+    ENVIRONMENT_CPUS       = None # CPU cores the environment workers are pinned to, one each in turn; None -> not pinned (needs LEAN_ENVIRONMENTS)
     MAX_WALLTIME           = 60*60*24*4 - 30*60 # [s] max walltime before triggering an end-program
     
 
@@ -38,10 +47,13 @@ class Settings:
     NUMBER_OF_ACTORS        = 10 # ideal number of agents it seems
     NUMBER_OF_EPISODES      = 1e10 # that each agent will perform
     MAX_TRAINING_ITERATIONS = 1e10 # of neural networks
+    NUMBER_OF_LEARNERS      = 1 # processes that share each training iteration; > 1 averages their gradients (requires PRIORITY_REPLAY_BUFFER = False)
+    LEARNER_PROCESS_TIMEOUT = 300 # [s] the learner stops if a learner process doesn't respond in this time
     ACTOR_LEARNING_RATE     = 0.0001
     CRITIC_LEARNING_RATE    = 0.0001
     TARGET_NETWORK_TAU      = 0.001
     NUMBER_OF_BINS          = 51 # Also known as the number of atoms
+    CATEGORICAL_PROJECTION  = False # True -> floor/ceil scatter-add projection, linear in NUMBER_OF_BINS; False -> l2_project (builds a [batch, bins, bins] tensor). Both give the same result (see compare_projection.py)
     L2_REGULARIZATION       = False # optional for training the critic
     L2_REG_PARAMETER        = 1e-6
 
@@ -52,6 +64,17 @@ class Settings:
     LOG_TRAINING_PERFORMANCE_EVERY_NUM_ITERATIONS     = 100
     DISPLAY_TRAINING_PERFORMANCE_EVERY_NUM_ITERATIONS = 50000
     DISPLAY_ACTOR_PERFORMANCE_EVERY_NUM_EPISODES      = 2500
+    PHASE_TIMING_WINDOW                               = 1000 # most recent timings of each learner phase used for the Perf/ rolling mean and p99
+    LOG_ACTOR_TELEMETRY_EVERY_NUM_EPISODES            = 10 # agent throughput and wait times, logged under Perf/Agent_N/
+    TELEMETRY_WINDOW                                  = 50 # most recent episodes used for each agent's telemetry
+    WRITE_STATUS_FILE_EVERY_NUM_SECONDS               = 60 # status.json in the run folder, with the learner and agent telemetry
+    SUITE_EVALUATION_EVERY_NUM_ITERATIONS             = 25000 # evaluate the greedy policy on the initial condition suite
+
+    # Greedy policy evaluation on a fixed suite of initial conditions (suite_evaluator.py)
+    SUITE_EVALUATION = False # True -> the SuiteEvaluator (suite_evaluator.py) evaluates the greedy policy on a fixed suite, after the first SUITE_EVALUATION_EVERY_NUM_ITERATIONS; False -> agent 1 evaluates it every CHECK_GREEDY_PERFORMANCE_EVERY_NUM_EPISODES (manipulator environment only). Its workers use cores the training would otherwise have
+    SUITE_SIZE       = 200 # initial conditions in the suite
+    SUITE_SEED       = 0 # initial condition i is generated from seed SUITE_SEED + i, so every evaluation uses the same suite
+    SUITE_WORKERS    = 4 # environment workers that run the suite in parallel
 
     # Buffer settings
     PRIORITY_REPLAY_BUFFER = False
@@ -99,33 +122,28 @@ class Settings:
     #### Environment Settings ####
     ##############################
 
-    environment_file = __import__('environment_' + ENVIRONMENT)
-    # if ENVIRONMENT == 'gym':
-    #     env = environment_file.Environment('Temporary environment', 0, CHECK_GREEDY_PERFORMANCE_EVERY_NUM_EPISODES, VIDEO_RECORD_FREQUENCY, MODEL_SAVE_DIRECTORY) # Additional parameters needed for gym
-    # else:
-    env = environment_file.Environment()
+    # The environment's properties are read from its spec, which is cheap to import
+    # and has no side effects, instead of building a whole test environment
+    environment_spec = __import__('environment_' + ENVIRONMENT + '_spec').EnvironmentSpec
         
-    OBSERVATION_SIZE                 = env.OBSERVATION_SIZE + env.AUGMENT_STATE_WITH_ACTION_LENGTH*env.ACTION_SIZE # augmenting the state with past actions and states
-    UPPER_STATE_BOUND                = env.UPPER_STATE_BOUND
-    LOWER_STATE_BOUND                = env.LOWER_STATE_BOUND
-    ACTION_SIZE                      = env.ACTION_SIZE
-    LOWER_ACTION_BOUND               = env.LOWER_ACTION_BOUND
-    UPPER_ACTION_BOUND               = env.UPPER_ACTION_BOUND
-    NORMALIZE_STATE                  = env.NORMALIZE_STATE # Normalize state on each timestep to avoid vanishing gradients
-    IRRELEVANT_STATES                = env.IRRELEVANT_STATES
-    MIN_V                            = env.MIN_V
-    MAX_V                            = env.MAX_V
-    DISCOUNT_FACTOR                  = env.DISCOUNT_FACTOR
-    N_STEP_RETURN                    = env.N_STEP_RETURN
-    TIMESTEP                         = env.TIMESTEP
-    MAX_NUMBER_OF_TIMESTEPS          = env.MAX_NUMBER_OF_TIMESTEPS # per episode
-    TOTAL_STATE_SIZE                 = env.TOTAL_STATE_SIZE
-    AUGMENT_STATE_WITH_ACTION_LENGTH = env.AUGMENT_STATE_WITH_ACTION_LENGTH
-    VELOCITY_LIMIT                   = env.VELOCITY_LIMIT  
-    ACTIONS_IN_INERTIAL              = env.ACTIONS_IN_INERTIAL
-    
-    # Delete the test environment
-    del env
+    OBSERVATION_SIZE                 = environment_spec.OBSERVATION_SIZE + environment_spec.AUGMENT_STATE_WITH_ACTION_LENGTH*environment_spec.ACTION_SIZE # augmenting the state with past actions and states
+    UPPER_STATE_BOUND                = environment_spec.UPPER_STATE_BOUND
+    LOWER_STATE_BOUND                = environment_spec.LOWER_STATE_BOUND
+    ACTION_SIZE                      = environment_spec.ACTION_SIZE
+    LOWER_ACTION_BOUND               = environment_spec.LOWER_ACTION_BOUND
+    UPPER_ACTION_BOUND               = environment_spec.UPPER_ACTION_BOUND
+    NORMALIZE_STATE                  = environment_spec.NORMALIZE_STATE # Normalize state on each timestep to avoid vanishing gradients
+    IRRELEVANT_STATES                = environment_spec.IRRELEVANT_STATES
+    MIN_V                            = environment_spec.MIN_V
+    MAX_V                            = environment_spec.MAX_V
+    DISCOUNT_FACTOR                  = environment_spec.DISCOUNT_FACTOR
+    N_STEP_RETURN                    = environment_spec.N_STEP_RETURN
+    TIMESTEP                         = environment_spec.TIMESTEP
+    MAX_NUMBER_OF_TIMESTEPS          = environment_spec.MAX_NUMBER_OF_TIMESTEPS # per episode
+    TOTAL_STATE_SIZE                 = environment_spec.TOTAL_STATE_SIZE
+    AUGMENT_STATE_WITH_ACTION_LENGTH = environment_spec.AUGMENT_STATE_WITH_ACTION_LENGTH
+    VELOCITY_LIMIT                   = environment_spec.VELOCITY_LIMIT  
+    ACTIONS_IN_INERTIAL              = environment_spec.ACTIONS_IN_INERTIAL
 
     ACTION_RANGE     = UPPER_ACTION_BOUND - LOWER_ACTION_BOUND # range for each action
     STATE_MEAN       = (LOWER_STATE_BOUND + UPPER_STATE_BOUND)/2.
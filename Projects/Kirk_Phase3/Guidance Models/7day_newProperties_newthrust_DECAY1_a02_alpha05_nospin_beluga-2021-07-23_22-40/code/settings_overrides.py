@@ -0,0 +1,33 @@
+"""
+Edits the values in a copy of settings.py, for scripts that set up runs
+automatically (calibrate.py, sweep.py).
+
+The settings are changed in the text of settings.py itself, rather than on the
+Settings class after it's loaded, so that anything calculated from them (e.g.,
+DISCOUNT_FACTOR from N_STEP_RETURN) is still calculated correctly. Only the
+first assignment to each setting is changed and its comment is kept.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+import re
+
+def override_settings(settings_text, overrides):
+    # Returns the settings text with the new values, and a list of any settings that couldn't be found
+    missing_settings = []
+    for name, value in overrides.items():
+        settings_text, number_of_replacements = re.subn(r'^(    %s\s*= )[^#\n]*?( *#.*)?$' %name, lambda match: match.group(1) + repr(value) + (match.group(2) or ''), settings_text, count = 1, flags = re.MULTILINE)
+        if number_of_replacements == 0:
+            missing_settings.append(name)
+
+    return settings_text, missing_settings
+
+def write_settings(filename, overrides):
+    # Overrides the settings in the given settings file, in place
+    with open(filename, 'r') as settings_file:
+        settings_text, missing_settings = override_settings(settings_file.read(), overrides)
+
+    for name in missing_settings:
+        print("Couldn't find %s in %s, skipping it" %(name, filename))
+
+    with open(filename, 'w') as settings_file:
+        settings_file.write(settings_text)
@@ -0,0 +1,125 @@
+"""
+Generates and manages the large experience replay buffer in shared memory.
+
+This buffer behaves like replay_buffer.py but holds its data in fixed-size arrays
+that live in shared memory. It is used when Settings.NUMBER_OF_LEARNERS > 1 so
+that every learner process can sample its own mini-batches directly from the
+same data that the agents are writing into, without any copying between processes.
+
+The buffer must be created before the learner processes are started so that
+they inherit the shared arrays.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import multiprocessing
+import numpy as np
+
+from settings import Settings
+
+def make_shared_array(shape, ctype, dtype):
+    # Allocates a block of shared memory and views it as a numpy array
+    shared_block = multiprocessing.RawArray(ctype, int(np.prod(shape)))
+    return np.frombuffer(shared_block, dtype = dtype).reshape(shape)
+
+class SharedReplayBuffer():
+    # Generates and manages a non-prioritized replay buffer held in shared memory
+
+    def __init__(self, filename):
+
+        # Save filename
+        self.filename = filename
+
+        # Generate the buffer, one shared array per type of data
+        self.states      = make_shared_array([Settings.REPLAY_BUFFER_SIZE, Settings.OBSERVATION_SIZE], 'f', np.float32)
+        self.actions     = make_shared_array([Settings.REPLAY_BUFFER_SIZE, Settings.ACTION_SIZE],      'f', np.float32)
+        self.rewards     = make_shared_array([Settings.REPLAY_BUFFER_SIZE],                            'f', np.float32)
+        self.next_states = make_shared_array([Settings.REPLAY_BUFFER_SIZE, Settings.OBSERVATION_SIZE], 'f', np.float32)
+        self.dones       = make_shared_array([Settings.REPLAY_BUFFER_SIZE],                            'b', np.bool_)
+        self.gammas      = make_shared_array([Settings.REPLAY_BUFFER_SIZE],                            'f', np.float32)
+
+        # Where the next sample will be written, and how many samples are in the buffer.
+        # The oldest samples get overwritten once the buffer is full, just like the deque.
+        self.next_index     = multiprocessing.RawValue('l', 0)
+        self.number_filled  = multiprocessing.RawValue('l', 0)
+        self.lock           = multiprocessing.Lock() # so that two agents never write to the same row, and learners never read a half-written one
+
+        # Try to load in the filled buffer
+        if Settings.RESUME_TRAINING:
+            try:
+                print("Loading in the saved replay buffer samples...", end = "")
+                self.load()
+                print("Success!")
+            except:
+                print("\n\nCouldn't load in replay buffer! Starting an empty buffer")
+
+    # Query how many entries are in the buffer
+    def how_filled(self):
+        return self.number_filled.value
+
+    # Add new experience to the buffer
+    def add(self, experience):
+        observation, action, reward, next_observation, done, gamma = experience
+
+        with self.lock:
+            index = self.next_index.value
+            self.states[index]      = observation
+            self.actions[index]     = action
+            self.rewards[index]     = reward
+            self.next_states[index] = next_observation
+            self.dones[index]       = done
+            self.gammas[index]      = gamma
+
+            self.next_index.value    = (index + 1) % Settings.REPLAY_BUFFER_SIZE
+            self.number_filled.value = min(self.number_filled.value + 1, Settings.REPLAY_BUFFER_SIZE)
+
+    # Randomly sample data from the buffer
+    def sample(self):
+        # The rows are gathered (copied) while holding the lock, so that an agent can't
+        # be half-way through overwriting one of them while it is being read
+        with self.lock:
+            # Decide how much data to sample
+            # (maybe the buffer doesn't contain enough samples yet to fill a MINI_BATCH)
+            number_filled = self.how_filled()
+            batch_size = min(Settings.MINI_BATCH_SIZE, number_filled)
+
+            # Sample the data. Sampling with replacement is used since drawing without replacement
+            # from a million samples is slow, and repeats are very rare in a full buffer.
+            indices = np.random.randint(0, number_filled, size = batch_size)
+
+            states_batch           = self.states[indices]
+            actions_batch          = self.actions[indices]
+            rewards_batch          = self.rewards[indices]
+            next_states_batch      = self.next_states[indices]
+            dones_batch            = self.dones[indices]
+            gammas_batch           = np.reshape(self.gammas[indices], [-1, 1])
+
+        return states_batch, actions_batch, rewards_batch, next_states_batch, dones_batch, gammas_batch
+
+    def save(self):
+
+        if Settings.ENVIRONMENT != 'fixedICs':
+            print("Saving replay buffer with %i samples" %self.how_filled())
+            # Saves the filled portion of the replay buffer to file for a backup
+            with self.lock:
+                number_filled = self.how_filled()
+                np.savez(Settings.MODEL_SAVE_DIRECTORY + self.filename + '/shared_replay_buffer_dump.npz',
+                         states = self.states[:number_filled], actions = self.actions[:number_filled],
+                         rewards = self.rewards[:number_filled], next_states = self.next_states[:number_filled],
+                         dones = self.dones[:number_filled], gammas = self.gammas[:number_filled],
+                         next_index = self.next_index.value)
+        else:
+            print("Skipping saving the replay buffer since we are simulating initial conditions")
+
+    def load(self):
+        # Loads the replay buffer from file to continue training
+        with np.load(Settings.MODEL_SAVE_DIRECTORY + self.filename + '/shared_replay_buffer_dump.npz') as saved_buffer:
+            number_filled = min(len(saved_buffer['rewards']), Settings.REPLAY_BUFFER_SIZE)
+            self.states[:number_filled]      = saved_buffer['states'][:number_filled]
+            self.actions[:number_filled]     = saved_buffer['actions'][:number_filled]
+            self.rewards[:number_filled]     = saved_buffer['rewards'][:number_filled]
+            self.next_states[:number_filled] = saved_buffer['next_states'][:number_filled]
+            self.dones[:number_filled]       = saved_buffer['dones'][:number_filled]
+            self.gammas[:number_filled]      = saved_buffer['gammas'][:number_filled]
+            self.number_filled.value = number_filled
+            self.next_index.value    = int(saved_buffer['next_index']) % Settings.REPLAY_BUFFER_SIZE
@@ -0,0 +1,93 @@
+"""
+Predicts the state that the guidance will actually be acting on.
+
+By the time use_deep_guidance_arm.py has calculated guidance from a PhaseSpace
+and encoder sample, and the Pi has started using it, that sample is out of date:
+the sensor, the Pi, the network, jetsonRepeater.py and the guidance loop have all
+added some delay. The policy was trained without any delay (DYNAMICS_DELAY = 0),
+so its commands are meant for the state at the moment they are actuated.
+
+Here, each sensor stream in the received values is propagated forward by its own
+delay. That delay is a fixed part from the sensor to the Jetson (configured per
+stream, since the Pi's and Jetson's clocks aren't synchronized and it can't be
+measured here), plus the time the message spends on the Jetson until its guidance
+is sent (measured on the Jetson's own clock, so it can't drift), plus the time
+from sending the guidance to it being actuated:
+    - The chaser and the arm move as in the Environment: its controller includes
+      feedforward through the mass and coriolis matrices, so the accelerations it
+      achieves are the commanded ones. The guidance most recently sent (which is
+      what is being actuated in the meantime) is integrated, with the Environment's
+      velocity limits and joint angle limits applied along the way.
+    - The target is not actuated, so it keeps its velocity, as in Environment.step().
+
+Similar to the pi_position_queue in use_deep_guidance_spot.py, which holds past
+chaser poses to line them up with a delayed SPOTNet image.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import math
+import numpy as np
+
+MAX_PREDICTION_STEP = 0.02 # [s] the prediction is integrated in steps no longer than this
+
+# Where each sensor stream's [positions, velocities] are in the 19 values received from the Pi
+SENSOR_STREAMS = {'chaser': ([1, 2, 3], [4, 5, 6]), # PhaseSpace, red
+                  'target': ([7, 8, 9], [10, 11, 12]), # PhaseSpace, black
+                  'arm':    ([13, 14, 15], [16, 17, 18])} # joint encoders
+
+class StatePredictor:
+
+    def __init__(self, environment, stream_delays, actuation_delay = 0.):
+        self.stream_delays = stream_delays # [s] {stream: fixed delay from the sensor to the Jetson}
+        self.actuation_delay = actuation_delay # [s] from sending the guidance to it being actuated
+
+        # Enforced by the Environment's controller and dynamics
+        self.velocity_limit = environment.VELOCITY_LIMIT
+        self.angle_limit = environment.ANGLE_LIMIT
+
+        # The guidance being actuated [accel_x, accel_y, alpha, alpha_shoulder, alpha_elbow, alpha_wrist] in the inertial and joint frames
+        self.commanded_accelerations = np.zeros(6)
+
+    def command(self, accelerations):
+        # Tells the predictor which accelerations were just sent (by the guidance, or the deadline watchdog), and so will be actuated during the next prediction
+        self.commanded_accelerations = np.array(accelerations[:6], dtype = np.float64)
+
+    def predict(self, received_values, measured_latency):
+        # Returns the 19 received values with every sensor stream propagated to when the guidance will be actuated.
+        # measured_latency [s] is how long this message will have been on the Jetson when its guidance is sent.
+        predicted_values = np.array(received_values, dtype = np.float64)
+        commanded_accelerations = self.commanded_accelerations # the same command throughout, even if another thread sends a new one meanwhile
+        for stream, stream_delay in self.stream_delays.items():
+            prediction_time = stream_delay + measured_latency + self.actuation_delay
+            if prediction_time <= 0:
+                continue
+            positions, velocities = SENSOR_STREAMS[stream]
+
+            if stream == 'target':
+                # The target drifts at constant velocity
+                predicted_values[positions] += predicted_values[velocities]*prediction_time
+            else:
+                axes = slice(0, 3) if stream == 'chaser' else slice(3, 6)
+                predicted_values[positions], predicted_values[velocities] = self.propagate(predicted_values[positions], predicted_values[velocities], commanded_accelerations[axes], axes, prediction_time, limit_angles = stream == 'arm')
+        return predicted_values
+
+    def propagate(self, position, velocity, commanded_accelerations, axes, prediction_time, limit_angles):
+        # Integrates these axes' commanded accelerations for prediction_time, as the Environment's controller and dynamics would
+        number_of_steps = math.ceil(prediction_time/MAX_PREDICTION_STEP)
+        timestep = prediction_time/number_of_steps
+        velocity_limit = self.velocity_limit[axes]
+        for step in range(number_of_steps):
+            # Stopping the command of additional velocity when we are already at our maximum
+            accelerations = np.copy(commanded_accelerations)
+            accelerations[(np.abs(velocity) > velocity_limit) & (np.sign(accelerations) == np.sign(velocity))] = 0
+
+            position = position + velocity*timestep + 0.5*accelerations*timestep**2
+            velocity = velocity + accelerations*timestep
+
+            if limit_angles:
+                # Hold any joint past its limit at the limit, with no angular rate
+                joints_past_limits = np.abs(position) > self.angle_limit
+                position[joints_past_limits] = np.sign(position[joints_past_limits])*self.angle_limit
+                velocity[joints_past_limits] = 0
+        return position, velocity
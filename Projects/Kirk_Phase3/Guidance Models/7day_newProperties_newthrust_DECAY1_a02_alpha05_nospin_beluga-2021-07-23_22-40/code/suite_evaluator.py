@@ -0,0 +1,177 @@
+"""
+This Class builds the SuiteEvaluator, which measures how well the greedy policy
+performs on a fixed suite of initial conditions.
+
+Previously, the greedy policy was only evaluated by agent 1, on one random initial
+condition every CHECK_GREEDY_PERFORMANCE_EVERY_NUM_EPISODES, in between collecting
+data. One episode says little about how the policy is doing. Now, every
+SUITE_EVALUATION_EVERY_NUM_ITERATIONS training iterations, the SuiteEvaluator:
+    1) Takes a snapshot of the learner's actor parameters.
+    2) Runs that policy, without noise, from each of the SUITE_SIZE initial conditions.
+       Initial condition i is generated by the environment from seed SUITE_SEED + i,
+       so every evaluation uses exactly the same suite.
+    3) Logs, under Suite_evaluation/ in Tensorboard:
+         - the success (capture) rate
+         - the mean time to capture, of the successful episodes
+         - the mean combined angular momentum after capture
+         - the mean episode reward
+
+The episodes are run in parallel by SUITE_WORKERS environment workers
+(environment_worker.py) that all step at the same time, while the policy is run
+on all of their states at once in this Evaluator's own single-threaded session.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import time
+import numpy as np
+import tensorflow as tf
+from collections import deque
+
+from build_neural_networks import BuildActorNetwork
+from environment_worker import EnvironmentWorker
+from settings import Settings
+
+class SuiteEvaluator:
+    def __init__(self, sess, learner, writer):
+        print("Initialising suite evaluator...")
+
+        # The learner whose actor is evaluated
+        self.learner_sess = sess
+        self.learner = learner
+        self.writer = writer
+
+        # Build a copy of the actor in its own graph, always on the CPU
+        self.graph = tf.Graph()
+        with self.graph.as_default(), tf.device('/device:CPU:0'):
+            self.state_placeholder = tf.placeholder(dtype = tf.float32, shape = [None, Settings.OBSERVATION_SIZE], name = "state_placeholder")
+            self.policy = BuildActorNetwork(self.state_placeholder, scope = 'learner_actor_main')
+
+            # Operation that loads a snapshot of the learner's actor parameters
+            self.parameter_placeholders = [tf.placeholder(dtype = tf.float32, shape = parameter.shape) for parameter in self.policy.parameters]
+            self.load_parameters = [parameter.assign(placeholder) for parameter, placeholder in zip(self.policy.parameters, self.parameter_placeholders)]
+
+        # Single-threaded so evaluations stay low-priority
+        config = tf.ConfigProto()
+        config.intra_op_parallelism_threads = 1
+        config.inter_op_parallelism_threads = 1
+        self.sess = tf.Session(graph = self.graph, config = config)
+
+        # The environment workers, which are started when the evaluator runs. They're numbered after the agents' environments.
+        self.workers = [EnvironmentWorker(Settings.ENVIRONMENT, Settings.NUMBER_OF_ACTORS + n + 1) for n in range(Settings.SUITE_WORKERS)]
+        self.queues = [worker.generate_queue()[0] for worker in self.workers]
+
+        print("Suite evaluator created!")
+
+    def snapshot_learner_parameters(self):
+        # Copy the learner's current actor parameters into the evaluation policy
+        learner_parameters = self.learner_sess.run(self.learner.actor.parameters)
+        self.sess.run(self.load_parameters, feed_dict = dict(zip(self.parameter_placeholders, learner_parameters)))
+
+    def make_observation(self, total_state, past_actions):
+        # Processes the total_state exactly as the agent does
+        if Settings.AUGMENT_STATE_WITH_ACTION_LENGTH > 0:
+            total_state = np.concatenate([total_state, np.reshape(past_actions, [-1])])
+        if Settings.NORMALIZE_STATE:
+            total_state = (total_state - Settings.STATE_MEAN)/Settings.STATE_HALF_RANGE
+        return np.delete(total_state, Settings.IRRELEVANT_STATES)
+
+    def evaluate_suite(self, stop_run_flag):
+        # Runs the greedy policy from every initial condition in the suite.
+        # Returns a dictionary of results, or None if the run was stopped part-way through.
+        seeds = deque(Settings.SUITE_SEED + np.arange(Settings.SUITE_SIZE))
+
+        # What each worker is currently doing
+        observations    = [None]*Settings.SUITE_WORKERS
+        past_actions    = [None]*Settings.SUITE_WORKERS
+        episode_rewards = [0.]*Settings.SUITE_WORKERS
+        timesteps       = [0]*Settings.SUITE_WORKERS
+
+        # Results of every episode
+        rewards, successes, capture_times, angular_momenta = [], [], [], []
+
+        def start_episode(n):
+            # Reset worker n to the next initial condition in the suite, if there are any left
+            if not seeds:
+                return False
+            self.queues[n].put((True, True, int(seeds.popleft()))) # (reset, test_time, seed)
+            past_actions[n] = deque([np.zeros(Settings.ACTION_SIZE)]*Settings.AUGMENT_STATE_WITH_ACTION_LENGTH, maxlen = Settings.AUGMENT_STATE_WITH_ACTION_LENGTH)
+            observations[n] = self.make_observation(self.queues[n].get(), past_actions[n])
+            episode_rewards[n] = 0.
+            timesteps[n] = 0
+            return True
+
+        active_workers = [n for n in range(Settings.SUITE_WORKERS) if start_episode(n)]
+
+        while active_workers:
+            if stop_run_flag.is_set():
+                # Abandon this evaluation
+                return None
+
+            # Run the policy on every active worker's state at once
+            actions = self.sess.run(self.policy.action_scaled, feed_dict = {self.state_placeholder: np.asarray([observations[n] for n in active_workers])})
+
+            # Send all the actions first so that the workers step in parallel, then collect the results
+            for n, action in zip(active_workers, actions):
+                self.queues[n].put((action,))
+                if Settings.AUGMENT_STATE_WITH_ACTION_LENGTH > 0:
+                    past_actions[n].append(action)
+
+            for n in list(active_workers):
+                next_total_state, reward, done = self.queues[n].get()
+                episode_rewards[n] += reward
+                timesteps[n] += 1
+                observations[n] = self.make_observation(next_total_state, past_actions[n])
+
+                if done:
+                    # Ask the environment if we captured the target and the combined angular momentum
+                    self.queues[n].put((False,))
+                    docked, _, combined_properties, _ = self.queues[n].get()
+                    rewards.append(episode_rewards[n])
+                    successes.append(docked)
+                    if docked:
+                        capture_times.append(timesteps[n]*Settings.TIMESTEP)
+                        angular_momenta.append(combined_properties[0])
+
+                    # Move on to the next initial condition
+                    if not start_episode(n):
+                        active_workers.remove(n)
+
+        return {'Success_rate':                   np.mean(successes),
+                'Mean_time_to_capture':           np.mean(capture_times) if capture_times else np.nan,
+                'Mean_combined_angular_momentum': np.mean(np.abs(angular_momenta)) if angular_momenta else np.nan,
+                'Mean_episode_reward':            np.mean(rewards)}
+
+    def run(self, stop_run_flag):
+        # Evaluate the policy every SUITE_EVALUATION_EVERY_NUM_ITERATIONS, until the run is stopped
+        print("Starting to run suite evaluator")
+
+        for worker in self.workers:
+            worker.start()
+
+        # The first evaluation waits a full interval, so the workers don't compete with the agents while they fill the replay buffer
+        next_evaluation = getattr(self.learner, 'total_training_iterations', 0) + Settings.SUITE_EVALUATION_EVERY_NUM_ITERATIONS
+        while not stop_run_flag.is_set():
+
+            # Wait until it's time for the next evaluation
+            training_iteration = getattr(self.learner, 'total_training_iterations', 0)
+            if training_iteration < next_evaluation:
+                time.sleep(1)
+                continue
+            next_evaluation = training_iteration + Settings.SUITE_EVALUATION_EVERY_NUM_ITERATIONS
+
+            # Evaluate the most recent policy
+            self.snapshot_learner_parameters()
+            start_time = time.time()
+            results = self.evaluate_suite(stop_run_flag)
+            if results is None:
+                break
+
+            print("Suite evaluation at iteration %i (%.1f s): %.1f%% captured, %.1f s mean time to capture, %.4f mean combined angular momentum" %(training_iteration, time.time() - start_time, results['Success_rate']*100, results['Mean_time_to_capture'], results['Mean_combined_angular_momentum']))
+            self.writer.add_summary(tf.Summary(value = [tf.Summary.Value(tag = 'Suite_evaluation/' + key, simple_value = value) for key, value in results.items()]), training_iteration)
+
+        # Closing the connections ends the workers
+        for worker in self.workers:
+            worker.agent_connection.close()
+        self.sess.close()
+        print("Suite evaluator finished!")
@@ -0,0 +1,217 @@
+"""
+Runs a sweep of hyperparameter variants, several at a time, on one node.
+
+Until now, each variant (e.g., the 9day..., 7day..., and inertialAcceleration...
+runs in Guidance Models/) was set up by hand with an edited settings.py and its own
+main.py. Here, every combination of the values in SWEEP is a variant. For each one:
+    1) This code folder is copied to Tensorboard/Sweeps/<sweep>/variant_NN/code/ and
+       the variant's settings are written into the copy of settings.py
+       (settings_overrides.py), so each run keeps an exact record of its settings.
+    2) main.py is started from the copy, pinned to its share of the CPU cores.
+       RUNS_AT_ONCE runs share the node; when one finishes, the next variant takes
+       its cores. Each run uses the lean environment workers (LEAN_ENVIRONMENTS) and
+       as many Tensorflow threads as it has cores left after its environments.
+    3) Once all runs have finished (or Ctrl + C is pressed, which ends every run
+       gracefully), a comparison table is printed and saved to comparison.csv.
+
+Each run's output is saved to output.log in its variant folder, and its Tensorboard
+files to variant_NN/code/Tensorboard/Current/. Point Tensorboard at the sweep folder
+to see all of them together.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import shutil
+import datetime
+import itertools
+import subprocess
+import numpy as np
+import tensorflow as tf
+
+from settings_overrides import override_settings
+from settings import Settings
+
+SWEEP_NAME        = 'learning_rates'
+SWEEP             = {'ACTOR_LEARNING_RATE':  [0.0001, 0.00005],
+                     'CRITIC_LEARNING_RATE': [0.0001, 0.00005]} # every combination of these is run
+RUNS_AT_ONCE      = 2 # the CPU cores are split evenly between them
+RUN_WALLTIME      = 60*60*24 # [s] MAX_WALLTIME of each run
+FIXED_SETTINGS    = {'RESUME_TRAINING':   False,
+                     'ENVIRONMENT':       'manipulator',
+                     'LEAN_ENVIRONMENTS': True,
+                     'MAX_WALLTIME':      RUN_WALLTIME} # applied to every run
+TABLE_LAST_N      = 10 # the final greedy reward is averaged over this many test episodes
+CHECK_EVERY       = 10 # [s] how often to check if a run has finished
+SWEEP_DIRECTORY   = 'Tensorboard/Sweeps/'
+
+
+def make_variants():
+    # Returns a list of {setting: value} for every combination in SWEEP
+    names = list(SWEEP.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[SWEEP[name] for name in names])]
+
+
+def prepare_variant(variant_directory, overrides):
+    # Copies this code folder into the variant's folder and writes its settings.
+    # The same files that main.py saves with each run are copied.
+    code_directory = variant_directory + '/code/'
+    os.makedirs(code_directory, exist_ok = True)
+    for filetype in ('*.py', '*.txt', '*.sh', '*.whl'):
+        for each_file in glob.glob(filetype):
+            shutil.copy2(each_file, code_directory)
+
+    with open('settings.py', 'r') as settings_file:
+        settings_text, missing_settings = override_settings(settings_file.read(), overrides)
+    if missing_settings:
+        raise ValueError("These settings are not in settings.py: " + ', '.join(missing_settings))
+    with open(code_directory + 'settings.py', 'w') as settings_file:
+        settings_file.write(settings_text)
+
+    return code_directory
+
+
+def start_run(code_directory, variant_directory, cpus):
+    # Starts main.py in the variant's code folder, pinned to the given CPU cores (its environment
+    # workers inherit them). It shares this process group so Ctrl + C reaches it too.
+    with open(variant_directory + '/output.log', 'w') as log_file:
+        return subprocess.Popen([sys.executable, '-u', 'main.py'], cwd = code_directory, stdout = log_file, stderr = subprocess.STDOUT,
+                                preexec_fn = lambda: os.sched_setaffinity(0, cpus))
+
+
+def summarize_run(code_directory):
+    # Returns the results of a run from its status.json and Tensorboard file
+    results = {'training_iterations': np.nan, 'steps_per_second': np.nan, 'final_greedy_reward': np.nan, 'best_greedy_reward': np.nan, 'final_suite_success_rate': np.nan}
+    run_folders = sorted(glob.glob(code_directory + 'Tensorboard/Current/*/'))
+    if not run_folders:
+        return results
+
+    # Throughput, as last written by main.py
+    try:
+        with open(run_folders[-1] + 'status.json', 'r') as status_file:
+            status = json.load(status_file)
+        results['training_iterations'] = status['training_iteration']
+        results['steps_per_second']    = status['total_steps_per_second']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Greedy (test) episode rewards, and the success rates on the initial condition suite (suite_evaluator.py)
+    greedy_rewards = []
+    suite_success_rates = []
+    for tensorboard_filename in sorted(glob.glob(run_folders[-1] + '*' + Settings.TENSORBOARD_FILE_EXTENSION)):
+        try:
+            for tensorboard_entry in tf.train.summary_iterator(tensorboard_filename):
+                for tensorboard_value in tensorboard_entry.summary.value:
+                    if tensorboard_value.tag == 'Test_agent/Episode_reward':
+                        greedy_rewards.append((tensorboard_entry.step, tensorboard_value.simple_value))
+                    elif tensorboard_value.tag == 'Suite_evaluation/Success_rate':
+                        suite_success_rates.append((tensorboard_entry.step, tensorboard_value.simple_value))
+        except tf.errors.DataLossError:
+            # The run was stopped part-way through writing its last entry
+            pass
+    if greedy_rewards:
+        greedy_rewards = [reward for _, reward in sorted(greedy_rewards)]
+        results['final_greedy_reward'] = np.mean(greedy_rewards[-TABLE_LAST_N:])
+        results['best_greedy_reward']  = np.max(greedy_rewards)
+    if suite_success_rates:
+        results['final_suite_success_rate'] = sorted(suite_success_rates)[-1][1]
+
+    return results
+
+
+#%%
+################################
+##### Setting up the sweep #####
+################################
+sweep_directory = SWEEP_DIRECTORY + SWEEP_NAME + '-{:%Y-%m-%d_%H-%M}'.format(datetime.datetime.now())
+variants = make_variants()
+
+# Split the CPU cores evenly between the runs that share the node
+cpus = sorted(os.sched_getaffinity(0))
+cpus_per_run = len(cpus) // RUNS_AT_ONCE
+if cpus_per_run < 2:
+    print("Only %i CPU cores are available, which is too few for %i runs at once. Reduce RUNS_AT_ONCE." %(len(cpus), RUNS_AT_ONCE))
+    raise SystemExit
+cpu_slots = [cpus[slot*cpus_per_run:(slot + 1)*cpus_per_run] for slot in range(RUNS_AT_ONCE)]
+
+# Prepare every variant's code folder
+variant_directories = []
+code_directories    = []
+for n, variant in enumerate(variants):
+    variant_directory = sweep_directory + '/variant_%02i' %(n + 1)
+
+    # Unless the sweep says otherwise, give each run as many actors as its share of the cores allows
+    # (leaving at least one core for its learner) and the remaining cores to Tensorflow
+    number_of_actors = variant.get('NUMBER_OF_ACTORS', max(1, min(Settings.NUMBER_OF_ACTORS, cpus_per_run - 1)))
+    overrides = {'RUN_NAME':            Settings.RUN_NAME + '_' + SWEEP_NAME + '_%02i' %(n + 1),
+                 'NUMBER_OF_ACTORS':    number_of_actors,
+                 'TF_INTRA_OP_THREADS': max(1, cpus_per_run - number_of_actors),
+                 'LEARNER_CPUS':        None,
+                 'ENVIRONMENT_CPUS':    None}
+    overrides.update(FIXED_SETTINGS)
+    overrides.update(variant)
+
+    variant_directories.append(variant_directory)
+    code_directories.append(prepare_variant(variant_directory, overrides))
+
+with open(sweep_directory + '/sweep.json', 'w') as sweep_file:
+    json.dump({'variants': {'variant_%02i' %(n + 1): variant for n, variant in enumerate(variants)}, 'cpus_per_run': cpus_per_run, 'fixed_settings': FIXED_SETTINGS}, sweep_file, indent = 4)
+
+print("Sweep %s: %i variants, %i at a time with %i CPU cores each" %(sweep_directory, len(variants), RUNS_AT_ONCE, cpus_per_run))
+
+
+#%%
+#############################
+##### Running the sweep #####
+#############################
+waiting_variants = list(range(len(variants)))
+running = {} # slot -> (variant number, process)
+start_time = time.time()
+
+try:
+    while waiting_variants or running:
+        # Start variants in any free slots
+        for slot in range(RUNS_AT_ONCE):
+            if slot not in running and waiting_variants:
+                n = waiting_variants.pop(0)
+                running[slot] = (n, start_run(code_directories[n], variant_directories[n], cpu_slots[slot]))
+                print("Started variant_%02i on cores %s: %s" %(n + 1, cpu_slots[slot], variants[n]))
+
+        time.sleep(CHECK_EVERY)
+
+        # Free the slots of any runs that finished
+        for slot, (n, process) in list(running.items()):
+            if process.poll() is not None:
+                print("variant_%02i finished after %.2f hours (exit code %i)" %(n + 1, (time.time() - start_time)/3600, process.returncode))
+                del running[slot]
+
+except KeyboardInterrupt:
+    # The runs received the Ctrl + C too. Wait for them to save and end.
+    print("\nInterrupted by user! Waiting for the running variants to end...")
+    for n, process in running.values():
+        process.wait()
+
+
+#%%
+#########################################
+##### Building the comparison table #####
+#########################################
+table = []
+for n, variant in enumerate(variants):
+    results = summarize_run(code_directories[n])
+    table.append(dict([('variant', 'variant_%02i' %(n + 1))] + list(variant.items()) + list(results.items())))
+
+columns = list(table[0].keys())
+print("\n" + " | ".join("%20s" %column for column in columns))
+for row in table:
+    print(" | ".join("%20s" %(("%.4g" %row[column]) if isinstance(row[column], float) else row[column]) for column in columns))
+
+with open(sweep_directory + '/comparison.csv', 'w', newline = '') as comparison_file:
+    comparison_writer = csv.DictWriter(comparison_file, fieldnames = columns)
+    comparison_writer.writeheader()
+    comparison_writer.writerows(table)
+print("Comparison saved to %s/comparison.csv" %sweep_directory)
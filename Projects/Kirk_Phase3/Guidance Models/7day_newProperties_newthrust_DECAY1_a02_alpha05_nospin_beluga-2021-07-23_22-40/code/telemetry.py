@@ -0,0 +1,94 @@
+"""
+Measures how fast the agents and their environments are running, and where
+their time goes, so that NUMBER_OF_ACTORS can be chosen from data.
+
+Each Agent owns an ActorTelemetry. During an episode it adds up how long it spent
+    - running its policy (inference)
+    - waiting on env_to_agent.get() for the environment to step
+    - waiting on replay_buffer_dump_flag.wait() for the replay buffer
+and at the end of the episode it records these along with the episode's wall time,
+number of timesteps, and how long its environment process spent stepping versus
+sitting idle waiting for an action. Statistics are calculated over the most
+recent Settings.TELEMETRY_WINDOW episodes.
+
+The statistics are logged to Tensorboard under Perf/Agent_N/ and, together with
+the learner's phase timings, written periodically to status.json in the run folder.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import os
+import json
+import time
+import numpy as np
+import tensorflow as tf
+
+from settings import Settings
+
+class ActorTelemetry:
+
+    # What is recorded each episode
+    EPISODE_QUANTITIES = ['steps', 'wall_time', 'inference_time', 'environment_wait_time', 'replay_buffer_wait_time', 'environment_step_time', 'environment_idle_time']
+
+    def __init__(self, n_agent):
+        self.name = 'Agent_' + str(n_agent)
+        self.window = Settings.TELEMETRY_WINDOW
+        self.episodes = {quantity: np.zeros(self.window) for quantity in self.EPISODE_QUANTITIES} # ring buffers
+        self.number_of_episodes = 0
+        self.start_episode()
+
+    def start_episode(self):
+        # Reset the per-episode totals
+        self.episode_start_time      = time.perf_counter()
+        self.inference_time          = 0.
+        self.environment_wait_time   = 0.
+        self.replay_buffer_wait_time = 0.
+
+    def record_episode(self, steps, environment_timing):
+        # Store this episode's totals. environment_timing is (step_time, idle_time) from the environment process
+        index = self.number_of_episodes % self.window
+        self.episodes['steps'][index]                   = steps
+        self.episodes['wall_time'][index]               = time.perf_counter() - self.episode_start_time
+        self.episodes['inference_time'][index]          = self.inference_time
+        self.episodes['environment_wait_time'][index]   = self.environment_wait_time
+        self.episodes['replay_buffer_wait_time'][index] = self.replay_buffer_wait_time
+        self.episodes['environment_step_time'][index]   = environment_timing[0]
+        self.episodes['environment_idle_time'][index]   = environment_timing[1]
+        self.number_of_episodes += 1
+
+    def statistics(self):
+        # Returns a dictionary of statistics over the recent episodes
+        if self.number_of_episodes == 0:
+            return {}
+        recent = {quantity: values[:min(self.number_of_episodes, self.window)] for quantity, values in self.episodes.items()}
+        total_wall_time = np.sum(recent['wall_time'])
+        total_environment_time = np.sum(recent['environment_step_time']) + np.sum(recent['environment_idle_time'])
+
+        return {'Steps_per_second':              np.sum(recent['steps'])/total_wall_time,
+                'Episode_wall_time_s':           np.mean(recent['wall_time']),
+                'Inference_fraction':            np.sum(recent['inference_time'])/total_wall_time,
+                'Environment_wait_fraction':     np.sum(recent['environment_wait_time'])/total_wall_time,
+                'Replay_buffer_wait_fraction':   np.sum(recent['replay_buffer_wait_time'])/total_wall_time,
+                'Environment_busy_fraction':     np.sum(recent['environment_step_time'])/max(total_environment_time, 1e-9),
+                'Episodes':                      self.number_of_episodes}
+
+    def summary(self, namespace = 'Perf'):
+        # Builds a Tensorboard summary of the statistics, without needing the graph
+        return tf.Summary(value = [tf.Summary.Value(tag = namespace + '/' + self.name + '/' + key, simple_value = value) for key, value in self.statistics().items()])
+
+
+def write_status_file(filename, learner, agents, replay_buffer):
+    # Writes the current telemetry of the learner and all agents to status.json in the run folder.
+    # The file is written to a temporary file first and then renamed, so a reader never sees half a file.
+    agent_statistics = {agent.telemetry.name: agent.telemetry.statistics() for agent in agents}
+    status = {'time':                      time.strftime('%Y-%m-%d %H:%M:%S'),
+              'training_iteration':        getattr(learner, 'total_training_iterations', 0),
+              'replay_buffer_samples':     replay_buffer.how_filled(),
+              'total_steps_per_second':    sum(statistics.get('Steps_per_second', 0.) for statistics in agent_statistics.values()),
+              'learner_phases_ms':         {phase: {'mean': mean*1000, 'p99': p99*1000} for phase, (mean, p99) in learner.phase_timer.statistics().items()},
+              'agents':                    agent_statistics}
+
+    status_filename = Settings.MODEL_SAVE_DIRECTORY + filename + '/status.json'
+    with open(status_filename + '.tmp', 'w') as status_file:
+        json.dump(status, status_file, indent = 4, default = float) # default converts numpy numbers
+    os.replace(status_filename + '.tmp', status_filename)
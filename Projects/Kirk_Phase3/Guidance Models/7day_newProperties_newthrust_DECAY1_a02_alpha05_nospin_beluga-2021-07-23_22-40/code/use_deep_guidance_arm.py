@@ -9,12 +9,24 @@ Script created: June 12, 2019
 @author: Kirk (khovell@gmail.com)
 """
 
-import tensorflow as tf
 import numpy as np
 import socket
 import time
 import threading
-from collections import deque
+import sys
+import os
+
+from latest_value_mailbox import LatestValueMailbox
+from latency_tracer import LatencyTracer
+from experiment_logger import ExperimentLogger
+import guidance_kinematics
+from state_predictor import StatePredictor
+from deadline_watchdog import DeadlineWatchdog
+from guidance_frames import encode_frame, decode_frame, FrameError, INPUT_MESSAGE, OUTPUT_MESSAGE, INPUT_VALUES
+
+# stream_framer.py is shared with jetsonRepeater.py, in Projects/Kirk_Phase3/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../'))
+from stream_framer import StreamFramer, SPOTNET_START
 
 # import code # for debugging
 #code.interact(local=dict(globals(), **locals())) # Ctrl+D or Ctrl+Z to continue execution
@@ -24,7 +36,6 @@ try:
 except:
     print("You must load the 'manipulator' environment in settings\n\nQuitting.")
     raise SystemExit
-from build_neural_networks import BuildActorNetwork
 
 assert Settings.ENVIRONMENT == 'manipulator'
 
@@ -43,6 +54,26 @@ CHECK_VELOCITY_LIMITS_IN_PYTHON = True
 HARD_CODE_TARGET_SPIN = False
 TARGET_SPIN_VALUE = -7*np.pi/180 # [rad/s]
 SUCCESSFUL_DOCKING_RADIUS = 0.04 # [m] [default: 0.04] overwrite the successful docking radius defined in the environment
+USE_BINARY_FRAMES = False # exchange binary frames (guidance_frames.py) with the Pi instead of text. The Pi must be built with BINARY_FRAMES 1 in TCP_Server_arm.cpp
+MAILBOX_TIMEOUT = 0.5 # [s] how often the waiting DeepGuidanceModelRunner checks if it should stop
+USE_FROZEN_POLICY = False # load the frozen policy written by export_policy.py instead of the full training checkpoint (much faster to start). Export it from a checkpoint that includes its .data file first
+USE_FAST_KINEMATICS = True # calculate the policy input and docking check directly (guidance_kinematics.py) instead of through the environment and its shapely collision checks
+PREDICT_STATE = False # propagate the received state to when the guidance will be actuated (state_predictor.py) before building the policy input. The docking check always uses the received state. Only turn on once the delays below are measured on the hardware
+STATE_PREDICTION_DELAYS = {'chaser': 0., 'target': 0., 'arm': 0.} # [s] the delay from each sensor sampling to its message arriving on the Jetson, which can't be measured here (the Pi's and Jetson's clocks aren't synchronized). The time on the Jetson is measured for each message.
+ACTUATION_DELAY = 0. # [s] from sending the guidance to the Pi actuating it
+USE_DEADLINE_WATCHDOG = False # send a safe command if the guidance for a message isn't sent within GUIDANCE_DEADLINE of it arriving (deadline_watchdog.py). Only turn on once REPEATER_TRANSIT_TIME is measured on the TX2
+PI_RECEIVE_WINDOW = 0.005 # [s] how long the Pi waits for a command after sending each message (tv in TCP_Server_arm.cpp). Anything later is only read on its next cycle
+REPEATER_TRANSIT_TIME = 0.001 # [s] allowance for a message to get from the Pi to here, and a command back, through jetsonRepeater.py. Not yet measured: run jetsonRepeater.py with MEASURE_ROUND_TRIP and set this to its 99th percentile minus this script's 'total' latency, plus the network to and from the Pi
+GUIDANCE_DEADLINE = PI_RECEIVE_WINDOW - REPEATER_TRANSIT_TIME # [s] so a safe command still reaches the Pi while it is waiting. Check the 'total' latency percentiles are well under it before an experiment
+SAFE_COMMAND = 'decay' # sent when the deadline is missed. 'decay': the last command times SAFE_COMMAND_DECAY, 'zero': zero accelerations
+SAFE_COMMAND_DECAY = 0.5 # [-] applied again for each message in a row that misses the deadline
+
+# Tensorflow is only needed to load the full training checkpoint
+if USE_FROZEN_POLICY:
+    from frozen_policy import FrozenPolicy, FROZEN_POLICY_FILENAME
+else:
+    import tensorflow as tf
+    from build_neural_networks import BuildActorNetwork
 
 
 
@@ -71,13 +102,14 @@ def make_C_bI(angle):
 
 class MessageParser:
     
-    def __init__(self, testing, client_socket, messages_to_deep_guidance, stop_run_flag):
+    def __init__(self, testing, client_socket, messages_to_deep_guidance, stop_run_flag, deadline_watchdog):
         
         print("Initializing Message Parser!")
         self.client_socket = client_socket
         self.messages_to_deep_guidance = messages_to_deep_guidance
         self.stop_run_flag = stop_run_flag
         self.testing = testing
+        self.deadline_watchdog = deadline_watchdog
 
         
         # Items from the Pi
@@ -101,6 +133,12 @@ class MessageParser:
         self.shoulder_omega = 0
         self.elbow_omega = 0
         self.wrist_omega = 0
+        
+        # Identifies each message, so the guidance sent back can be matched to it
+        self.sequence_number = 0
+        
+        # Reassembles the messages from the Pi, which may be split across, or run together in, reads from the socket
+        self.framer = StreamFramer(INPUT_VALUES, timestamped = True)
         print("Done initializing parser!")
         
         
@@ -113,6 +151,7 @@ class MessageParser:
             
             if self.testing:
                 # Assign test values
+                received_time = time.perf_counter()
                 
                 # Items from the Pi
                 self.Pi_time = 15
@@ -135,6 +174,7 @@ class MessageParser:
                 self.shoulder_omega = 0
                 self.elbow_omega = 0
                 self.wrist_omega = 0
+                self.sequence_number += 1
             else:
                 # It's real
                 try:
@@ -142,16 +182,37 @@ class MessageParser:
                 except socket.timeout:
                     print("Socket timeout")
                     continue
-                data_packet = np.array(data.decode("utf-8").splitlines())
-                #print('Got message: ' + str(data.decode("utf-8")))
-
+                received_time = time.perf_counter() # for latency tracing
+                
+                # Only the newest complete message from the Pi is used. SPOTNet messages are also rebroadcast to us, and are ignored.
+                messages = [message for message in self.framer.feed(data) if not message.startswith(SPOTNET_START)]
+                if not messages:
+                    # The rest of the message hasn't arrived yet
+                    continue
+                message = messages[-1]
+                
                 # We received a packet from the Pi
                 # input_data_array is: [time, red_x, red_y, red_angle, red_vx, red_vy, red_dangle, black_x, black_y, black_angle, black_vx, black_vy, black_dangle, shoulder_angle, elbow_angle, wrist_angle, shoulder_omega, elbow_omega, wrist_omega]  
-                try:
-                    self.Pi_time, self.Pi_red_x, self.Pi_red_y, self.Pi_red_theta, self.Pi_red_Vx, self.Pi_red_Vy, self.Pi_red_omega, self.Pi_black_x, self.Pi_black_y, self.Pi_black_theta, self.Pi_black_Vx, self.Pi_black_Vy, self.Pi_black_omega, self.shoulder_theta, self.elbow_theta, self.wrist_theta, self.shoulder_omega, self.elbow_omega, self.wrist_omega = data_packet.astype(np.float32)
-                except:
-                    print("Failed data read from jetsonRepeater.py, continuing...")
-                    continue
+                if USE_BINARY_FRAMES:
+                    try:
+                        message_type, sequence_number, _, input_data_array = decode_frame(message)
+                    except FrameError as error:
+                        print("Failed data read from jetsonRepeater.py (%s), continuing..." %error)
+                        continue
+                    if message_type != INPUT_MESSAGE or len(input_data_array) != INPUT_VALUES:
+                        print("Unexpected frame from jetsonRepeater.py, continuing...")
+                        continue
+                    self.sequence_number = sequence_number
+                    self.Pi_time, self.Pi_red_x, self.Pi_red_y, self.Pi_red_theta, self.Pi_red_Vx, self.Pi_red_Vy, self.Pi_red_omega, self.Pi_black_x, self.Pi_black_y, self.Pi_black_theta, self.Pi_black_Vx, self.Pi_black_Vy, self.Pi_black_omega, self.shoulder_theta, self.elbow_theta, self.wrist_theta, self.shoulder_omega, self.elbow_omega, self.wrist_omega = input_data_array
+                else:
+                    data_packet = np.array(message.decode("utf-8").splitlines())
+                    #print('Got message: ' + str(data.decode("utf-8")))
+                    try:
+                        self.Pi_time, self.Pi_red_x, self.Pi_red_y, self.Pi_red_theta, self.Pi_red_Vx, self.Pi_red_Vy, self.Pi_red_omega, self.Pi_black_x, self.Pi_black_y, self.Pi_black_theta, self.Pi_black_Vx, self.Pi_black_Vy, self.Pi_black_omega, self.shoulder_theta, self.elbow_theta, self.wrist_theta, self.shoulder_omega, self.elbow_omega, self.wrist_omega = data_packet.astype(np.float32)
+                    except:
+                        print("Failed data read from jetsonRepeater.py, continuing...")
+                        continue
+                    self.sequence_number += 1
                 
                 if HARD_CODE_TARGET_SPIN:
                     self.Pi_black_omega = TARGET_SPIN_VALUE
@@ -163,10 +224,14 @@ class MessageParser:
                 self.Pi_black_y = self.Pi_black_y - offsets_target_inertial[1]
                 self.Pi_black_theta = self.Pi_black_theta - offset_angle                                
                 
-            # Write the data to the queue for DeepGuidanceModelRunner to use!
-            """ This queue is thread-safe. If I append multiple times without popping, the data in the queue is overwritten. Perfect! """
-            #(self.Pi_time, self.Pi_red_x, self.Pi_red_y, self.Pi_red_theta, self.Pi_red_Vx, self.Pi_red_Vy, self.Pi_red_omega, self.Pi_black_x, self.Pi_black_y, self.Pi_black_theta, self.Pi_black_Vx, self.Pi_black_Vy, self.Pi_black_omega, self.shoulder_theta, self.elbow_theta, self.wrist_theta, self.shoulder_omega, self.elbow_omega, self.wrist_omega)
-            self.messages_to_deep_guidance.append((self.Pi_time, self.Pi_red_x, self.Pi_red_y, self.Pi_red_theta, self.Pi_red_Vx, self.Pi_red_Vy, self.Pi_red_omega, self.Pi_black_x, self.Pi_black_y, self.Pi_black_theta, self.Pi_black_Vx, self.Pi_black_Vy, self.Pi_black_omega, self.shoulder_theta, self.elbow_theta, self.wrist_theta, self.shoulder_omega, self.elbow_omega, self.wrist_omega))
+            # Write the data to the mailbox for DeepGuidanceModelRunner to use!
+            """ The mailbox is thread-safe and only holds the newest data. Putting wakes up the DeepGuidanceModelRunner. """
+            #(self.Pi_time, self.Pi_red_x, self.Pi_red_y, self.Pi_red_theta, self.Pi_red_Vx, self.Pi_red_Vy, self.Pi_red_omega, self.Pi_black_x, self.Pi_black_y, self.Pi_black_theta, self.Pi_black_Vx, self.Pi_black_Vy, self.Pi_black_omega, self.shoulder_theta, self.elbow_theta, self.wrist_theta, self.shoulder_omega, self.elbow_omega, self.wrist_omega, self.sequence_number, (received_time, parsed_time))
+            self.messages_to_deep_guidance.put((self.Pi_time, self.Pi_red_x, self.Pi_red_y, self.Pi_red_theta, self.Pi_red_Vx, self.Pi_red_Vy, self.Pi_red_omega, self.Pi_black_x, self.Pi_black_y, self.Pi_black_theta, self.Pi_black_Vx, self.Pi_black_Vy, self.Pi_black_omega, self.shoulder_theta, self.elbow_theta, self.wrist_theta, self.shoulder_omega, self.elbow_omega, self.wrist_omega, self.sequence_number, (received_time, time.perf_counter())))
+            
+            # The Pi needs a command for this message within the deadline
+            if self.deadline_watchdog is not None:
+                self.deadline_watchdog.message_received(received_time, self.sequence_number, self.Pi_time)
         
         print("Message handler gently stopped")
  
@@ -183,6 +248,18 @@ class DeepGuidanceModelRunner:
         
         # Initializing a variable to check if we've docked
         self.have_we_docked = 0.
+        
+        # Times each stage of handling a message
+        self.latency_tracer = LatencyTracer()
+        
+        # The guidance and the deadline watchdog both send commands. One at a time, so they can't be interleaved on the socket.
+        self.send_lock = threading.Lock()
+        self.answered_sequence_number = 0 # the newest message a command has been sent for. Commands for it, or older messages, are out of date and aren't sent.
+        self.late_commands_dropped = 0 # guidance that was ready after the watchdog had already sent a safe command for its message
+        if USE_DEADLINE_WATCHDOG:
+            self.deadline_watchdog = DeadlineWatchdog(GUIDANCE_DEADLINE, self.send_guidance, stop_run_flag, SAFE_COMMAND, SAFE_COMMAND_DECAY)
+        else:
+            self.deadline_watchdog = None
                 
         # Holding the previous position so we know when SPOTNet gives a new update
         self.previousSPOTNet_relative_x = 0.0
@@ -194,49 +271,102 @@ class DeepGuidanceModelRunner:
         # Overwrite the successful docking radius
         self.environment.SUCCESSFUL_DOCKING_RADIUS = SUCCESSFUL_DOCKING_RADIUS
         
+        # The arm and docking port dimensions, for the fast kinematics
+        self.arm_geometry = guidance_kinematics.arm_geometry(self.environment)
         
-        # Uncomment this on TF2.0
-        #tf.compat.v1.disable_eager_execution()
+        # Predicts the state when the guidance will be actuated
+        self.state_predictor = StatePredictor(self.environment, STATE_PREDICTION_DELAYS, ACTUATION_DELAY)
+        self.compute_time = 0. # [s] from picking up the previous message to sending its guidance, the best guess for this one's
         
-        # Clear any old graph
-        tf.reset_default_graph()
+        if USE_FROZEN_POLICY:
+            # Load the frozen policy, which holds the actor and its normalization constants
+            try:
+                self.policy = FrozenPolicy('../' + FROZEN_POLICY_FILENAME)
+            except OSError:
+                print("Frozen policy: ../" + FROZEN_POLICY_FILENAME + " not found... :( Run export_policy.py first.")
+                raise SystemExit
+            print("\nFrozen policy successfully loaded (from %s)!\n" %self.policy.checkpoint)
+            
+            # The frozen policy normalizes with the constants it was exported with
+            self.normalization_constants = (self.policy.state_mean, self.policy.state_half_range, self.policy.irrelevant_states, self.policy.normalize_state)
+        else:
+            # Uncomment this on TF2.0
+            #tf.compat.v1.disable_eager_execution()
+        
+            # Clear any old graph
+            tf.reset_default_graph()
         
-        # Initialize Tensorflow, and load in policy
-        self.sess = tf.Session()
-        # Building the policy network
-        self.state_placeholder = tf.placeholder(dtype = tf.float32, shape = [None, Settings.OBSERVATION_SIZE], name = "state_placeholder")
-        self.actor = BuildActorNetwork(self.state_placeholder, scope='learner_actor_main')
+            # Initialize Tensorflow, and load in policy
+            self.sess = tf.Session()
+            # Building the policy network
+            self.state_placeholder = tf.placeholder(dtype = tf.float32, shape = [None, Settings.OBSERVATION_SIZE], name = "state_placeholder")
+            self.actor = BuildActorNetwork(self.state_placeholder, scope='learner_actor_main')
     
-        # Loading in trained network weights
-        print("Attempting to load in previously-trained model\n")
-        saver = tf.train.Saver() # initialize the tensorflow Saver()
+            # Loading in trained network weights
+            print("Attempting to load in previously-trained model\n")
+            saver = tf.train.Saver() # initialize the tensorflow Saver()
     
-        # Try to load in policy network parameters
-        try:
-            ckpt = tf.train.get_checkpoint_state('../')
-            saver.restore(self.sess, ckpt.model_checkpoint_path)
-            print("\nModel successfully loaded!\n")
+            # Try to load in policy network parameters
+            try:
+                ckpt = tf.train.get_checkpoint_state('../')
+                saver.restore(self.sess, ckpt.model_checkpoint_path)
+                print("\nModel successfully loaded!\n")
     
-        except (ValueError, AttributeError):
-            print("Model: ", ckpt.model_checkpoint_path, " not found... :(")
-            raise SystemExit
+            except (ValueError, AttributeError):
+                print("Model: ", ckpt.model_checkpoint_path, " not found... :(")
+                raise SystemExit
+            
+            self.normalization_constants = (Settings.STATE_MEAN, Settings.STATE_HALF_RANGE, Settings.IRRELEVANT_STATES, Settings.NORMALIZE_STATE)
         
         print("Done initializing model!")
 
+    def send_guidance(self, command, sequence_number, Pi_time):
+        # Sends [accel_x, accel_y, alpha, alpha_shoulder, alpha_elbow, alpha_wrist, have_we_docked] to the Raspberry Pi 3, for the message with this sequence_number and Pi_time.
+        # Returns whether it was sent: a message only ever gets one command, so a late one (after the watchdog's safe command) is dropped instead of
+        # reaching the Pi with, or after, the safe command.
+        with self.send_lock:
+            if sequence_number <= self.answered_sequence_number:
+                return False
+            self.answered_sequence_number = sequence_number
+            
+            # This command is what will be actuated until the next is sent
+            self.state_predictor.command(command)
+            
+            if self.testing:
+                print(command)
+            elif USE_BINARY_FRAMES:
+                # The frame repeats the sequence number and time of the message this guidance was calculated from
+                self.client_socket.send(encode_frame(OUTPUT_MESSAGE, sequence_number, Pi_time, command))
+            else:
+                self.client_socket.send("".join(str(value) + "\n" for value in command).encode())
+            return True
+
+    def update_environment(self, received_values):
+        # Puts the 19 values received from the Pi into the environment, and updates its end-effector, docking port, and relative pose
+        self.environment.chaser_position   = np.array(received_values[1:4])
+        self.environment.chaser_velocity   = np.array(received_values[4:7])
+        self.environment.target_position   = np.array(received_values[7:10])
+        self.environment.target_velocity   = np.array(received_values[10:13])
+        self.environment.arm_angles        = np.array(received_values[13:16])
+        self.environment.arm_angular_rates = np.array(received_values[16:19])
+        self.environment.update_end_effector_and_docking_locations()
+        self.environment.update_end_effector_location_body_frame()
+        self.environment.update_relative_pose_body_frame()
+
     def run(self):
         
         print("Running Deep Guidance!")
         
         counter = 1
-        # Parameters for normalizing the input
-        relevant_state_mean = np.delete(Settings.STATE_MEAN, Settings.IRRELEVANT_STATES)
-        relevant_half_range = np.delete(Settings.STATE_HALF_RANGE, Settings.IRRELEVANT_STATES)
         
-        # To log data
-        data_log = []
+        # To log data. The log is started when the experiment starts.
+        experiment_logger = None
         
         # Run zeros through the policy to ensure all libraries are properly loaded in
-        deep_guidance = self.sess.run(self.actor.action_scaled, feed_dict={self.state_placeholder:np.zeros([1, Settings.OBSERVATION_SIZE])})[0]            
+        if USE_FROZEN_POLICY:
+            deep_guidance = self.policy.action(np.zeros(self.policy.observation_size))
+        else:
+            deep_guidance = self.sess.run(self.actor.action_scaled, feed_dict={self.state_placeholder:np.zeros([1, Settings.OBSERVATION_SIZE])})[0]            
         
         # Run until we want to stop
         while not stop_run_flag.is_set():            
@@ -244,65 +374,83 @@ class DeepGuidanceModelRunner:
             # Total state is [relative_x, relative_y, relative_vx, relative_vy, relative_angle, relative_angular_velocity, chaser_x, chaser_y, chaser_theta, target_x, target_y, target_theta, chaser_vx, chaser_vy, chaser_omega, target_vx, target_vy, target_omega] *# Relative pose expressed in the chaser's body frame; everything else in Inertial frame #*
             # Network input: [relative_x, relative_y, relative_angle, chaser_theta, chaser_vx, chaser_vy, chaser_omega, target_omega] ** Normalize it first **
             
-            # Get data from Message Parser
-            try:
-                Pi_time, Pi_red_x, Pi_red_y, Pi_red_theta, \
-                Pi_red_Vx, Pi_red_Vy, Pi_red_omega,        \
-                Pi_black_x, Pi_black_y, Pi_black_theta,    \
-                Pi_black_Vx, Pi_black_Vy, Pi_black_omega,  \
-                shoulder_theta, elbow_theta, wrist_theta, \
-                shoulder_omega, elbow_omega, wrist_omega = self.messages_to_deep_guidance.pop()
-            except IndexError:
-                # Queue was empty, try agian
+            # Get data from Message Parser, sleeping until new data arrives
+            message = self.messages_to_deep_guidance.get(timeout = MAILBOX_TIMEOUT)
+            if message is None:
+                # No new data yet, check if we should stop and wait again
                 continue
+            
+            Pi_time, Pi_red_x, Pi_red_y, Pi_red_theta, \
+            Pi_red_Vx, Pi_red_Vy, Pi_red_omega,        \
+            Pi_black_x, Pi_black_y, Pi_black_theta,    \
+            Pi_black_Vx, Pi_black_Vy, Pi_black_omega,  \
+            shoulder_theta, elbow_theta, wrist_theta, \
+            shoulder_omega, elbow_omega, wrist_omega, \
+            sequence_number, (received_time, parsed_time) = message
+            picked_up_time = time.perf_counter()
+            
+            # The 19 values received from the Pi
+            received_values = message[:INPUT_VALUES]
+            
+            # The state the policy sees: predicted to when the guidance calculated from it will be actuated.
+            # Only the Jetson's clock is used: the time the message has been here, plus the time the guidance takes to calculate and send.
+            if PREDICT_STATE:
+                policy_values = self.state_predictor.predict(received_values, picked_up_time - received_time + self.compute_time)
+            else:
+                policy_values = received_values
                        
-            #############################
-            ### Check if we've docked ###
-            #############################
-            # Check the reward function based off this state
-            self.environment.chaser_position   = np.array([Pi_red_x, Pi_red_y, Pi_red_theta])
-            self.environment.chaser_velocity   = np.array([Pi_red_Vx, Pi_red_Vy, Pi_red_omega])
-            self.environment.target_position   = np.array([Pi_black_x, Pi_black_y, Pi_black_theta])
-            self.environment.target_velocity   = np.array([Pi_black_Vx, Pi_black_Vy, Pi_black_omega])
-            self.environment.arm_angles        = np.array([shoulder_theta, elbow_theta, wrist_theta])
-            self.environment.arm_angular_rates = np.array([shoulder_omega, elbow_omega, wrist_omega])
+            if USE_FAST_KINEMATICS:
+                #############################
+                ### Check if we've docked ###
+                #############################
+                # Relative position between the docking port and the end-effector in the Target's body frame
+                docking_error_target_body = guidance_kinematics.docking_error(received_values, self.arm_geometry)
+                self.have_we_docked = np.max([self.have_we_docked, float(np.hypot(*docking_error_target_body) < SUCCESSFUL_DOCKING_RADIUS)])
+                print("Distance from cone to end-effector in target body frame: ", docking_error_target_body, " Environment thinks we've docked: ", self.have_we_docked)
+                
+                #################################
+                ### Building the Policy Input ###
+                #################################
+                normalized_policy_input = guidance_kinematics.make_observation(policy_values, self.arm_geometry, *self.normalization_constants)
+            else:
+                #############################
+                ### Check if we've docked ###
+                #############################
+                # Check the reward function based off this state
+                self.update_environment(received_values)
             
-            # Get environment to check for collisions
-            self.environment.update_end_effector_and_docking_locations()
-            self.environment.update_end_effector_location_body_frame()
-            self.environment.update_relative_pose_body_frame()
-            self.environment.check_collisions()
+                # Get environment to check for collisions
+                self.environment.check_collisions()
             
-            # Ask the environment whether docking occurred
-            self.have_we_docked = np.max([self.have_we_docked, float(self.environment.docked)])
+                # Ask the environment whether docking occurred
+                self.have_we_docked = np.max([self.have_we_docked, float(self.environment.docked)])
             
-            # Extracting end-effector position and docking port position in the Inertial frame
-            end_effector_position = self.environment.end_effector_position
-            docking_port_position = self.environment.docking_port_position
+                # Extracting end-effector position and docking port position in the Inertial frame
+                end_effector_position = self.environment.end_effector_position
+                docking_port_position = self.environment.docking_port_position
             
-            # Calculating relative position between the docking port and the end-effector in the Target's body frame
-            docking_error_inertial = end_effector_position - docking_port_position
-            docking_error_target_body = np.matmul(make_C_bI(Pi_black_theta), docking_error_inertial)
-            print("Distance from cone to end-effector in target body frame: ", docking_error_target_body, " Environment thinks we've docked: ", self.have_we_docked)
+                # Calculating relative position between the docking port and the end-effector in the Target's body frame
+                docking_error_inertial = end_effector_position - docking_port_position
+                docking_error_target_body = np.matmul(make_C_bI(Pi_black_theta), docking_error_inertial)
+                print("Distance from cone to end-effector in target body frame: ", docking_error_target_body, " Environment thinks we've docked: ", self.have_we_docked)
             
             
-            #################################
-            ### Building the Policy Input ###
-            ################################# 
-            total_state = self.environment.make_total_state()
-            policy_input = np.delete(total_state, Settings.IRRELEVANT_STATES)
+                #################################
+                ### Building the Policy Input ###
+                ################################# 
+                if PREDICT_STATE:
+                    self.update_environment(policy_values)
+                total_state = self.environment.make_total_state()
+                normalized_policy_input = guidance_kinematics.normalize_total_state(total_state, *self.normalization_constants)
+            kinematics_time = time.perf_counter()
             
-            # Normalizing            
-            if Settings.NORMALIZE_STATE:
-                normalized_policy_input = (policy_input - relevant_state_mean)/relevant_half_range
+            if USE_FROZEN_POLICY:
+                # Run processed state through the policy
+                deep_guidance = self.policy.action(normalized_policy_input) # [accel_x, accel_y, alpha]
             else:
-                normalized_policy_input = policy_input
-                
-            # Reshaping the input
-            normalized_policy_input = normalized_policy_input.reshape([-1, Settings.OBSERVATION_SIZE])
-    
-            # Run processed state through the policy
-            deep_guidance = self.sess.run(self.actor.action_scaled, feed_dict={self.state_placeholder:normalized_policy_input})[0] # [accel_x, accel_y, alpha]
+                # Run processed state through the policy
+                deep_guidance = self.sess.run(self.actor.action_scaled, feed_dict={self.state_placeholder:normalized_policy_input.reshape([-1, Settings.OBSERVATION_SIZE])})[0] # [accel_x, accel_y, alpha]
+            inference_time = time.perf_counter()
             
             # Rotating the command into the inertial frame
             if not Settings.ACTIONS_IN_INERTIAL:
@@ -325,14 +473,21 @@ class DeepGuidanceModelRunner:
             if CHECK_VELOCITY_LIMITS_IN_PYTHON:                    
                 current_velocity = np.array([Pi_red_Vx, Pi_red_Vy, Pi_red_omega])               
                 deep_guidance[:len(current_velocity)][(np.abs(current_velocity) > Settings.VELOCITY_LIMIT[:len(current_velocity)]) & (np.sign(deep_guidance[:len(current_velocity)]) == np.sign(current_velocity))] = 0
-                        
-            # Return commanded action to the Raspberry Pi 3
-            if self.testing:
-                print(deep_guidance)                
             
+            # Return commanded action to the Raspberry Pi 3
+            command = [deep_guidance[0], deep_guidance[1], deep_guidance[2], deep_guidance[3], deep_guidance[4], deep_guidance[5], self.have_we_docked]
+            if self.send_guidance(command, sequence_number, Pi_time):
+                if self.deadline_watchdog is not None:
+                    self.deadline_watchdog.command_sent(command, sequence_number)
             else:
-                deep_guidance_acceleration_signal_to_pi = str(deep_guidance[0]) + "\n" + str(deep_guidance[1]) + "\n" + str(deep_guidance[2]) + "\n" + str(deep_guidance[3]) + "\n" + str(deep_guidance[4]) + "\n" + str(deep_guidance[5]) + "\n" + str(self.have_we_docked) + "\n" 
-                self.client_socket.send(deep_guidance_acceleration_signal_to_pi.encode())
+                self.late_commands_dropped += 1
+            sent_time = time.perf_counter()
+            
+            # Record how long each stage took
+            self.latency_tracer.record_message((received_time, parsed_time, picked_up_time, kinematics_time, inference_time, sent_time))
+            if Pi_time > 0 and not self.testing:
+                self.latency_tracer.record_arrival(received_time, Pi_time)
+            self.compute_time = sent_time - picked_up_time
             
             if counter % 2000 == 0:
                 print("Output to Pi: ", deep_guidance, " In table inertial frame or joint frame")
@@ -342,7 +497,10 @@ class DeepGuidanceModelRunner:
             
             # Log this timestep's data only if the experiment has actually started
             if Pi_time > 0:                
-                data_log.append([Pi_time, deep_guidance[0], deep_guidance[1], deep_guidance[2], \
+                if experiment_logger is None:
+                    log_time = time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())
+                    experiment_logger = ExperimentLogger('deep_guidance_data_' + log_time + '.txt')
+                experiment_logger.log([Pi_time, deep_guidance[0], deep_guidance[1], deep_guidance[2], \
                                  deep_guidance[3], deep_guidance[4], deep_guidance[5], \
                                  Pi_red_x, Pi_red_y, Pi_red_theta, \
                                  Pi_red_Vx, Pi_red_Vy, Pi_red_omega,        \
@@ -351,18 +509,27 @@ class DeepGuidanceModelRunner:
                                  shoulder_theta, elbow_theta, wrist_theta, \
                                  shoulder_omega, elbow_omega, wrist_omega, self.have_we_docked])
         
-        print("Model gently stopped.")
+        print("Model gently stopped. %i messages from the Message Parser were replaced by newer ones before they could be used." %self.messages_to_deep_guidance.number_overwritten)
+        print("Latency of each stage [ms]:")
+        self.latency_tracer.print_summary()
+        deadline_statistics = None
+        if self.deadline_watchdog is not None:
+            deadline_statistics = {'deadline_watchdog': dict(self.deadline_watchdog.statistics(), late_commands_dropped = self.late_commands_dropped)}
+            print("%i messages missed the %.1f ms deadline and were sent a safe command, %i late commands were dropped" %(self.deadline_watchdog.number_of_misses, GUIDANCE_DEADLINE*1000, self.late_commands_dropped))
         
-        if len(data_log) > 0: 
+        if experiment_logger is not None: 
             print("Saving data to file...",end='')               
-            with open('deep_guidance_data_' + time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime()) + '.txt', 'wb') as f:
-                    np.save(f, np.asarray(data_log))
+            number_of_rows = experiment_logger.close()
+            print("%i timesteps saved..." %number_of_rows, end='')
+            # The latency percentiles are saved alongside, with the same time
+            self.latency_tracer.save('deep_guidance_latency_' + log_time + '.json', deadline_statistics)
         else:
             print("Not saving a log because there is no data to write")
                 
         print("Done!")
         # Close tensorflow session
-        self.sess.close()
+        if not USE_FROZEN_POLICY:
+            self.sess.close()
 
 
 ##################################################
@@ -385,20 +552,22 @@ else:
     # WE ARE CONNECTED 
 
 # Generate Queues
-messages_to_deep_guidance = deque(maxlen = 1)
+messages_to_deep_guidance = LatestValueMailbox()
 
 #####################
 ### START THREADS ###
 #####################
 all_threads = []
 stop_run_flag = threading.Event() # Flag to stop all threads 
-# Initialize Message Parser
-message_parser = MessageParser(testing, client_socket, messages_to_deep_guidance, stop_run_flag)
-# Initialize Deep Guidance Model
+# Initialize Deep Guidance Model (and its deadline watchdog)
 deep_guidance_model = DeepGuidanceModelRunner(testing, client_socket, messages_to_deep_guidance, stop_run_flag)
+# Initialize Message Parser
+message_parser = MessageParser(testing, client_socket, messages_to_deep_guidance, stop_run_flag, deep_guidance_model.deadline_watchdog)
        
 all_threads.append(threading.Thread(target = message_parser.run))
 all_threads.append(threading.Thread(target = deep_guidance_model.run))
+if USE_DEADLINE_WATCHDOG:
+    all_threads.append(threading.Thread(target = deep_guidance_model.deadline_watchdog.run))
 
 #############################################
 ##### STARTING EXECUTION OF ALL THREADS #####
@@ -1,19 +1,72 @@
 import socket
-import queue
+import select
 import os
 import time
 import threading
 from threading import Thread
 import numpy as np
 
+from stream_framer import StreamFramer, SPOTNET_START, write_capture_record
+
 timeout = 0.01
+PI_MESSAGE_LINES = 19 # lines in each text message from the Pi
+GUIDANCE_MESSAGE_LINES = 7 # lines in each text message from the guidance
+CAPTURE_PI_MESSAGES = False # save every message from the Pi, and when it arrived, to jetsonRepeater_<date>.capture, to be replayed with replay_guidance.py
+MEASURE_ROUND_TRIP = False # print percentiles of the time from each Pi message arriving here to the first guidance command sent back, to check GUIDANCE_DEADLINE in use_deep_guidance_arm.py
+ROUND_TRIP_REPORT_EVERY = 100 # commands per round trip report
 
 #global
 clients = []
+piSocket = None # the connection to the Pi, so guidance commands can be sent to it as soon as they arrive
+piMessageTime = None # when the newest Pi message arrived, until a command is sent back for it (MEASURE_ROUND_TRIP)
+roundTripTimes = []
+
+
+def sendToClients(data):
+    # Sends data to every local client straight away. Must be called with the clients lock held
+    global clients
+    removeList = []
+    for client in clients:
+        try:
+            client.sendall(data)
+            print("sending data to client")
+        except Exception as e:
+            print("type error: " + str(e))
+            if str(e) == "[Errno 32] Broken pipe":
+                print("Removing Broken Pipe")
+                removeList.append(client)
+    if not len(removeList) == 0:
+        clients = [x for x in clients if x not in removeList]
+        print("Clients:" + str(len(clients)))
+
+def sendToPi(data, piLock):
+    # Sends a guidance command to the Pi as soon as it arrives. The Pi only waits
+    # 5 ms for it after each message (tv in TCP_Server_arm.cpp), so it can't wait
+    # for the Pi client's next pass, which is blocked in recv() for up to timeout.
+    global piMessageTime, roundTripTimes
+    with piLock:
+        if piSocket is None:
+            print("Not connected to the Pi, dropping message")
+            return
+        try:
+            piSocket.sendall(data)
+        except Exception as e:
+            # The Pi client notices the lost connection when it next receives
+            print("Failed to send to the Pi: " + str(e))
+            return
+        print('External client sent message: ' + str(data))
+
+        if MEASURE_ROUND_TRIP and piMessageTime is not None:
+            roundTripTimes.append(time.perf_counter() - piMessageTime)
+            piMessageTime = None
+            if len(roundTripTimes) == ROUND_TRIP_REPORT_EVERY:
+                print("Pi message -> guidance command round trip [ms]: 50th %.2f, 99th %.2f, max %.2f (does not include the network to and from the Pi)" %tuple(np.percentile(roundTripTimes, [50, 99, 100])*1000))
+                roundTripTimes = []
 
 
 #threading function for data transfer
-def externalCommunicationClient(inQueue, outQueue):
+def externalCommunicationClient(lock, piLock):
+    global piSocket, piMessageTime
     file = os.path.expanduser("~/Desktop/ip_address.txt")
     with open(file) as f:
         file_contents = f.readlines()
@@ -24,12 +77,18 @@ def externalCommunicationClient(inQueue, outQueue):
     print("Port: ", str(port))
     connected = False
     data = ""
+    if CAPTURE_PI_MESSAGES:
+        capture_file = open("jetsonRepeater_" + time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime()) + ".capture", "wb", buffering = 0)
     while True:
         if not connected:
             try:
                 client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 client_socket.connect((host, port))
                 client_socket.settimeout(timeout)
+                # Messages on a new connection start afresh
+                framer = StreamFramer(PI_MESSAGE_LINES, timestamped = True)
+                with piLock:
+                    piSocket = client_socket
                 connected = True
                 print("Connected to Server! Waiting commands")
             except:
@@ -37,29 +96,37 @@ def externalCommunicationClient(inQueue, outQueue):
 #                time.sleep(1)
                 continue
         else:
-            # send any messages out to connections
-            if not outQueue.empty():
-                print("sending message")
-                out_data = outQueue.get()
-                client_socket.sendall(out_data.encode())
-                print('External client sent message: ' + str(out_data))
-
+            # Guidance commands are sent to the Pi by sendToPi(), as soon as they arrive
             try:
                 #check if any connections have messages incoming
                 data = client_socket.recv(4096) # Kirk set to 4096 Feb 27
             except socket.timeout:
                 continue
             except:
-                print("Lost communications")
-                connected = False
-                continue
+                data = b''
             if len(data) == 0:
                 print("Lost communications")
+                with piLock:
+                    piSocket = None
+                client_socket.close()
                 connected = False
             else:
                 print('External Client Got message: ' + str(data))
                 print("Connected: " + str(connected))
-                inQueue.put(data.decode())
+                # Only forward complete messages, and only the newest if several arrived together.
+                # Forwarded as bytes, so binary guidance frames pass through unchanged.
+                messages = framer.feed(data)
+                if CAPTURE_PI_MESSAGES:
+                    arrival_time = time.time()
+                    for message in messages:
+                        write_capture_record(capture_file, arrival_time, message)
+                if messages:
+                    if MEASURE_ROUND_TRIP:
+                        with piLock:
+                            piMessageTime = time.perf_counter()
+                    lock.acquire()
+                    sendToClients(messages[-1])
+                    lock.release()
 
 #local machine communications
 def localServerSocketManager(lock):
@@ -83,73 +150,77 @@ def localServerSocketManager(lock):
             continue
         lock.acquire()
         print('New client connected')
+        socket_client.settimeout(timeout)
         clients.append(socket_client)
         print('Waiting for new client')
         lock.release()
 
-def localRepeaterServerCommunicationsManager(inQueue, outQueue, lock):
+def localRepeaterServerCommunicationsManager(lock, piLock):
     on = True
     global clients
+    framers = {} # one StreamFramer for the messages from each client
     while on:
-        removeList = []
-        #Check if there are any incoming messages to be broadcasted
-        if not inQueue.empty():
-            #print("here")
-            lock.acquire()
-            data = inQueue.get()
-        #    lock.release()
-            print("Clients:" + str(len(clients)))
-            for client in clients:
-                try:
-                    client.sendall(bytes(str.encode(data)))
-                    print("sending data to client")
-                except Exception as e:
-                    print("type error: " + str(e))
-                    if str(e) == "[Errno 32] Broken pipe":
-                        print("Removing Broken Pipe")
-                        removeList.append(client)
-            lock.release()
-        #Check if there are any outcoming messages to be sent to external connections
+        # Wait for any client to have a message, without holding the lock so the
+        # Pi's messages can still be sent to the clients in the meantime
         lock.acquire()
+        listeningClients = list(clients)
+        lock.release()
+        if len(listeningClients) == 0:
+            time.sleep(timeout)
+            continue
+        try:
+            readyClients, _, _ = select.select(listeningClients, [], [], timeout)
+        except (OSError, ValueError):
+            continue # a client was closed while waiting; it is removed below once its recv() fails
 
-        for client in clients:
-            client.settimeout(timeout)
+        removeList = []
+        guidanceMessage = None
+        lock.acquire()
+        for client in readyClients:
             try:
                 data = client.recv(1024) # Kirk changed from 512 to 1024 on May 5 2021
             except socket.timeout:
                 continue
             except:
                 print(" Exception Lost communications")
-                continue
+                data = b''
             if len(data) == 0:
                 print("Length data is 0")
                 removeList.append(client)
             else:
-                msgData = np.array(data.decode().splitlines())
-                if msgData[0] == "SPOTNet":
-                #print('Repeater got message: ' + str(data))
-                #outQueue.put(data.decode())
-                    print('Repeater rebroadcasting message')
-                    inQueue.put(data.decode())
-                else:
-                    print('Repeater got message: ' + str(data))
-                    outQueue.put(data.decode())
+                if client not in framers:
+                    framers[client] = StreamFramer(GUIDANCE_MESSAGE_LINES)
+                for message in framers[client].feed(data):
+                    if message.startswith(SPOTNET_START):
+                        print('Repeater rebroadcasting message')
+                        sendToClients(message)
+                    else:
+                        guidanceMessage = message
 
         if not len(removeList) == 0:
             clients = [x for x in clients if x not in removeList]
+            for client in removeList:
+                client.close()
             print("Clients:" + str(len(clients)))
-
+        # Forget the framers of any clients that have been removed
+        for client in list(framers):
+            if client not in clients:
+                framers.pop(client)
         lock.release()
 
+        # Only the newest guidance message is sent to the Pi, straight away
+        if guidanceMessage is not None:
+            print('Repeater got message: ' + str(guidanceMessage))
+            sendToPi(guidanceMessage, piLock)
+
 
 def Main():
-    inQueue = queue.Queue()
-    outQueue = queue.Queue()
-    lock = threading.Lock()
+    lock = threading.Lock() # protects clients
+    piLock = threading.Lock() # protects piSocket
 
-    commThread = Thread(target=externalCommunicationClient, args=(inQueue, outQueue))
+    commThread = Thread(target=externalCommunicationClient, args=(lock, piLock))
     localSocketManagerThread = Thread(target=localServerSocketManager, args=(lock,))
-    localRepeaterCommThread = Thread(target=localRepeaterServerCommunicationsManager, args=(inQueue, outQueue, lock))
+    localRepeaterCommThread = Thread(target=localRepeaterServerCommunicationsManager, args=(lock, piLock))
 
     commThread.start()
     localSocketManagerThread.start()
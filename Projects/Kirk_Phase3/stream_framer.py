@@ -0,0 +1,171 @@
+"""
+Splits a stream of bytes from a socket into complete guidance messages.
+
+A TCP (or Unix) socket is a stream: one recv() can return part of a message, or
+several messages run together, especially at high PhaseSpace rates. Parsing
+each recv() as exactly one message drops every cycle where that isn't the case.
+Here, received bytes are buffered and only complete messages are returned, so
+nothing is lost when messages are split or coalesced.
+
+Two kinds of messages are recognized, and may be mixed in the same stream:
+    - Binary guidance frames (guidance_frames.py in the guidance code), which
+      start with b'SPOT' and the frame version and carry their own length.
+      Their checksum is checked here.
+    - Text messages: a fixed number of newline-terminated numbers (text_lines;
+      19 from the Pi, 7 from the guidance), or a SPOTNet message, which is the
+      line "SPOTNet" followed by SPOTNET_LINES - 1 numbers.
+
+Any bytes that don't form a valid message are dropped, and the framer picks up
+again at the next message. Used by jetsonRepeater.py and use_deep_guidance_arm.py.
+
+Text messages have no start marker, so after a corrupt or partial message the
+next text_lines numbers could straddle two messages, and every message after it
+would be shifted by a line onto the wrong state fields. For the Pi's messages
+(timestamped = True), the first line is the Pi's time, which is a multiple of
+its base rate (PI_BASE_RATE), never goes backwards, and moves forward by no more
+than MAX_TIME_STEP from one message to the next. A message whose time doesn't is
+taken to be mis-aligned: its first line is dropped and the next line is tried as
+the start, until the messages line up again. If the Pi restarts or pauses, its
+time really does jump; once RESYNC_MESSAGES messages' worth of lines have been
+dropped in a row, the next message with a time on the grid is accepted and its
+time starts afresh. The guidance's 7-line messages have no such field, and are
+only checked for being numbers.
+
+The messages can also be captured to a file as they arrive (jetsonRepeater.py's
+CAPTURE_PI_MESSAGES), and read back to be replayed (replay_guidance.py in the
+guidance code). Each record is the time it arrived (float64, [s]), the length of
+the message (uint32), and the message itself, exactly as it was received.
+
+@author: Kirk Hovell (khovell@gmail.com)
+"""
+
+import math
+import zlib
+import struct
+
+# Binary frame layout, as in guidance_frames.py
+FRAME_START       = b'SPOT' + bytes([1]) # magic and version
+FRAME_HEADER_SIZE = 20
+FRAME_MAX_VALUES  = 32 # as in guidance_frame.h
+
+SPOTNET_START     = b'SPOTNet\n'
+SPOTNET_LINES     = 5 # SPOTNet, relative_x, relative_y, relative_angle, confidence
+MAX_BUFFER_SIZE   = 65536 # [bytes] older bytes are dropped if this many are waiting, so a stalled reader can't grow the buffer forever
+PI_BASE_RATE      = 1/20 # [s] baseRate in Run_Initializer.m. The Pi's time is always a multiple of it
+TIME_TOLERANCE    = 1e-4 # [s] how far from a multiple of PI_BASE_RATE a timestamped text message's time can be (it is sent with 6 decimal places)
+MAX_TIME_STEP     = 1. # [s] the most a timestamped text message's time can move forward from the last one's
+RESYNC_MESSAGES   = 3 # timestamped text messages' worth of lines dropped in a row before the time is allowed to start afresh
+CAPTURE_RECORD    = struct.Struct('<dI') # time the message arrived, length of the message
+
+class StreamFramer:
+
+    def __init__(self, text_lines, timestamped = False):
+        self.text_lines = text_lines # number of lines in each (non-SPOTNet) text message
+        self.timestamped = timestamped # whether the first line of each (non-SPOTNet) text message is the Pi's time
+        self.buffer = bytearray()
+        self.bytes_dropped = 0 # bytes that were not part of any valid message
+        self.last_time = None # [s] time of the last timestamped text message returned
+        self.lines_resynced = 0 # lines dropped in a row because the time of the message starting at them didn't follow on
+
+    def feed(self, data):
+        # Adds newly-received bytes, and returns a list of every message completed by them (oldest first)
+        self.buffer += data
+        if len(self.buffer) > MAX_BUFFER_SIZE:
+            self.drop(len(self.buffer) - MAX_BUFFER_SIZE)
+
+        messages = []
+        while self.buffer:
+            message_length = self.next_message_length()
+            if message_length == 0:
+                # The next message hasn't fully arrived yet
+                break
+            if message_length < 0:
+                # Not a valid message, skip past it
+                self.drop(-message_length)
+                continue
+            if self.timestamped and not self.buffer.startswith(FRAME_START) and not self.buffer.startswith(SPOTNET_START) and not self.time_follows():
+                # Mis-aligned text message, try again from its second line
+                self.drop(self.buffer.find(b'\n') + 1)
+                continue
+            messages.append(bytes(self.buffer[:message_length]))
+            del self.buffer[:message_length]
+        return messages
+
+    def time_follows(self):
+        # Whether the complete text message at the start of the buffer has a time that is on the Pi's time grid and follows on from the last one returned
+        message_time = float(self.buffer[:self.buffer.find(b'\n')])
+        on_time_grid = math.isfinite(message_time) and abs(message_time - round(message_time/PI_BASE_RATE)*PI_BASE_RATE) <= TIME_TOLERANCE
+        follows_on = self.last_time is None or self.last_time <= message_time <= self.last_time + MAX_TIME_STEP
+        if not on_time_grid or (not follows_on and self.lines_resynced < RESYNC_MESSAGES*self.text_lines):
+            self.lines_resynced += 1
+            return False
+        self.last_time = message_time
+        self.lines_resynced = 0
+        return True
+
+    def drop(self, number_of_bytes):
+        del self.buffer[:number_of_bytes]
+        self.bytes_dropped += number_of_bytes
+
+    def next_message_length(self):
+        # Length of the message at the start of the buffer, 0 if it's incomplete,
+        # or -(number of bytes to drop) if the buffer doesn't start with a valid message
+        if self.buffer.startswith(FRAME_START):
+            return self.binary_frame_length()
+        if FRAME_START.startswith(self.buffer):
+            # Could be the start of a binary frame
+            return 0
+
+        # Text message. If a binary frame starts part-way through it, what comes before the frame is dropped.
+        frame_index = self.buffer.find(FRAME_START)
+        lines_needed = SPOTNET_LINES if self.buffer.startswith(SPOTNET_START) else self.text_lines
+        end = 0
+        for line_number in range(lines_needed):
+            newline_index = self.buffer.find(b'\n', end)
+            if frame_index > 0 and (newline_index < 0 or frame_index < newline_index):
+                return -frame_index
+            if newline_index < 0:
+                return 0
+
+            # Every line must be a number, except the first line of a SPOTNet message
+            if not (line_number == 0 and lines_needed == SPOTNET_LINES):
+                try:
+                    float(self.buffer[end:newline_index])
+                except ValueError:
+                    return -(newline_index + 1)
+            end = newline_index + 1
+        return end
+
+    def binary_frame_length(self):
+        # Length of the binary frame at the start of the buffer, 0 if it's incomplete, or -1 if it's corrupt
+        if len(self.buffer) < FRAME_HEADER_SIZE:
+            return 0
+        number_of_values = self.buffer[6] | (self.buffer[7] << 8)
+        if number_of_values > FRAME_MAX_VALUES:
+            return -1
+        frame_size = FRAME_HEADER_SIZE + 8*number_of_values + 4
+        if len(self.buffer) < frame_size:
+            return 0
+        if int.from_bytes(self.buffer[frame_size - 4:frame_size], 'little') != zlib.crc32(self.buffer[:frame_size - 4]):
+            return -1
+        return frame_size
+
+
+def write_capture_record(capture_file, arrival_time, message):
+    # Appends one message, and the time [s] it arrived, to an open capture file
+    capture_file.write(CAPTURE_RECORD.pack(arrival_time, len(message)) + message)
+
+def read_capture(filename):
+    # Returns every (arrival_time, message) in a capture file, oldest first. A record cut off at the end of the file is ignored.
+    with open(filename, 'rb') as capture_file:
+        data = capture_file.read()
+    records = []
+    offset = 0
+    while offset + CAPTURE_RECORD.size <= len(data):
+        arrival_time, message_length = CAPTURE_RECORD.unpack_from(data, offset)
+        offset += CAPTURE_RECORD.size
+        if offset + message_length > len(data):
+            break
+        records.append((arrival_time, data[offset:offset + message_length]))
+        offset += message_length
+    return records